@@ -38,6 +38,8 @@ from services import *
 
 # =================== Import Utils ===================
 from utils.helpers import get_db, reset_message_sequence
+from services.billing import reconcile_token_ledger
+from services.uploads import purge_stale_uploads
 
 # =================== Create Flask App ===================
 app = Flask(__name__, static_folder='./src/')
@@ -94,6 +96,11 @@ except Exception as e:
     MAINSTREAM_LANGUAGES = set()
 
 # =================== Setup Metrics Scheduler ===================
+def _reconcile_token_ledger():
+    with app.app_context():
+        reconcile_token_ledger()
+
+
 try:
     scheduler = BackgroundScheduler()
     scheduler.add_job(
@@ -104,8 +111,25 @@ try:
         name='Update metrics every 30 minutes',
         replace_existing=True
     )
+    scheduler.add_job(
+        func=_reconcile_token_ledger,
+        trigger="interval",
+        seconds=BILLING_RECONCILE_INTERVAL_SECONDS,
+        id='token_ledger_reconcile_job',
+        name='Apply token ledger entries left unapplied',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=purge_stale_uploads,
+        trigger="interval",
+        minutes=15,
+        id='stale_upload_purge_job',
+        name='Delete abandoned chunked uploads',
+        replace_existing=True
+    )
     scheduler.start()
     print("[SCHEDULER] Metrics update job started (every 30 minutes)")
+    print(f"[SCHEDULER] Token ledger reconciliation started (every {BILLING_RECONCILE_INTERVAL_SECONDS}s)")
 except Exception as e:
     print(f"[SCHEDULER WARNING] Could not start scheduler: {e}")
 
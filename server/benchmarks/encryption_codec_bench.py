@@ -0,0 +1,95 @@
+"""
+Encryption Codec Micro-benchmark
+Times decrypting a synthetic chat history the way the history endpoints do
+(original_text, translated_text and every translation of every message) with
+the original per-character XOR loop and with each codec in services/encryption.py.
+
+Usage (from the server directory):
+    python -m benchmarks.encryption_codec_bench --messages 10000 --languages 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLES = (
+    "Are we still meeting at the station at seven? I can bring the tickets.",
+    "今天的会议改到下午三点，请大家提前准备好资料。",
+    "明日の打ち合わせは十時からです。資料を共有しますね。",
+    "¿Puedes enviarme la dirección del restaurante antes de las ocho?",
+    "오늘 저녁에 시간 괜찮으면 같이 밥 먹어요!",
+    "ok 👍",
+)
+
+
+def legacy_xor(text):
+    """The codec as it was: one Python-level iteration per character"""
+    if not text:
+        return None
+    return ''.join(chr(ord(c) ^ 42) for c in text)
+
+
+def build_history(messages, languages, encrypt):
+    rng = random.Random(7)
+    history = []
+    for _ in range(messages):
+        text = ' '.join(rng.choice(SAMPLES) for _ in range(rng.randint(1, 3)))
+        history.append((encrypt(text), encrypt(text), [encrypt(rng.choice(SAMPLES)) for _ in range(languages)]))
+    return history
+
+
+def decrypt_history(history, decrypt):
+    for original_text, translated_text, translations in history:
+        decrypt(original_text)
+        decrypt(translated_text)
+        for translation in translations:
+            decrypt(translation)
+
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encryption codec micro-benchmark')
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--languages', type=int, default=3, help='Translations per message')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per codec; the fastest is reported')
+    args = parser.parse_args()
+
+    sys.path.insert(0, SERVER_DIR)
+    from services.encryption import simple_encrypt, simple_decrypt
+
+    values = args.messages * (2 + args.languages)
+    cases = (
+        ('legacy per-character loop', build_history(args.messages, args.languages, legacy_xor), legacy_xor),
+        ('v0 translate table', build_history(args.messages, args.languages,
+                                             lambda text: simple_encrypt(text, version=0)), simple_decrypt),
+        ('v1 bytes + base64', build_history(args.messages, args.languages,
+                                            lambda text: simple_encrypt(text, version=1)), simple_decrypt),
+    )
+
+    # Every codec must read back exactly what the legacy codec wrote
+    legacy_history = cases[0][1]
+    for original_text, _, _ in legacy_history[:100]:
+        assert simple_decrypt(original_text) == legacy_xor(original_text)
+
+    print(f"{args.messages} messages, {values} encrypted values")
+    print(f"{'codec':28} {'total ms':>10} {'us/value':>10} {'speedup':>8}")
+    baseline = None
+    for name, history, decrypt in cases:
+        elapsed = best_of(args.repeat, decrypt_history, history, decrypt)
+        baseline = baseline or elapsed
+        print(f"{name:28} {elapsed * 1000:10.1f} {elapsed * 1e6 / values:10.2f} {baseline / elapsed:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
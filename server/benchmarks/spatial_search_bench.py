@@ -0,0 +1,93 @@
+"""
+Spatial Search Micro-benchmark
+Times radius searches over a synthetic, Tokyo-dense set of OSM nodes with the
+scalar per-node loop and the NumPy path of spatial_search, and k-nearest and
+bounding-box queries with a tag filter, for both the in-memory JSON index and
+the memory-mapped binary index.
+
+Usage (from the server directory):
+    python -m benchmarks.spatial_search_bench --nodes 500000 --radius 2.0 --limit 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENTER = (35.6895, 139.6917)
+
+
+def build_nodes(count):
+    rng = random.Random(7)
+    nodes = []
+    for index in range(count):
+        node = {'type': 'node', 'id': 10 ** 9 + index,
+                'lat': CENTER[0] + rng.gauss(0, 0.08), 'lon': CENTER[1] + rng.gauss(0, 0.08)}
+        if index % 4 == 0:
+            node['tags'] = {'amenity': rng.choice(('cafe', 'restaurant', 'bar')), 'name': f'node {index}'}
+        nodes.append(node)
+    return nodes
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started_at)
+    return min(timings), len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spatial search micro-benchmark')
+    parser.add_argument('--nodes', type=int, default=500000)
+    parser.add_argument('--radius', type=float, default=2.0, help='Search radius in kilometers')
+    parser.add_argument('--limit', type=int, default=50, help='Top-k for the limited searches')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per case; the fastest is reported')
+    args = parser.parse_args()
+
+    sys.path.insert(0, SERVER_DIR)
+    from spatial_search import SpatialIndex, BinarySpatialIndex, build_binary_index
+
+    nodes = build_nodes(args.nodes)
+    json_index = SpatialIndex()
+    json_index.build_index(nodes)
+
+    with tempfile.TemporaryDirectory() as directory:
+        dump_path = os.path.join(directory, 'osm.json')
+        index_path = os.path.join(directory, 'osm.spidx')
+        with open(dump_path, 'w', encoding='utf-8') as f:
+            json.dump({'elements': nodes}, f)
+        build_binary_index(dump_path, index_path)
+
+        started_at = time.perf_counter()
+        binary_index = BinarySpatialIndex(index_path)
+        print(f"{args.nodes} nodes; binary index opened in {(time.perf_counter() - started_at) * 1000:.2f} ms")
+
+        lat, lon = CENTER
+        radius = args.radius
+        cafes = {'amenity': 'cafe'}
+        cases = (
+            ('json scalar', lambda: json_index._search_scalar(lat, lon, radius)),
+            ('json numpy', lambda: json_index.search_nearby(lat, lon, radius)),
+            (f'json numpy limit={args.limit}', lambda: json_index.search_nearby(lat, lon, radius, limit=args.limit)),
+            ('binary scalar', lambda: binary_index._search_scalar(lat, lon, radius)),
+            ('binary numpy', lambda: binary_index.search_nearby(lat, lon, radius)),
+            (f'binary numpy limit={args.limit}', lambda: binary_index.search_nearby(lat, lon, radius, limit=args.limit)),
+            (f'json nearest {args.limit} cafes', lambda: json_index.nearest(lat, lon, args.limit, tags=cafes)),
+            (f'binary nearest {args.limit} cafes', lambda: binary_index.nearest(lat, lon, args.limit, tags=cafes)),
+            (f'binary bbox {args.limit} cafes', lambda: binary_index.within_bbox(
+                lat - 0.02, lon - 0.02, lat + 0.02, lon + 0.02, limit=args.limit, tags=cafes)),
+        )
+        print(f"{'case':28} {'results':>8} {'ms':>8}")
+        for name, function in cases:
+            elapsed, results = best_of(args.repeat, function)
+            print(f"{name:28} {results:8} {elapsed * 1000:8.2f}")
+
+
+if __name__ == '__main__':
+    main()
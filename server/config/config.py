@@ -48,7 +48,9 @@ class Config:
     
     # Disable SSL to avoid self-signed errors when connecting from Docker to host MySQL.
     # Also add charset to avoid encoding issues.
-    SQLALCHEMY_DATABASE_URI = (
+    # DATABASE_URL (any SQLAlchemy URL, e.g. sqlite:///bench.db) overrides the
+    # MySQL settings; the benchmarks use it to run against SQLite or Postgres
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or (
         f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
         "?charset=utf8mb4&ssl_disabled=true"
     )
@@ -74,6 +76,9 @@ class Config:
     def init_app(app):
         """Initialize application with configuration"""
         # Print database connection info (hide password)
+        if os.getenv('DATABASE_URL'):
+            print(f"[DATABASE CONFIG] Connecting to: {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]} (DATABASE_URL)")
+            return
         print(f"[DATABASE CONFIG] Connecting to: mysql+pymysql://{Config.DB_USER}:****@{Config.DB_HOST}:{Config.DB_PORT}/{Config.DB_NAME}?charset=utf8mb4&ssl_disabled=true")
 
 
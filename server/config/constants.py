@@ -8,6 +8,11 @@ import os
 # =================== Debug Password ===================
 DEBUG_PASSWORD = os.getenv('DEBUG_PASSWORD', '')
 
+# =================== Stored Text Encryption ===================
+# Codec used for new writes (services/encryption.py); every version stays readable.
+# Switch to 1 once all workers run a release that can read it.
+ENCRYPTION_CODEC_VERSION = int(os.getenv('ENCRYPTION_CODEC_VERSION', '0'))
+
 # =================== Token Pricing Constants ===================
 # GPT-4O pricing (per token)
 TEXT_UNIT_PRICE_PER_TOKEN_CACHED_INPUT_TOKENS_GPT_4O = 0.00000125
@@ -22,6 +27,22 @@ TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O_MINI = 0.0000006
 # Audio pricing (per minute)
 AUDIO_UNIT_PRICE_PER_MINUTE = 0.006
 
+# =================== Billing Ledger ===================
+# Charges are applied to User.tokens once per request; the reconciliation job
+# applies ledger entries that were committed but never applied
+BILLING_RECONCILE_INTERVAL_SECONDS = int(os.getenv('BILLING_RECONCILE_INTERVAL_SECONDS', '60'))
+BILLING_RECONCILE_GRACE_SECONDS = int(os.getenv('BILLING_RECONCILE_GRACE_SECONDS', '120'))
+BILLING_RECONCILE_BATCH_SIZE = int(os.getenv('BILLING_RECONCILE_BATCH_SIZE', '500'))
+
+# =================== Debug Logging ===================
+# DebugLog rows are queued and inserted in batches by a background writer
+DEBUG_LOG_WRITE_BEHIND = os.getenv('DEBUG_LOG_WRITE_BEHIND', '1') == '1'  # 0 = insert on the caller's thread
+DEBUG_LOG_QUEUE_SIZE = int(os.getenv('DEBUG_LOG_QUEUE_SIZE', '10000'))
+DEBUG_LOG_BATCH_SIZE = int(os.getenv('DEBUG_LOG_BATCH_SIZE', '200'))
+DEBUG_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('DEBUG_LOG_FLUSH_INTERVAL_SECONDS', '1.0'))
+DEBUG_LOG_DROP_POLICY = os.getenv('DEBUG_LOG_DROP_POLICY', 'drop_newest')  # drop_newest, drop_oldest or block
+DEBUG_LOG_BLOCK_TIMEOUT_SECONDS = float(os.getenv('DEBUG_LOG_BLOCK_TIMEOUT_SECONDS', '0.05'))
+
 # =================== Upload Configuration ===================
 UPLOAD_FOLDER = 'uploads'
 AVATAR_UPLOAD_FOLDER = 'uploads/avatars'
@@ -31,6 +52,27 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 THUMBNAIL_SIZE = (200, 200)
 THUMBNAIL_PREFIX = "thumb_"
 
+# Binary uploads: socket attachments and the chunked /api/uploads endpoint
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(25 * 1024 * 1024)))  # Whisper's file size limit
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', str(1024 * 1024)))  # largest chunk per PUT
+UPLOAD_INCOMING_FOLDER = 'uploads/incoming'
+UPLOAD_STALE_SECONDS = int(os.getenv('UPLOAD_STALE_SECONDS', '3600'))  # unfinished uploads are deleted after this
+# Largest Socket.IO packet; by default room for a base64 upload from older clients
+SOCKETIO_MAX_HTTP_BUFFER_SIZE = int(os.getenv('SOCKETIO_MAX_HTTP_BUFFER_SIZE', str(UPLOAD_MAX_BYTES * 4 // 3 + 64 * 1024)))
+
+# =================== Streaming Audio ===================
+# audio_chunk streams are cut into segments at pauses and transcribed incrementally
+AUDIO_STREAM_SAMPLE_RATE = int(os.getenv('AUDIO_STREAM_SAMPLE_RATE', '16000'))  # raw PCM16 chunks without sampleRate
+AUDIO_STREAM_MAX_CHUNK_BYTES = int(os.getenv('AUDIO_STREAM_MAX_CHUNK_BYTES', str(512 * 1024)))  # one chunk, ~16s of 16 kHz PCM16
+AUDIO_STREAM_FRAME_MS = int(os.getenv('AUDIO_STREAM_FRAME_MS', '30'))  # VAD frame: 10, 20 or 30 for webrtcvad
+AUDIO_STREAM_SILENCE_MS = int(os.getenv('AUDIO_STREAM_SILENCE_MS', '600'))  # pause that ends a segment
+AUDIO_STREAM_MIN_SPEECH_MS = int(os.getenv('AUDIO_STREAM_MIN_SPEECH_MS', '240'))  # shorter segments are dropped
+AUDIO_STREAM_PREROLL_MS = int(os.getenv('AUDIO_STREAM_PREROLL_MS', '300'))  # audio kept from before speech starts
+AUDIO_STREAM_MAX_SEGMENT_SECONDS = float(os.getenv('AUDIO_STREAM_MAX_SEGMENT_SECONDS', '12'))
+AUDIO_STREAM_VAD_AGGRESSIVENESS = int(os.getenv('AUDIO_STREAM_VAD_AGGRESSIVENESS', '2'))  # webrtcvad 0-3
+AUDIO_STREAM_ENERGY_THRESHOLD = float(os.getenv('AUDIO_STREAM_ENERGY_THRESHOLD', '500'))  # RMS fallback without webrtcvad
+AUDIO_STREAM_MAX_PENDING_SEGMENTS = int(os.getenv('AUDIO_STREAM_MAX_PENDING_SEGMENTS', '4'))
+
 # =================== Mainstream Languages ===================
 # Load mainstream languages from config
 try:
@@ -40,6 +82,103 @@ try:
 except:
     MAINSTREAM_LANGUAGES = set()
 
+# =================== Shared Cache (Redis) ===================
+# Optional Redis instance shared by all gunicorn workers; leave empty to keep
+# every cache in-process only
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+# =================== Socket.IO Scale-out ===================
+# Message queue shared by all workers so room emits reach clients on any worker:
+# '' (this process only), redis://host:6379/0, or unix:///tmp/yoohi-socketio.sock (one host)
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'yoohi-socketio')
+SOCKETIO_BROKER_AUTOSTART = os.getenv('SOCKETIO_BROKER_AUTOSTART', '1') == '1'  # start the unix broker (gunicorn master, else first worker)
+SOCKETIO_PUBLISH_BATCH_MS = float(os.getenv('SOCKETIO_PUBLISH_BATCH_MS', '2'))  # 0 = publish every emit at once
+SOCKETIO_PUBLISH_BATCH_MAX = int(os.getenv('SOCKETIO_PUBLISH_BATCH_MAX', '64'))
+
+# =================== Socket Job Pool ===================
+# Uploads and AI answers run on these workers instead of the Socket.IO handler
+SOCKET_JOB_WORKERS = int(os.getenv('SOCKET_JOB_WORKERS', '32'))
+SOCKET_JOB_PER_USER_CONCURRENCY = int(os.getenv('SOCKET_JOB_PER_USER_CONCURRENCY', '2'))  # running jobs per user
+SOCKET_JOB_MAX_PENDING = int(os.getenv('SOCKET_JOB_MAX_PENDING', '2000'))  # queued jobs before new ones are rejected
+SOCKET_JOB_MAX_PENDING_PER_USER = int(os.getenv('SOCKET_JOB_MAX_PENDING_PER_USER', '20'))
+
+# =================== Translation Cache ===================
+TRANSLATION_CACHE_ENABLED = os.getenv('TRANSLATION_CACHE_ENABLED', '1') == '1'
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv('TRANSLATION_CACHE_MAX_ENTRIES', '20000'))  # in-process LRU size
+TRANSLATION_CACHE_TTL_SECONDS = int(os.getenv('TRANSLATION_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+TRANSLATION_CACHE_MAX_TEXT_LENGTH = int(os.getenv('TRANSLATION_CACHE_MAX_TEXT_LENGTH', '2000'))  # skip caching long texts
+
+# =================== OpenAI HTTP Client ===================
+# Connection pool shared by every request a worker makes to the model APIs
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY_SECONDS', '30'))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv('OPENAI_CONNECT_TIMEOUT_SECONDS', '5'))
+# Read timeout of the pool, the SDK's own default; Whisper uploads of long
+# recordings need it. Translations set their deadline per call instead
+OPENAI_HTTP_TIMEOUT_SECONDS = float(os.getenv('OPENAI_HTTP_TIMEOUT_SECONDS', '600'))
+OPENAI_HTTP2_ENABLED = os.getenv('OPENAI_HTTP2_ENABLED', '1') == '1'
+
+# Translation call deadline and retry policy (exponential backoff with full jitter)
+TRANSLATION_DEADLINE_SECONDS = float(os.getenv('TRANSLATION_DEADLINE_SECONDS', '30'))
+TRANSLATION_MAX_ATTEMPTS = int(os.getenv('TRANSLATION_MAX_ATTEMPTS', '3'))
+TRANSLATION_BACKOFF_BASE_SECONDS = float(os.getenv('TRANSLATION_BACKOFF_BASE_SECONDS', '0.5'))
+TRANSLATION_BACKOFF_MAX_SECONDS = float(os.getenv('TRANSLATION_BACKOFF_MAX_SECONDS', '8'))
+
+# Translation scheduler: per-worker rate budgets and concurrent model calls
+TRANSLATION_REQUESTS_PER_MINUTE = int(os.getenv('TRANSLATION_REQUESTS_PER_MINUTE', '500'))  # OpenAI tier 1 limit
+TRANSLATION_TOKENS_PER_MINUTE = int(os.getenv('TRANSLATION_TOKENS_PER_MINUTE', '200000'))
+TRANSLATION_SCHEDULER_CONCURRENCY = int(os.getenv('TRANSLATION_SCHEDULER_CONCURRENCY', '16'))
+TRANSLATION_PROMPT_OVERHEAD_TOKENS = 450  # System prompt of the longest translation prompt
+# Model calls one history backfill may have in flight at once
+TRANSLATION_BACKFILL_MAX_IN_FLIGHT = int(os.getenv('TRANSLATION_BACKFILL_MAX_IN_FLIGHT', '8'))
+
+# Single-flight coalescing of identical translations across workers.
+# The lease must outlive the slowest call (TRANSLATION_DEADLINE_SECONDS); a
+# follower gives up waiting well before that deadline and translates itself
+SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv('SINGLE_FLIGHT_LEASE_SECONDS', '60'))
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', '10'))
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = float(os.getenv('SINGLE_FLIGHT_RESULT_TTL_SECONDS', '60'))
+
+# =================== Translation Backends ===================
+# Send every translation to one backend regardless of routing rules:
+# 'local' (in-process stand-in, no network) or 'fake' (fake_openai_server.py)
+TRANSLATION_BACKEND = os.getenv('TRANSLATION_BACKEND', '')
+OPENAI_TRANSLATION_MAX_CONCURRENCY = int(os.getenv('OPENAI_TRANSLATION_MAX_CONCURRENCY', '64'))
+
+# DeepSeek (via DeepInfra) for Chinese styled translations
+DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', 'Ljgibz0ibztFJl8RqcPZM2WwdCQdErYv')
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepinfra.com/v1/openai')
+DEEPSEEK_MODEL = 'deepseek-ai/DeepSeek-V3'
+DEEPSEEK_MAX_CONCURRENCY = int(os.getenv('DEEPSEEK_MAX_CONCURRENCY', '16'))
+
+# Deterministic stand-ins for load tests and CI
+LOCAL_BACKEND_LATENCY_MS = float(os.getenv('LOCAL_BACKEND_LATENCY_MS', '0'))  # simulated upstream latency
+FAKE_OPENAI_BASE_URL = os.getenv('FAKE_OPENAI_BASE_URL', 'http://127.0.0.1:8089/v1')
+
+# =================== Presence Cache ===================
+# Room membership and user profiles for Socket.IO events. Changes are invalidated
+# explicitly and broadcast to every worker over Redis pub/sub; the short local
+# TTL bounds staleness if a broadcast is missed
+PRESENCE_CACHE_LOCAL_TTL_SECONDS = int(os.getenv('PRESENCE_CACHE_LOCAL_TTL_SECONDS', '10'))
+PRESENCE_CACHE_SHARED_TTL_SECONDS = int(os.getenv('PRESENCE_CACHE_SHARED_TTL_SECONDS', '600'))
+PRESENCE_CACHE_MAX_ENTRIES = int(os.getenv('PRESENCE_CACHE_MAX_ENTRIES', '20000'))
+LAST_USED_ROOM_FLUSH_SECONDS = float(os.getenv('LAST_USED_ROOM_FLUSH_SECONDS', '5'))  # coalesced last_used_chatroom_id writes
+
+# =================== Chat History ===================
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))  # Messages per history page
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '200'))
+TRANSLATION_MIGRATION_BATCH_SIZE = int(os.getenv('TRANSLATION_MIGRATION_BATCH_SIZE', '500'))  # messages per commit
+
+# =================== Spatial Search ===================
+# The index file is built offline from the dump: python spatial_search.py build
+SPATIAL_OSM_DATA_PATH = os.getenv('SPATIAL_OSM_DATA_PATH', 'map_db/tokyo_osm_data_11042024.json')
+SPATIAL_INDEX_PATH = os.getenv('SPATIAL_INDEX_PATH', 'map_db/tokyo_osm_data_11042024.spidx')
+SPATIAL_GRID_SIZE = float(os.getenv('SPATIAL_GRID_SIZE', '0.01'))  # degrees, approximately 1km
+# Tag keys the index stores as filter columns (the keys download_osm_data.py fetches)
+SPATIAL_TAG_KEYS = [key.strip() for key in os.getenv('SPATIAL_TAG_KEYS', 'amenity,shop,tourism,leisure,office').split(',') if key.strip()]
+
 # =================== Google OAuth Configuration ===================
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET', '')
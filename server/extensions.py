@@ -4,13 +4,32 @@ Initializes all Flask extensions (db, jwt, socketio, etc.)
 These are created here and imported by app.py and other modules to avoid circular imports
 """
 import os
+import importlib.util
 import stripe
 import openai
+import httpx
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 import socketio
 from oauthlib.oauth2 import WebApplicationClient
-from config.constants import GOOGLE_CLIENT_ID
+from config.constants import (
+    GOOGLE_CLIENT_ID,
+    REDIS_URL,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+    OPENAI_CONNECT_TIMEOUT_SECONDS,
+    OPENAI_HTTP2_ENABLED,
+    OPENAI_HTTP_TIMEOUT_SECONDS,
+    SOCKETIO_MESSAGE_QUEUE,
+    SOCKETIO_MAX_HTTP_BUFFER_SIZE
+)
+from socketio_manager import build_client_manager
+
+try:
+    import redis
+except ImportError:
+    redis = None  # Shared cache tier is optional
 
 # =================== Database Extension ===================
 db = SQLAlchemy()
@@ -19,11 +38,18 @@ db = SQLAlchemy()
 jwt = JWTManager()
 
 # =================== Socket.IO Extension ===================
+# With SOCKETIO_MESSAGE_QUEUE set, room emits reach clients on every worker and host
+# (see socketio_manager.py); otherwise only this process's clients
 sio = socketio.Server(
     cors_allowed_origins="*",
-    max_http_buffer_size=1e8  # Example: 100MB
+    max_http_buffer_size=SOCKETIO_MAX_HTTP_BUFFER_SIZE,  # Largest packet, and so the largest upload held in memory
+    client_manager=build_client_manager(SOCKETIO_MESSAGE_QUEUE)
 )
 
+# =================== Shared Redis Client ===================
+# Shared by all gunicorn workers (translation cache, etc.); None when not configured
+redis_client = redis.Redis.from_url(REDIS_URL) if (redis and REDIS_URL) else None
+
 # =================== OAuth Client ===================
 # Initialize OAuth client for Google authentication
 client = WebApplicationClient(GOOGLE_CLIENT_ID)
@@ -68,16 +94,30 @@ STRIPE_PRODUCTS = {
 
 # Test key - use environment variable STRIPE_SECRET_KEY for testing
 
+# =================== OpenAI HTTP Connection Pool ===================
+# One bounded keep-alive pool per worker, shared by all model clients.
+# HTTP/2 multiplexes concurrent translations over a few connections when the
+# optional 'h2' package is installed.
+openai_http2 = OPENAI_HTTP2_ENABLED and importlib.util.find_spec('h2') is not None
+openai_http_limits = httpx.Limits(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS
+)
+# Translation calls bound themselves with with_options(timeout=...) (services/translation_client.py)
+openai_http_timeout = httpx.Timeout(OPENAI_HTTP_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS)
+openai_http_client = httpx.Client(http2=openai_http2, limits=openai_http_limits, timeout=openai_http_timeout)
+
 # =================== OpenAI Configuration ===================
+def build_openai_client(api_key, base_url=None):
+    """Create an OpenAI-compatible client on the shared connection pool"""
+    return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=openai_http_client)
+
+
 # OpenAI API key from environment variable
 openai_key = os.getenv('OPENAI_API_KEY', '')
-openAI_client = openai.OpenAI(api_key=openai_key) if openai_key else None
-
-# DeepSeek client (via DeepInfra)
-openAI_client_deepseek = openai.OpenAI(
-    api_key="Ljgibz0ibztFJl8RqcPZM2WwdCQdErYv",
-    base_url="https://api.deepinfra.com/v1/openai",
-)
+openAI_client = build_openai_client(openai_key) if openai_key else None
+# Translation providers (OpenAI, DeepSeek, local stand-ins) live in services/translation_backends.py
 
 # =================== Upload Configuration ===================
 UPLOAD_FOLDER = 'uploads'
@@ -0,0 +1,82 @@
+"""
+Fake OpenAI-compatible server
+Serves POST /v1/chat/completions (plain and streaming) with the deterministic
+local stand-in translation, so the app can run end-to-end without network access.
+
+Usage:
+    python fake_openai_server.py --port 8089
+    TRANSLATION_BACKEND=fake FAKE_OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python app.py
+"""
+import argparse
+import json
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+from services.translation_backends import local_completion_payload, local_stream_chunks
+
+app = Flask(__name__)
+
+
+def _usage(payload):
+    return {
+        'prompt_tokens': payload['prompt_tokens'],
+        'completion_tokens': payload['completion_tokens'],
+        'total_tokens': payload['total_tokens'],
+    }
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    body = request.get_json()
+    latency_ms = app.config.get('LATENCY_MS', 0)
+    if latency_ms:
+        time.sleep(latency_ms / 1000.0)
+
+    payload = local_completion_payload(body['model'], body['messages'])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get('stream'):
+        return jsonify({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': payload['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': payload['content']},
+                'finish_reason': 'stop',
+            }],
+            'usage': _usage(payload),
+        })
+
+    include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+
+    def events():
+        for chunk in local_stream_chunks(payload, include_usage):
+            yield 'data: ' + json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': payload['model'],
+                'choices': [
+                    {'index': 0, 'delta': {'content': choice.delta.content}, 'finish_reason': None}
+                    for choice in chunk.choices
+                ],
+                'usage': _usage(payload) if chunk.usage else None,
+            }, ensure_ascii=False) + '\n\n'
+        yield 'data: [DONE]\n\n'
+
+    return Response(events(), mimetype='text/event-stream')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake OpenAI-compatible translation server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated upstream latency per request')
+    args = parser.parse_args()
+    app.config['LATENCY_MS'] = args.latency_ms
+    app.run(host=args.host, port=args.port, threaded=True)
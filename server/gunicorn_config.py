@@ -1,12 +1,23 @@
 import multiprocessing
 import os
+import socket
+import subprocess
+import sys
+import time
 
 # Bind address
 bind = "0.0.0.0:5002"
 
 # Worker configuration
+# Socket.IO state lives in the worker a client connected to. With more than one worker:
+#  - set SOCKETIO_MESSAGE_QUEUE (redis://... across hosts, unix:///... on one host) so
+#    room emits reach clients on every worker;
+#  - Engine.IO long-polling needs every request of a session on the same worker. Either
+#    have clients connect with transports=['websocket'], or run one worker per port
+#    behind a sticky load balancer (nginx: upstream { ip_hash; ... }) - gunicorn itself
+#    does not route by session.
 worker_class = "eventlet"
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
 threads = 1000  # Number of threads per worker
 
 # For handling 10,000 users with WebSocket connections
@@ -44,6 +55,42 @@ umask = 0
 user = None
 group = None
 
+_socketio_broker = None
+
+
+def _wait_for_unix_socket(path, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return True
+        except OSError:
+            time.sleep(0.05)
+        finally:
+            probe.close()
+    return False
+
+
+def on_starting(server):
+    # A unix:// message queue needs a broker that outlives the workers, which
+    # max_requests recycles: run it as a child of the master, not inside a worker
+    global _socketio_broker
+    queue = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    if not queue.startswith('unix://') or os.getenv('SOCKETIO_BROKER_AUTOSTART', '1') != '1':
+        return
+    path = queue[len('unix://'):]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'socketio_manager.py')
+    _socketio_broker = subprocess.Popen([sys.executable, script, 'broker', path])
+    if _wait_for_unix_socket(path):
+        server.log.info("Socket.IO broker on %s (pid: %s)", path, _socketio_broker.pid)
+    else:
+        server.log.warning("Socket.IO broker on %s did not start; the first worker will host one", path)
+
+def on_exit(server):
+    if _socketio_broker is not None:
+        _socketio_broker.terminate()
+
 def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
@@ -55,6 +102,9 @@ def pre_exec(server):
 
 def when_ready(server):
     server.log.info("Server is ready. Spawning workers")
+    if workers > 1 and not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        server.log.warning("%s workers without SOCKETIO_MESSAGE_QUEUE: room emits only reach "
+                           "clients of the emitting worker", workers)
 
 def worker_int(worker):
     worker.log.info("worker received INT or QUIT signal")
@@ -0,0 +1,180 @@
+"""
+Socket Job Pool
+Runs slow Socket.IO work (transcription, translation, AI answers) off the
+event handlers on a bounded set of worker threads, with per-user
+concurrency caps and queue metrics
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque, Counter
+from dataclasses import dataclass, field
+from typing import Callable
+
+from config.constants import (
+    SOCKET_JOB_WORKERS,
+    SOCKET_JOB_PER_USER_CONCURRENCY,
+    SOCKET_JOB_MAX_PENDING,
+    SOCKET_JOB_MAX_PENDING_PER_USER
+)
+
+
+class JobRejected(Exception):
+    """The pool or the user's backlog is full"""
+
+
+@dataclass
+class SocketJob:
+    id: str
+    kind: str
+    user_id: str
+    func: Callable
+    args: tuple
+    kwargs: dict
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+
+class SocketJobPool:
+    """
+    Handlers submit a job and ack at once; worker threads (green threads
+    under eventlet) run the jobs and emit the results. Users take turns, and
+    no user has more than per_user_concurrency jobs running, so one user's
+    burst of uploads cannot occupy every worker.
+    """
+
+    def __init__(self, max_workers=32, per_user_concurrency=2, max_pending=2000, max_pending_per_user=20):
+        self.max_workers = max_workers
+        self.per_user_concurrency = max(1, per_user_concurrency)
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        # user -> deque of waiting jobs; user order is the round-robin turn
+        self._pending = OrderedDict()
+        self._running = Counter()  # user -> running jobs
+        self._running_kinds = Counter()
+        self._queued = 0
+        self._condition = threading.Condition()
+        self._workers = []
+        self._pid = None
+        self._ids = itertools.count(1)
+        self._completed = Counter()
+        self._failed = Counter()
+        self._rejected = Counter()
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    def submit(self, kind, user_id, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) on behalf of user_id
+
+        Returns:
+            str: Job id
+
+        Raises:
+            JobRejected: The pool or the user's backlog is full
+        """
+        user_id = str(user_id)
+        with self._condition:
+            self._ensure_workers()
+            if self._queued >= self.max_pending:
+                self._rejected['pool_full'] += 1
+                raise JobRejected("Server is busy, please try again shortly")
+            user_jobs = self._pending.get(user_id)
+            if user_jobs is not None and len(user_jobs) >= self.max_pending_per_user:
+                self._rejected['user_backlog_full'] += 1
+                raise JobRejected("Too many requests in progress, please wait for them to finish")
+            job = SocketJob(f"{os.getpid()}-{next(self._ids)}", kind, user_id, func, args, kwargs)
+            self._pending.setdefault(user_id, deque()).append(job)
+            self._queued += 1
+            self._condition.notify()
+        return job.id
+
+    def _ensure_workers(self):
+        # Workers are started lazily and restarted after a fork (gunicorn preload_app)
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._workers = []
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f'socket-job-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _pop_runnable(self):
+        """Next job of the first user in turn who is under the concurrency cap, or None"""
+        for user_id, jobs in self._pending.items():
+            if self._running[user_id] < self.per_user_concurrency:
+                job = jobs.popleft()
+                if jobs:
+                    self._pending.move_to_end(user_id)  # Next turn goes to another user
+                else:
+                    del self._pending[user_id]
+                return job
+        return None
+
+    def _take(self):
+        with self._condition:
+            while True:
+                job = self._pop_runnable()
+                if job is not None:
+                    self._queued -= 1
+                    self._running[job.user_id] += 1
+                    self._running_kinds[job.kind] += 1
+                    self._wait_times.append(time.monotonic() - job.queued_at)
+                    return job
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            job = self._take()
+            started = time.monotonic()
+            failed = False
+            try:
+                job.func(*job.args, **job.kwargs)
+            except BaseException as e:
+                failed = True
+                print(f"[JOB POOL] {job.kind} job {job.id} for {job.user_id} failed: {str(e)}")
+            with self._condition:
+                self._running[job.user_id] -= 1
+                if not self._running[job.user_id]:
+                    del self._running[job.user_id]
+                self._running_kinds[job.kind] -= 1
+                (self._failed if failed else self._completed)[job.kind] += 1
+                self._run_times.append(time.monotonic() - started)
+                # The user may have jobs waiting on the cap
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            queued_kinds = Counter(job.kind for jobs in self._pending.values() for job in jobs)
+            return {
+                'workers': self.max_workers,
+                'per_user_concurrency': self.per_user_concurrency,
+                'queued': self._queued,
+                'queued_by_kind': dict(queued_kinds),
+                'users_waiting': len(self._pending),
+                'running': sum(self._running.values()),
+                'running_by_kind': {kind: count for kind, count in self._running_kinds.items() if count},
+                'completed': dict(self._completed),
+                'failed': dict(self._failed),
+                'rejected': dict(self._rejected),
+                'wait_ms_p50': _percentile(self._wait_times, 0.5),
+                'wait_ms_p95': _percentile(self._wait_times, 0.95),
+                'run_ms_p50': _percentile(self._run_times, 0.5),
+                'run_ms_p95': _percentile(self._run_times, 0.95),
+            }
+
+
+socket_job_pool = SocketJobPool(
+    max_workers=SOCKET_JOB_WORKERS,
+    per_user_concurrency=SOCKET_JOB_PER_USER_CONCURRENCY,
+    max_pending=SOCKET_JOB_MAX_PENDING,
+    max_pending_per_user=SOCKET_JOB_MAX_PENDING_PER_USER
+)
@@ -15,6 +15,8 @@ from .metrics import Metrics
 from .user import User
 from .chatroom import ChatRoom
 from .message import Message
+from .message_translation import MessageTranslation, TranslationView
+from .token_ledger import TokenLedger
 
 # Export all models
 __all__ = [
@@ -31,4 +33,7 @@ __all__ = [
     'User',
     'ChatRoom',
     'Message',
+    'MessageTranslation',
+    'TranslationView',
+    'TokenLedger',
 ]
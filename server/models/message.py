@@ -4,10 +4,16 @@ Database model definition
 """
 from datetime import datetime, timedelta
 from extensions import db, sio, openAI_client
+from contextlib import contextmanager
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy import JSON, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import attribute_keyed_dict, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import JSON, text, select, event
 from werkzeug.security import generate_password_hash, check_password_hash
 from services.encryption import simple_encrypt, simple_decrypt
+from models.message_translation import MessageTranslation, TranslationView
 from config.constants import (
     TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O,
     TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O,
@@ -18,10 +24,45 @@ import random
 import httpagentparser
 import hashlib
 import secrets
-import json
+
+
+@contextmanager
+def _translation_write_connection():
+    """
+    Short transaction of its own for a translation write, so the row is not
+    locked for the rest of the caller's request. SQLite allows one writer at
+    a time, so there a savepoint on the session's own connection is used instead.
+    """
+    if db.session.get_bind().dialect.name == 'sqlite':
+        with db.session.begin_nested():
+            yield db.session.connection()
+    else:
+        with db.engine.begin() as connection:
+            yield connection
+
+
+def _attach_translation_row(message, column_values):
+    """Load a message_translation row written outside the session into message.translation_rows"""
+    mapper = MessageTranslation.__mapper__
+    key = identity_key(MessageTranslation, column_values['id'])
+    row = db.session.identity_map.get(key)
+    if row is None:
+        row = MessageTranslation(**{attr.key: column_values[attr.columns[0].name] for attr in mapper.column_attrs})
+        # Persistent as if just queried, so the session never inserts it again
+        make_transient_to_detached(row)
+        db.session.add(row)
+    rows = [existing for language, existing in message.translation_rows.items() if language != row.language]
+    set_committed_value(message, 'translation_rows', rows + [row])
+    message._invalidate_decrypted()
+    return row
+
 
 class Message(db.Model):
     __tablename__ = 'message'
+    __table_args__ = (
+        # Keyset pagination of a chatroom's history on (timestamp, id)
+        db.Index('ix_message_chatroom_timestamp_id', 'chatroom_id', 'timestamp', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.String(80), nullable=False)
@@ -30,6 +71,8 @@ class Message(db.Model):
     _original_text = db.Column('original_text', db.Text, nullable=False, default='')
     _translated_text = db.Column('translated_text', db.Text, nullable=False, default='')
     translated_text_secondary = db.Column(db.Text, nullable=True)
+    # Legacy JSON columns; new translations and views are rows of message_translation/translation_view
+    # and services/translation_migration.py moves the old entries over
     _translations = db.Column('translations', MutableDict.as_mutable(JSON), nullable=True, default=dict) # Store translations and their token usage
     translation_tokens = db.Column(MutableDict.as_mutable(JSON), nullable=True, default=dict)  # Store token usage for each translation
     translation_viewers = db.Column(MutableDict.as_mutable(JSON), nullable=True, default=dict)  # Store who viewed the token for each translation
@@ -40,6 +83,12 @@ class Message(db.Model):
     message_type = db.Column(db.String(20), nullable=False, default='bubble')
     reply_to_message_id = db.Column(db.Integer, default=-1)  # New field
     audio_duration_minutes = db.Column(db.Float, default=0.0)
+
+    translation_rows = db.relationship('MessageTranslation',
+                                       collection_class=attribute_keyed_dict('language'),
+                                       cascade='all, delete-orphan')
+    # Appending a view does not load the message's other views
+    translation_views = db.relationship('TranslationView', lazy='dynamic', cascade='all, delete-orphan')
     
 
     def __init__(self, user_id, username, chatroom_id, original_text, translated_text, content_type, translations=None, is_recalled='0', is_edited='0', reply_to_message_id=-1, audio_duration_minutes=0.0):
@@ -49,20 +98,40 @@ class Message(db.Model):
         self.original_text = original_text
         self.translated_text = translated_text
         self.content_type = content_type
-        self.translations = translations or {}
+        self._translations = {}
         self.translation_tokens = {}  # Initialize token tracking
+        self.translations = translations or {}
         self.translation_viewers = {} 
         self.is_recalled = is_recalled
         self.is_edited = is_edited
         self.reply_to_message_id = reply_to_message_id
         self.audio_duration_minutes = audio_duration_minutes
 
+    def _decrypt_cached(self, key, stored):
+        """
+        Decrypt a stored value once per ciphertext
+
+        The plaintext is memoized on the instance next to the ciphertext it
+        came from, so a new value (a write, a refresh) is never served stale.
+        """
+        cache = self.__dict__.get('_decrypted_cache')
+        if cache is None:
+            cache = self.__dict__['_decrypted_cache'] = {}
+        hit = cache.get(key)
+        if hit is not None and hit[0] is stored:
+            return hit[1]
+        plaintext = simple_decrypt(stored) if stored else None
+        cache[key] = (stored, plaintext)
+        return plaintext
+
+    def _invalidate_decrypted(self):
+        """Forget the memoized translations view after translations change"""
+        self.__dict__.pop('_translations_view', None)
+
     @property
     def original_text(self):
         """Decrypt and return original text"""
-        if not self._original_text:
-            return None
-        return simple_decrypt(self._original_text)
+        return self._decrypt_cached('original_text', self._original_text)
 
     @original_text.setter
     def original_text(self, value):
@@ -76,9 +145,7 @@ class Message(db.Model):
     @property
     def translated_text(self):
         """Decrypt and return translated text"""
-        if not self._translated_text:
-            return None
-        return simple_decrypt(self._translated_text)
+        return self._decrypt_cached('translated_text', self._translated_text)
 
     @translated_text.setter
     def translated_text(self, value):
@@ -91,111 +158,195 @@ class Message(db.Model):
 
     @property
     def translations(self):
-        """Decrypt and return translations dictionary"""
-        if not self._translations:
-            return {}
-        try:
-            decrypted_dict = {}
-            for lang, text in self._translations.items():
-                if text:  # Only decrypt if there's content
-                    decrypted_dict[lang] = simple_decrypt(text)
-                else:
-                    decrypted_dict[lang] = None
-            return decrypted_dict
-        except Exception as e:
-            # app.logger.error(f"Decryption error (translations): {str(e)}")
-            return {}
+        """Decrypt and return translations dictionary (legacy JSON entries, then translation rows)"""
+        view = self.__dict__.get('_translations_view')
+        if view is None:
+            view = {}
+            if self._translations:
+                try:
+                    for lang, stored in self._translations.items():
+                        view[lang] = self._decrypt_cached(('legacy', lang), stored)
+                except Exception as e:
+                    # app.logger.error(f"Decryption error (translations): {str(e)}")
+                    view = {}
+            for lang, row in self.translation_rows.items():
+                view[lang] = self._decrypt_cached(('row', lang), row._text)
+            self.__dict__['_translations_view'] = view
+        # A copy, so callers can't edit the memoized view
+        return dict(view)
+
+    def translation_for(self, language):
+        """
+        Decrypt only one language's translation
+
+        Returns:
+            str: The translation, or None if there is none
+        """
+        row = self.translation_rows.get(language)
+        if row is not None:
+            return self._decrypt_cached(('row', language), row._text)
+        if self._translations and language in self._translations:
+            return self._decrypt_cached(('legacy', language), self._translations[language])
+        return None
 
     @translations.setter
     def translations(self, value):
-        """Encrypt and store translations dictionary"""
-        if not value:
+        """Encrypt and store translations dictionary, one row per language"""
+        value = value or {}
+        self._invalidate_decrypted()
+        if self._translations:
             self._translations = {}
-        else:
-            encrypted_dict = {}
-            for lang, text in value.items():
-                if text:  # Only encrypt if there's content
-                    encrypted_dict[lang] = simple_encrypt(text)
-                else:
-                    encrypted_dict[lang] = None
-            self._translations = encrypted_dict
+        for lang in [lang for lang in self.translation_rows if lang not in value]:
+            del self.translation_rows[lang]
+        for lang, translation in value.items():
+            self.add_translation(lang, translation)
 
 
 
 
-    def add_translation(self, language, text, response=None):
+    def add_translation(self, language, translation, response=None):
         """Add an encrypted translation with its token usage statistics"""
-        if self._translations is None:
-            self._translations = {}
-        if self.translation_tokens is None:
-            self.translation_tokens = {}
-            
+        self._invalidate_decrypted()
+        self._drop_legacy_translation(language)
+        row = self.translation_rows.get(language)
+        if row is None:
+            row = self.translation_rows[language] = MessageTranslation(language=language)
+
         # Encrypt and store the translation text
-        self._translations[language] = simple_encrypt(text)
+        row.text = translation
         
         # Store the token usage and model details if response is provided
         if response:
+            row.set_usage(self._token_usage(response))
+
+    def _drop_legacy_translation(self, language):
+        """Move a language out of the legacy JSON columns before it gets a translation row"""
+        if self._translations and language in self._translations:
+            self._invalidate_decrypted()
+            legacy_usage = (self.translation_tokens or {}).get(language)
+            del self._translations[language]
+            if legacy_usage:
+                del self.translation_tokens[language]
+            return legacy_usage
+        return None
+
+    def translation_usage(self, language):
+        """
+        Token usage and prices recorded for a translation
+
+        Returns:
+            dict: Entry in the translation_tokens shape, empty if none was recorded
+        """
+        row = self.translation_rows.get(language)
+        if row is not None:
+            return row.token_usage()
+        return (self.translation_tokens or {}).get(language) or {}
+
+    @staticmethod
+    def _token_usage(response):
+        """Token usage, model and price of the response that produced a translation"""
+        # Cache hits cost nothing upstream, so viewers are not charged for them
+        from_cache = getattr(response, 'from_cache', False)
+        if from_cache:
+            price_gpt4o = 0.0
+            price_gpt4o_mini = 0.0
+        else:
             # Calculate prices for both models
             price_gpt4o = (response.usage.prompt_tokens * TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O + 
                           response.usage.completion_tokens * TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O)
             
             price_gpt4o_mini = (response.usage.prompt_tokens * TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O_MINI + 
                                response.usage.completion_tokens * TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O_MINI)
-            
-            self.translation_tokens[language] = {
-                'model': response.model,
-                'completion_tokens': response.usage.completion_tokens,
-                'prompt_tokens': response.usage.prompt_tokens,
-                'total_tokens': response.usage.total_tokens,
-                'content': simple_encrypt(response.choices[0].message.content),
-                'timestamp': datetime.utcnow().isoformat(),
-                'price_gpt4o': price_gpt4o,
-                'price_gpt4o_mini': price_gpt4o_mini
-            }
+        
+        return {
+            'model': response.model,
+            'completion_tokens': response.usage.completion_tokens,
+            'prompt_tokens': response.usage.prompt_tokens,
+            'total_tokens': response.usage.total_tokens,
+            'content': simple_encrypt(response.choices[0].message.content),
+            'timestamp': datetime.utcnow().isoformat(),
+            'price_gpt4o': price_gpt4o,
+            'price_gpt4o_mini': price_gpt4o_mini,
+            'from_cache': from_cache
+        }
+
+    def add_translation_if_absent(self, language, translation, response=None):
+        """
+        Store a translation unless another request already stored one
+
+        The message_translation row is inserted in a short transaction of its
+        own, so concurrent readers of a room never wait on each other's row
+        locks, and the (message_id, language) unique key makes the first writer
+        win. The loser loads the winner's row instead, so every viewer is
+        priced from the same record.
+
+        Returns:
+            bool: True if this call stored the translation
+        """
+        if self.id is None:
+            self.add_translation(language, translation, response)
+            return True
 
+        row = MessageTranslation(language=language, text=translation)
+        if response:
+            row.set_usage(self._token_usage(response))
+        now = datetime.utcnow()
+        values = {
+            'message_id': self.id,
+            'language': language,
+            'text': row._text,
+            'model': row.model,
+            'usage': row.usage,
+            'price_gpt4o': row.price_gpt4o or 0.0,
+            'price_gpt4o_mini': row.price_gpt4o_mini or 0.0,
+            'created_at': now,
+            'updated_at': now
+        }
+        table = MessageTranslation.__table__
+        try:
+            with _translation_write_connection() as connection:
+                values['id'] = connection.execute(table.insert().values(**values)).inserted_primary_key[0]
+            stored = True
+        except IntegrityError as error:
+            # Another request stored this language first
+            stored = False
+            with _translation_write_connection() as connection:
+                values = connection.execute(
+                    select(table).where(table.c.message_id == self.id, table.c.language == language)
+                ).mappings().first()
+            if values is None:
+                raise error  # Not the unique key, e.g. the message was deleted meanwhile
+        _attach_translation_row(self, values)
+        return stored
             
-    def edit_translation(self, language, text, response=None):
+    def edit_translation(self, language, translation, response=None):
         """
         Edit an existing translation with new encrypted text and token usage statistics
         """
-        if self._translations is None:
-            self._translations = {}
-        if self.translation_tokens is None:
-            self.translation_tokens = {}
-            
+        if language not in self.translation_rows and language not in (self._translations or {}):
+            return False
+
+        self._invalidate_decrypted()
+        row = self.translation_rows.get(language)
+        if row is None:
+            # First edit of a legacy translation: it becomes a row, keeping its accumulated prices
+            legacy_usage = self._drop_legacy_translation(language)
+            row = self.translation_rows[language] = MessageTranslation(language=language)
+            if legacy_usage:
+                row.set_usage(legacy_usage)
+
         # Update the encrypted translation text
-        if language in self._translations:
-            self._translations[language] = simple_encrypt(text)
-            
-            # Update token usage if response is provided
-            if response:
-                # Calculate new prices
-                new_price_gpt4o = (response.usage.prompt_tokens * TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O + 
-                                response.usage.completion_tokens * TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O)
-                
-                new_price_gpt4o_mini = (response.usage.prompt_tokens * TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O_MINI + 
-                                    response.usage.completion_tokens * TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O_MINI)
-                
-                # Get existing prices or default to 0
-                existing_price_gpt4o = self.translation_tokens.get(language, {}).get('price_gpt4o', 0)
-                existing_price_gpt4o_mini = self.translation_tokens.get(language, {}).get('price_gpt4o_mini', 0)
-                
-                try:
-                    self.translation_tokens[language] = {
-                        'model': response.model,
-                        'completion_tokens': response.usage.completion_tokens,
-                        'prompt_tokens': response.usage.prompt_tokens,
-                        'total_tokens': response.usage.total_tokens,
-                        'content': simple_encrypt(response.choices[0].message.content),
-                        'timestamp': datetime.utcnow().isoformat(),
-                        'price_gpt4o': existing_price_gpt4o + new_price_gpt4o,
-                        'price_gpt4o_mini': existing_price_gpt4o_mini + new_price_gpt4o_mini
-                    }
-                    # app.logger.info(f"Translation tokens updated for {language}")
-                except Exception as e:
-                    app.logger.error(f"Error updating translation tokens: {str(e)}")
-            return True
-        return False
+        row.text = translation
+
+        # Update token usage if response is provided
+        if response:
+            token_usage = self._token_usage(response)
+            # Prices accumulate over edits
+            token_usage['price_gpt4o'] += row.price_gpt4o or 0
+            token_usage['price_gpt4o_mini'] += row.price_gpt4o_mini or 0
+            row.set_usage(token_usage)
+            # app.logger.info(f"Translation tokens updated for {language}")
+        return True
 
 
 
@@ -206,54 +357,58 @@ class Message(db.Model):
         return self.translations.get(language, self.translated_text)
 
 
-    def get_translation_priced(self, user_id, language, isLowCostMode):
+    def _record_view(self, user_id, language, price, billing):
+        """
+        Record user_id's first view of this translation and charge price for it
+
+        Views of messages prefetched with billing.prefetch_views are queued and
+        inserted in one batch by billing.flush_views; others are inserted here.
+        """
+        if user_id in ((self.translation_viewers or {}).get(language) or {}):
+            return  # Viewed before the translation_view table existed
+        if self.id is None:
+            # New message: the view is inserted together with it
+            self.translation_views.append(TranslationView(language=language, user_id=user_id))
+            billing.charge(user_id, price)
+            return
+        viewed = billing.viewed(user_id, self.id, language)
+        if viewed is None:
+            if db.session.get(TranslationView, (self.id, language, user_id)) is not None:
+                return
+            try:
+                with db.session.begin_nested():
+                    db.session.add(TranslationView(message_id=self.id, language=language, user_id=user_id))
+            except IntegrityError:
+                return  # A concurrent request recorded it first
+            billing.charge(user_id, price)
+        elif not viewed:
+            billing.record_view(user_id, self.id, language, price)
+
+
+    def get_translation_priced(self, user_id, language, isLowCostMode, billing=None):
         """
-        Get translation and handle pricing/tracking for the requesting user with improved concurrency handling
+        Get translation and record the requesting user's first view of it
+
+        The view's price goes to billing (services/billing.py), which takes all
+        of a request's charges from the payer in one decrement after the commit,
+        so no user row is locked per message. Without billing the charge is
+        still committed to the ledger and applied by the reconciliation job.
         """
+        translations = self.translations
         # First check if translation exists to fail fast
-        if not self.translations or language not in self.translations:
+        if not translations or language not in translations:
             return None
 
+        # Import here to avoid circular import
+        from services.billing import TranslationBilling
+        billing = billing or TranslationBilling()
         try:
-            # Import User here to avoid circular import
-            from models.user import User
-            
-            # Use the existing session instead of creating a new one
-            with db.session.begin_nested():
-                # Get user with explicit locking
-                user = User.query.with_for_update().filter_by(user_id=user_id).first()
-                if not user:
-                    return self.translations.get(language)
-
-                # Initialize viewers structure if needed
-                if self.translation_viewers is None:
-                    self.translation_viewers = {}
-                if language not in self.translation_viewers:
-                    self.translation_viewers[language] = {}
-
-                # Check if user hasn't viewed this translation
-                if user_id not in self.translation_viewers.get(language, {}):
-                    # Calculate price
-                    price_key = 'price_gpt4o_mini' if isLowCostMode == "1" else 'price_gpt4o'
-                    price = self.translation_tokens.get(language, {}).get(price_key, 0)
-                    
-                    # Update user tokens
-                    if price > 0:
-                        user.tokens -= price
-                    
-                    # Update viewers list
-                    self.translation_viewers.setdefault(language, {})[user_id] = datetime.utcnow().isoformat()
-                    
-                    try:
-                        # Update the message's translation_viewers
-                        db.session.execute(
-                            text("UPDATE message SET translation_viewers = :viewers WHERE id = :id"),
-                            {"viewers": json.dumps(self.translation_viewers), "id": self.id}
-                        )
-                    except Exception as e:
-                        from flask import current_app
-                        current_app.logger.error(f"Failed to update translation viewers: {str(e)}")
-                        # Continue execution even if update fails
+            if not billing.payer_exists(user_id):
+                return translations.get(language)
+
+            # Charge only the first view; the view row makes this hold across concurrent requests
+            price_key = 'price_gpt4o_mini' if isLowCostMode == "1" else 'price_gpt4o'
+            self._record_view(user_id, language, self.translation_usage(language).get(price_key, 0), billing)
         
         except Exception as e:
             from flask import current_app
@@ -263,7 +418,16 @@ class Message(db.Model):
         # Always return the translation if it exists
         # print(f"GGGGGUser ID: {user_id}, Language: {language}, Low Cost Mode: {isLowCostMode}")
         # print(f"Translations: {self.translations}")
-        return self.translations
+        return translations
+
+
 
+@event.listens_for(Message, 'expire')
+def _forget_decrypted_on_expire(message, attrs):
+    # Expired columns reload on next access (e.g. after commit); the view must follow
+    message._invalidate_decrypted()
 
 
+@event.listens_for(Message, 'refresh')
+def _forget_decrypted_on_refresh(message, context, attrs):
+    message._invalidate_decrypted()
@@ -0,0 +1,76 @@
+"""
+Message Translation Models - One row per translation and per translation view
+Database model definitions
+"""
+from datetime import datetime
+from extensions import db
+from sqlalchemy import JSON
+from services.encryption import simple_encrypt, simple_decrypt
+
+
+class MessageTranslation(db.Model):
+    """A message's translation into one language, with the usage and price of producing it"""
+    __tablename__ = 'message_translation'
+    __table_args__ = (
+        db.UniqueConstraint('message_id', 'language', name='uq_message_translation_language'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False, index=True)
+    language = db.Column(db.String(80), nullable=False)
+    _text = db.Column('text', db.Text, nullable=True)
+    model = db.Column(db.String(80), nullable=True)
+    usage = db.Column(JSON, nullable=True)  # prompt/completion/total tokens, encrypted content, from_cache
+    price_gpt4o = db.Column(db.Float, default=0.0)
+    price_gpt4o_mini = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def text(self):
+        """Decrypt and return the translated text"""
+        if not self._text:
+            return None
+        return simple_decrypt(self._text)
+
+    @text.setter
+    def text(self, value):
+        """Encrypt and store the translated text"""
+        self._text = simple_encrypt(value) if value else None
+
+    def set_usage(self, token_usage):
+        """Store an entry in the legacy translation_tokens shape (see Message._token_usage)"""
+        self.model = token_usage.get('model')
+        self.price_gpt4o = token_usage.get('price_gpt4o', 0.0)
+        self.price_gpt4o_mini = token_usage.get('price_gpt4o_mini', 0.0)
+        self.usage = {
+            key: value for key, value in token_usage.items()
+            if key not in ('model', 'price_gpt4o', 'price_gpt4o_mini')
+        }
+
+    def token_usage(self):
+        """
+        Usage in the legacy translation_tokens shape
+
+        Returns:
+            dict: Empty if no model call was recorded for this translation
+        """
+        if not self.model and not self.usage:
+            return {}
+        token_usage = dict(self.usage or {})
+        token_usage.update({
+            'model': self.model,
+            'price_gpt4o': self.price_gpt4o or 0.0,
+            'price_gpt4o_mini': self.price_gpt4o_mini or 0.0
+        })
+        return token_usage
+
+
+class TranslationView(db.Model):
+    """A user having seen (and been charged for) a message's translation"""
+    __tablename__ = 'translation_view'
+
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id'), primary_key=True)
+    language = db.Column(db.String(80), primary_key=True)
+    user_id = db.Column(db.String(80), primary_key=True)
+    viewed_at = db.Column(db.DateTime, default=datetime.utcnow)
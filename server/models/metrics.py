@@ -5,7 +5,7 @@ Database model definition
 from datetime import datetime, timedelta
 from extensions import db, sio, openAI_client
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy import JSON
+from sqlalchemy import JSON, func, distinct
 from werkzeug.security import generate_password_hash, check_password_hash
 import random
 import httpagentparser
@@ -93,6 +93,8 @@ class Metrics(db.Model):
         """Update all metrics with current snapshot"""
         try:
             current_time = datetime.utcnow().isoformat()
+            # Import here to avoid circular import
+            from models.message_translation import MessageTranslation, TranslationView
             
             # Get all users for various calculations
             users = User.query.all()
@@ -190,7 +192,8 @@ class Metrics(db.Model):
 
             # Message averages
             total_message_length = sum(len(msg.original_text or '') for msg in messages)
-            total_translation_keys = sum(len(msg.translations or {}) for msg in messages)
+            total_translation_keys = (sum(len(msg._translations or {}) for msg in messages) +
+                                      MessageTranslation.query.count())
             message_count = len(messages)
             
             self.avg_original_message_length[current_time] = total_message_length / message_count if message_count > 0 else 0
@@ -240,6 +243,11 @@ class Metrics(db.Model):
                 if msg.translation_viewers:
                     for lang in msg.translation_viewers.keys():
                         language_filter_counts[lang] = language_filter_counts.get(lang, 0) + 1
+            viewed_languages = db.session.query(
+                TranslationView.language, func.count(distinct(TranslationView.message_id))
+            ).group_by(TranslationView.language)
+            for lang, message_count in viewed_languages:
+                language_filter_counts[lang] = language_filter_counts.get(lang, 0) + message_count
             
             self.message_language_filter = language_filter_counts
             
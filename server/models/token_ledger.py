@@ -0,0 +1,26 @@
+"""
+Token Ledger Model - Token charges awaiting or applied to User.tokens
+Database model definition
+"""
+from datetime import datetime
+from extensions import db
+
+
+class TokenLedger(db.Model):
+    """
+    What one request charged one payer; applied_at is set once the amount
+    has been taken from User.tokens (services/billing.py)
+    """
+    __tablename__ = 'token_ledger'
+    __table_args__ = (
+        # Reconciliation scans for entries that were never applied
+        db.Index('ix_token_ledger_unapplied', 'applied_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.String(80), nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    views = db.Column(db.Integer, nullable=False, default=0)  # Translation views the amount covers
+    reason = db.Column(db.String(50), nullable=False, default='translation_view')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime, nullable=True)
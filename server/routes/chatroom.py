@@ -33,6 +33,7 @@ from services.metrics_service import check_and_update_metrics
 from services.debug_logging import log_debug_info
 from services.encryption import encrypt_data, decrypt_data
 from services.ip_location import get_ip_location
+from services.presence_cache import presence_cache
 
 # Import utils
 from utils.helpers import generate_random_password, allowed_file
@@ -270,6 +271,7 @@ def join_chatroom():
         db.session.add(user)
 
         db.session.commit()
+        presence_cache.invalidate_room(chatroom.id)
         print("Successfully joined chatroom")  # Debug print
         return jsonify({
             "message": "User joined the chatroom successfully",
@@ -329,6 +331,7 @@ def leave_chatroom():
                     )
                 )
                 db.session.commit()
+                presence_cache.invalidate_room(chatroom.id)
                 return jsonify({
                     "message": "User has left the chatroom successfully",
                     "is_creator": False
@@ -29,9 +29,18 @@ from models import User, ChatRoom, Message, Notification, Metrics, Plan, Payment
 from services.translation import translate_text
 from services.token_service import check_and_update_tokens
 from services.metrics_service import check_and_update_metrics
-from services.debug_logging import log_debug_info
+from services.debug_logging import log_debug_info, debug_log_writer
 from services.encryption import encrypt_data, decrypt_data
 from services.ip_location import get_ip_location
+from services.translation_cache import translation_cache
+from translation_queue import translation_scheduler
+from job_pool import socket_job_pool
+from services.audio_stream import audio_stream_stats
+from services.presence_cache import presence_cache, last_used_room_writer
+from services.translation import translation_single_flight
+from services.translation_backends import translation_backends
+from services.translation_migration import migrate_legacy_translations, reencode_stored_texts
+from services.billing import reconcile_token_ledger
 
 # Import utils
 from utils.helpers import generate_random_password, allowed_file
@@ -329,3 +338,120 @@ def get_debug_logs():
 
 
 
+@debug_bp.route('/api/debug/translation-cache-stats', methods=['GET'])
+@verify_debug_password
+def get_translation_cache_stats():
+    try:
+        return jsonify(translation_cache.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+
+@debug_bp.route('/api/debug/translation-scheduler-stats', methods=['GET'])
+@verify_debug_password
+def get_translation_scheduler_stats():
+    try:
+        stats = translation_scheduler.stats()
+        stats['single_flight'] = translation_single_flight.stats()
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/debug-log-writer-stats', methods=['GET'])
+@verify_debug_password
+def get_debug_log_writer_stats():
+    try:
+        return jsonify(debug_log_writer.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/socketio-manager-stats', methods=['GET'])
+@verify_debug_password
+def get_socketio_manager_stats():
+    try:
+        stats_fn = getattr(sio.manager, 'stats', None)
+        return jsonify(stats_fn() if stats_fn else {'backend': 'local'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/socket-job-pool-stats', methods=['GET'])
+@verify_debug_password
+def get_socket_job_pool_stats():
+    try:
+        return jsonify(socket_job_pool.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/audio-stream-stats', methods=['GET'])
+@verify_debug_password
+def get_audio_stream_stats():
+    try:
+        return jsonify(audio_stream_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/presence-cache-stats', methods=['GET'])
+@verify_debug_password
+def get_presence_cache_stats():
+    try:
+        return jsonify({
+            'cache': presence_cache.stats(),
+            'last_used_room_writer': last_used_room_writer.stats()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/translation-backends', methods=['GET'])
+@verify_debug_password
+def get_translation_backends():
+    try:
+        return jsonify(translation_backends.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/migrate-message-translations', methods=['POST'])
+@verify_debug_password
+def migrate_message_translations():
+    try:
+        data = request.get_json(silent=True) or {}
+        stats = migrate_legacy_translations(
+            batch_size=int(data.get('batchSize', TRANSLATION_MIGRATION_BATCH_SIZE)),
+            max_batches=data.get('maxBatches')
+        )
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/reencode-message-texts', methods=['POST'])
+@verify_debug_password
+def reencode_message_texts():
+    try:
+        data = request.get_json(silent=True) or {}
+        stats = reencode_stored_texts(
+            version=int(data.get('version', ENCRYPTION_CODEC_VERSION)),
+            batch_size=int(data.get('batchSize', TRANSLATION_MIGRATION_BATCH_SIZE)),
+            max_batches=data.get('maxBatches')
+        )
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@debug_bp.route('/api/debug/reconcile-token-ledger', methods=['POST'])
+@verify_debug_password
+def reconcile_token_ledger_now():
+    try:
+        data = request.get_json(silent=True) or {}
+        stats = reconcile_token_ledger(grace_seconds=int(data.get('graceSeconds', BILLING_RECONCILE_GRACE_SECONDS)))
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -49,7 +49,7 @@ except ImportError:
 
 # For location/spatial search
 try:
-    from spatial_search import load_and_search, initialize_data
+    from spatial_search import load_and_search, load_and_find_nearest, load_and_search_bbox, initialize_data
     from get_ai_international_rating import get_ai_rating
 except ImportError:
     pass  # Location dependencies not needed for all blueprints
@@ -58,6 +58,10 @@ except ImportError:
 location_bp = Blueprint('location', __name__)
 
 
+def _optional_int(data, key):
+    return int(data[key]) if data.get(key) is not None else None
+
+
 @location_bp.route('/api/getNearbyLocationInfo', methods=['POST'])
 def get_nearby_location_info():
     try:
@@ -66,8 +70,8 @@ def get_nearby_location_info():
         lng = float(data.get('lng'))
         radius = float(data.get('radius'))
 
-        # Get nearby locations using spatial search
-        nearby_locations = load_and_search(lat, lng, radius)
+        # Get nearby locations using spatial search (optionally the nearest `limit`, filtered by tags)
+        nearby_locations = load_and_search(lat, lng, radius, limit=_optional_int(data, 'limit'), tags=data.get('tags'))
 
         # Extract just the node information from the results
         locations = [item['node'] for item in nearby_locations]
@@ -85,6 +89,64 @@ def get_nearby_location_info():
 
 
 
+@location_bp.route('/api/getNearestLocations', methods=['POST'])
+def get_nearest_locations():
+    """k nearest locations to a point, e.g. {"lat", "lng", "k": 50, "tags": {"amenity": "cafe"}}"""
+    try:
+        data = request.json
+        lat = float(data.get('lat'))
+        lng = float(data.get('lng'))
+        k = int(data.get('k', 20))
+        max_radius = float(data['maxRadius']) if data.get('maxRadius') is not None else None
+
+        nearest = load_and_find_nearest(lat, lng, k, tags=data.get('tags'), max_radius_km=max_radius)
+
+        return jsonify({
+            "status": "success",
+            "locations": [item['node'] for item in nearest],
+            "distances": [item['distance'] for item in nearest]
+        }), 200
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+
+@location_bp.route('/api/getLocationsInBounds', methods=['POST'])
+def get_locations_in_bounds():
+    """Locations inside the map viewport {"south", "west", "north", "east"}, nearest its center first"""
+    try:
+        data = request.json
+        south = float(data.get('south'))
+        west = float(data.get('west'))
+        north = float(data.get('north'))
+        east = float(data.get('east'))
+
+        in_bounds = load_and_search_bbox(south, west, north, east,
+                                         limit=_optional_int(data, 'limit'), tags=data.get('tags'))
+
+        return jsonify({
+            "status": "success",
+            "locations": [item['node'] for item in in_bounds]
+        }), 200
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+
 @location_bp.route('/api/get_ai_rating_shop_single', methods=['POST'])
 def get_ai_rating_shop_single():
     try:
@@ -6,7 +6,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_tok
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
-from sqlalchemy import text, desc
+from sqlalchemy import text, desc, and_, or_
+from sqlalchemy.orm import selectinload
 from PIL import Image
 import os
 import base64
@@ -24,9 +25,13 @@ from extensions import db, sio, openAI_client, stripe
 
 # Import models
 from models import User, ChatRoom, Message, Notification, Metrics, Plan, PaymentHistory, ReferCode, Friendship, Shop, DebugLog
+from models import MessageTranslation, TranslationView
 
 # Import services
-from services.translation import translate_text, get_new_translated_string, get_new_translated_string_4o_stylish
+from services.translation import translate_to_languages, preview_translation_key
+from services.translation_backfill import backfill_translations
+from services.billing import TranslationBilling
+from translation_queue import PRIORITY_PREVIEW
 from services.token_service import check_and_update_tokens
 from services.metrics_service import check_and_update_metrics
 from services.debug_logging import log_debug_info
@@ -62,6 +67,9 @@ message_bp = Blueprint('message', __name__)
 def clear_history(chatroom_id):
     try:
         # Permanently delete all records in the Translation table related to the chatroom
+        message_ids = db.session.query(Message.id).filter_by(chatroom_id=chatroom_id)
+        db.session.query(TranslationView).filter(TranslationView.message_id.in_(message_ids)).delete(synchronize_session=False)
+        db.session.query(MessageTranslation).filter(MessageTranslation.message_id.in_(message_ids)).delete(synchronize_session=False)
         db.session.query(Message).filter_by(chatroom_id=chatroom_id).delete()
         db.session.commit()
         db.session.expire_all()  # Expire session to release any locks
@@ -101,18 +109,17 @@ def preview_translate():
             return jsonify({"error": "User not found"}), 404
 
         # Get translation based on language type
-        if language == 'original_text_raw':
-            translation = text
-            response = None
-        elif language in MAINSTREAM_LANGUAGES:
-            response = get_new_translated_string(language, text)
-            translation = response.choices[0].message.content if response else text
-        else:
-            response = get_new_translated_string_4o_stylish(language, text, low_cost_mode)
-            translation = response.choices[0].message.content if response else text
+        translation, response = translate_to_languages(
+            text, [language], low_cost_mode, priority=PRIORITY_PREVIEW,
+            coalesce_keys={language: preview_translation_key(text, language, low_cost_mode)}
+        )[language]
 
         # Calculate and deduct tokens if translation was performed
-        if response:
+        if response and getattr(response, 'from_cache', False):
+            # Served from the translation cache: no upstream cost to pass on
+            user.preview_message_count += 1
+            db.session.commit()
+        elif response:
             # Calculate prices based on model
             price_gpt4o = (response.usage.prompt_tokens * TEXT_UNIT_PRICE_PER_TOKEN_PROMPT_INPUT_TOKENS_GPT_4O +
                           response.usage.completion_tokens * TEXT_UNIT_PRICE_PER_TOKEN_COMPLETION_OUTPUT_TOKENS_GPT_4O)
@@ -154,6 +161,62 @@ def preview_translate():
 
 
 
+def _messages_with_authors(query, limit=None):
+    """
+    Load messages together with their authors' display fields in one query
+
+    Messages whose author no longer exists are skipped, as before.
+
+    Args:
+        query: Message query (filters, ordering and locking already applied)
+        limit (int): Optional maximum number of messages
+
+    Returns:
+        tuple: (messages, authors) where authors maps user_id to the author's
+               display fields; each author appears once however many messages they wrote
+    """
+    messages = []
+    authors = {}
+    rows = (query.join(User, User.user_id == Message.user_id)
+            .add_columns(User.user_id, User.avatar)
+            .options(selectinload(Message.translation_rows)))  # All translation rows in one more query
+    if limit is not None:
+        rows = rows.limit(limit)
+    for message, author_id, avatar in rows:
+        authors.setdefault(author_id, {'avatar': avatar})
+        messages.append(message)
+    return messages, authors
+
+
+def _keyset_page(query, before=None, after=None, direction='older'):
+    """
+    Order a message query for one keyset page on (timestamp, id)
+
+    Args:
+        query: Message query already filtered to one chatroom
+        before (int): Return messages older than this message id
+        after (int): Return messages newer than this message id
+        direction (str): 'older' pages back from the newest message, 'newer'
+                         forward from the oldest; implied by before/after
+
+    Returns:
+        tuple: (query, ascending); rows come newest first when ascending is False
+    """
+    ascending = after is not None or (before is None and direction == 'newer')
+    cursor_id = after if after is not None else before
+    if cursor_id is not None:
+        cursor_timestamp = db.session.query(Message.timestamp).filter(Message.id == cursor_id).scalar_subquery()
+        if ascending:
+            query = query.filter(or_(Message.timestamp > cursor_timestamp,
+                                     and_(Message.timestamp == cursor_timestamp, Message.id > cursor_id)))
+        else:
+            query = query.filter(or_(Message.timestamp < cursor_timestamp,
+                                     and_(Message.timestamp == cursor_timestamp, Message.id < cursor_id)))
+    if ascending:
+        return query.order_by(Message.timestamp.asc(), Message.id.asc()), True
+    return query.order_by(Message.timestamp.desc(), Message.id.desc()), False
+
+
 @message_bp.route('/api/get-messages-on-demand/<chatroom_id>/<language>/<language_first>/<language_second>/<is_split>', methods=['GET'])
 def get_messages_on_demand(chatroom_id, language, language_first, language_second, is_split):
     try:
@@ -191,76 +254,56 @@ def get_messages_on_demand(chatroom_id, language, language_first, language_secon
         # Convert is_split string to boolean
         is_split = is_split.lower() == 'true'
 
-        # Build query with proper locking strategy
-        query = Message.query.with_for_update(skip_locked=False).filter_by(chatroom_id=chatroom_id)
+        # Read without row locks; missing translations are stored per language by compare-and-set
+        query = Message.query.filter_by(chatroom_id=chatroom_id)
         if message_ids:
             query = query.filter(Message.id.in_(message_ids))
-        messages = query.order_by(Message.timestamp.asc()).all()
-
-        all_messages = []
-        for message in messages[::-1]:
-            user = User.query.filter_by(user_id=message.user_id).first()
-            if user:
-                if is_split:
-                    # Handle split mode translations
-                    for lang in [language_first, language_second]:
-                        if lang not in message.translations or not message.translations[lang]:
-                            if lang == 'original_text_raw':
-                                message.add_translation(lang, message.original_text)
-                            else:
-                                if lang in MAINSTREAM_LANGUAGES:
-                                    response = get_new_translated_string(lang, message.original_text)
-                                    message.add_translation(lang, response.choices[0].message.content, response)
-                                else:
-                                    response = get_new_translated_string_4o_stylish(lang, message.original_text, low_cost_mode)
-                                    message.add_translation(lang, response.choices[0].message.content, response)
-                else:
-                    # Handle single language mode
-                    if language not in message.translations or not message.translations[language]:
-                        if language == 'original_text_raw':
-                            message.add_translation(language, message.original_text)
-                        else:
-                            if language in MAINSTREAM_LANGUAGES:
-                                response = get_new_translated_string(language, message.original_text)
-                                message.add_translation(language, response.choices[0].message.content, response)
-                            else:
-                                response = get_new_translated_string_4o_stylish(language, message.original_text, low_cost_mode)
-                                message.add_translation(language, response.choices[0].message.content, response)
-
-                try:
-                    db.session.commit()
-                except Exception as e:
-                    db.session.rollback()
-                    # current_app.logger.error(f"Failed to commit translations: {str(e)}")
-
-                # Get priced translation with separate transaction
-
-                pricing_user_id = curr_host_user_id if is_guest_mode and curr_host_user_id else user_id
-                priced_translation = message.get_translation_priced(pricing_user_id, language, low_cost_mode)
-                # Wrap priced_translation in a dict with language key
-                # priced_translation = {language: priced_translation}
-                # print(f"FFFFFFFFFFFPriced translation: {priced_translation}")
-                # print(f"User ID: {user_id}")
-                content = {
-                    'id': message.id,
-                    'username': message.username,
-                    'userId': message.user_id,
-                    'original_text': message.original_text,
-                    'translated_text': message.translated_text,
-                    'content_type': message.content_type,
-                    'timestamp': message.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    'translations': priced_translation or {},
-                    'is_recalled': message.is_recalled,
-                    'is_edited': message.is_edited,
-                    'recall_username': message.username if message.is_recalled == '1' else None,
-                    'reply_to_message_id': message.reply_to_message_id,
-                    'avatar': user.avatar
-                }
-
-                sio.emit('received_translated_existed_single_language', content, room=socket_id)
-                all_messages.append(content)
-
-                # print(message.translations)  # Preserved print statement
+        authored_messages, authors = _messages_with_authors(query.order_by(Message.timestamp.asc()))
+        authored_messages.reverse()
+
+        pricing_user_id = curr_host_user_id if is_guest_mode and curr_host_user_id else user_id
+        # Every view charge of this fetch is taken from the payer in one decrement after the commit
+        billing = TranslationBilling()
+        billing.prefetch_views(pricing_user_id, [message.id for message in authored_messages])
+        contents = {}
+
+        def emit_priced_message(message):
+            # Get priced translation with separate transaction
+            priced_translation = message.get_translation_priced(pricing_user_id, language, low_cost_mode, billing=billing)
+            content = {
+                'id': message.id,
+                'username': message.username,
+                'userId': message.user_id,
+                'original_text': message.original_text,
+                'translated_text': message.translated_text,
+                'content_type': message.content_type,
+                'timestamp': message.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                'translations': priced_translation or {},
+                'is_recalled': message.is_recalled,
+                'is_edited': message.is_edited,
+                'recall_username': message.username if message.is_recalled == '1' else None,
+                'reply_to_message_id': message.reply_to_message_id,
+                'avatar': authors[message.user_id]['avatar']
+            }
+            sio.emit('received_translated_existed_single_language', content, room=socket_id)
+            contents[message.id] = content
+
+        # Translate everything that is missing in one batch, streaming each
+        # message to the socket as soon as its translations land
+        languages = [language_first, language_second] if is_split else [language]
+        backfill_translations(authored_messages, languages, low_cost_mode,
+                              on_message_ready=emit_priced_message, room=chatroom_id)
+
+        # Collect the response before the commit expires the loaded messages
+        all_messages = [contents[message.id] for message in authored_messages if message.id in contents]
+
+        try:
+            billing.flush_views()
+            db.session.commit()
+            billing.apply()
+        except Exception as e:
+            db.session.rollback()
+            # current_app.logger.error(f"Failed to commit translations: {str(e)}")
 
         return jsonify({"messages": all_messages}), 200
 
@@ -293,76 +336,63 @@ def get_all_messages(chatroom_id, language, language_first, language_second, is_
     # Convert is_split string to boolean
     is_split = is_split.lower() == 'true'
 
-    # Fetch messages for the specified chatroom, ordered by timestamp
-    messages = Message.query.filter_by(chatroom_id=chatroom_id).order_by(Message.timestamp.asc()).all()
+    # Keyset pagination: ?limit=N with optional before=<id> / after=<id> or direction=older|newer.
+    # Without any of them the whole history is returned, as before.
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    direction = request.args.get('direction', 'older')
+    paginated = limit is not None or before is not None or after is not None
+    has_more = False
+
+    query = Message.query.filter_by(chatroom_id=chatroom_id)
+    if paginated:
+        limit = max(1, min(limit or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE))
+        query, ascending = _keyset_page(query, before, after, direction)
+        # One extra row tells whether another page exists
+        authored_messages, authors = _messages_with_authors(query, limit=limit + 1)
+        has_more = len(authored_messages) > limit
+        authored_messages = authored_messages[:limit]
+        if not ascending:
+            authored_messages.reverse()
+    else:
+        # Fetch messages for the specified chatroom with their authors, ordered by timestamp
+        authored_messages, authors = _messages_with_authors(query.order_by(Message.timestamp.asc()))
     # print("get_all_messages")
 
-    # Prepare the response data
-    all_messages = []
-    for message in messages:
-        user = User.query.filter_by(user_id=message.user_id).first()
-        if user:
-            if is_split:
-                # Handle split mode - generate translations for both languages if needed
-                if language_first not in message.translations or not message.translations[language_first]:
-                    if language_first == 'original_text_raw':
-                        message.add_translation(language_first, message.original_text)
-                    else:
-                        if language_first in MAINSTREAM_LANGUAGES:
-                            response = get_new_translated_string(language_first, message.original_text)
-                            message.add_translation(language_first, response.choices[0].message.content, response)
-                        else:
-                            response = get_new_translated_string_4o_stylish(language_first, message.original_text, low_cost_mode)
-                            message.add_translation(language_first, response.choices[0].message.content, response)
-
-                if language_second not in message.translations or not message.translations[language_second]:
-                    if language_second == 'original_text_raw':
-                        message.add_translation(language_second, message.original_text)
-                    else:
-                        if language_second in MAINSTREAM_LANGUAGES:
-                            response = get_new_translated_string(language_second, message.original_text)
-                            message.add_translation(language_second, response.choices[0].message.content, response)
-                        else:
-                            response = get_new_translated_string_4o_stylish(language_second, message.original_text, low_cost_mode)
-                            message.add_translation(language_second, response.choices[0].message.content, response)
-
-                db.session.commit()
-            else:
-                # Original single language mode
-                if language not in message.translations or not message.translations[language]:
-                    if language == 'original_text_raw':
-                        message.add_translation(language, message.original_text)
-                    else:
-                        if language in MAINSTREAM_LANGUAGES:
-                            response = get_new_translated_string(language, message.original_text)
-                            message.add_translation(language, response.choices[0].message.content, response)
-                        else:
-                            response = get_new_translated_string_4o_stylish(language, message.original_text, low_cost_mode)
-                            message.add_translation(language, response.choices[0].message.content, response)
-
-                    db.session.commit()
-
-            content = {
-                'id': message.id,
-                'username': message.username,
-                'userId': message.user_id,
-                'original_text': message.original_text,
-                'translated_text': message.translated_text,
-                'content_type': message.content_type,
-                'timestamp': message.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                'translations': message.translations,
-                'is_recalled': message.is_recalled,  # Make sure to include this
-                'is_edited': message.is_edited,
-                'recall_username': message.username if message.is_recalled == '1' else None,  # Add this
-                'reply_to_message_id': message.reply_to_message_id,
-                'avatar':user.avatar
-            }
-            sio.emit('received_translated_existed_single_language', content, room=str(chatroom_id))
-            all_messages.append(content)
-
-            # print(message.translations)
-            # Emit with message ID included
-
+    contents = {}
+
+    def emit_message(message):
+        content = {
+            'id': message.id,
+            'username': message.username,
+            'userId': message.user_id,
+            'original_text': message.original_text,
+            'translated_text': message.translated_text,
+            'content_type': message.content_type,
+            'timestamp': message.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            'translations': message.translations,
+            'is_recalled': message.is_recalled,  # Make sure to include this
+            'is_edited': message.is_edited,
+            'recall_username': message.username if message.is_recalled == '1' else None,  # Add this
+            'reply_to_message_id': message.reply_to_message_id,
+            'avatar': authors[message.user_id]['avatar']
+        }
+        sio.emit('received_translated_existed_single_language', content, room=str(chatroom_id))
+        contents[message.id] = content
+
+    # Generate missing translations in one batch and persist them with a single commit
+    languages = [language_first, language_second] if is_split else [language]
+    backfill_translations(authored_messages, languages, low_cost_mode,
+                          on_message_ready=emit_message, room=chatroom_id)
+
+    # Prepare the response data before the commit expires the loaded messages
+    all_messages = [contents[message.id] for message in authored_messages if message.id in contents]
+    db.session.commit()
+
+    if paginated:
+        # Pages are always returned oldest first; has_more refers to the paging direction
+        return jsonify({"messages": all_messages, "has_more": has_more}), 200
     return jsonify({"messages": all_messages}), 200
 
 
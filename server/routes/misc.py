@@ -32,6 +32,7 @@ from services.metrics_service import check_and_update_metrics
 from services.debug_logging import log_debug_info
 from services.encryption import encrypt_data, decrypt_data
 from services.ip_location import get_ip_location
+from services.presence_cache import presence_cache, last_used_room_writer
 
 # Import utils
 from utils.helpers import generate_random_password, allowed_file
@@ -335,6 +336,7 @@ def join_public_chatroom():
     if user not in public_chatroom.participants:
         public_chatroom.participants.append(user)
         db.session.commit()
+        presence_cache.invalidate_room(public_chatroom.id)
 
     return jsonify({
         "message": "Joined public chatroom successfully",
@@ -349,16 +351,18 @@ def join_public_chatroom():
 def get_last_used_chatroom(user_id):
     user = User.query.filter_by(user_id=user_id).first()
     if user:
+        # A join may not be written yet (join_room coalesces these writes)
+        last_used_chatroom_id = last_used_room_writer.pending(user_id) or user.last_used_chatroom_id
         # Get the chatroom details
-        chatroom = ChatRoom.query.filter_by(id=user.last_used_chatroom_id).first()
+        chatroom = ChatRoom.query.filter_by(id=last_used_chatroom_id).first()
         if chatroom:
             return jsonify({
-                "last_used_chatroom_id": user.last_used_chatroom_id,
+                "last_used_chatroom_id": last_used_chatroom_id,
                 "is_private": chatroom.is_private,
                 "name": chatroom.name
             }), 200
         return jsonify({
-            "last_used_chatroom_id": user.last_used_chatroom_id,
+            "last_used_chatroom_id": last_used_chatroom_id,
             "is_private": '0',
             "name": None
         }), 200
@@ -457,6 +461,7 @@ def creator_remove_user():
             if kicked_user in chatroom.participants:
                 chatroom.participants.remove(kicked_user)
                 db.session.commit()
+                presence_cache.invalidate_room(chatroom.id)
                                 # Emit socket event to notify the kicked user
                 sio.emit('already_leave_chatroom', {
                     'chatroomId': chatroom_id,
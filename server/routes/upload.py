@@ -32,6 +32,7 @@ from services.metrics_service import check_and_update_metrics
 from services.debug_logging import log_debug_info
 from services.encryption import encrypt_data, decrypt_data
 from services.ip_location import get_ip_location
+from services.uploads import UploadError, create_upload, upload_status, write_upload_chunk
 
 # Import utils
 from utils.helpers import generate_random_password, allowed_file
@@ -79,6 +80,42 @@ def upload_reference_audio():
 
 
 
+@upload_bp.route('/api/uploads', methods=['POST'])
+def start_chunked_upload():
+    """
+    Start a chunked binary upload; send the chunks with PUT /api/uploads/<upload_id>
+    and pass uploadId to upload_audio once every byte has arrived
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(create_upload(data.get('userId'), data.get('size'), data.get('contentType'))), 201
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Append the raw request body at the X-Upload-Offset header's offset"""
+    try:
+        offset = int(request.headers.get('X-Upload-Offset', '0'))
+    except ValueError:
+        return jsonify({"error": "X-Upload-Offset must be an integer"}), 400
+    try:
+        return jsonify(write_upload_chunk(upload_id, offset, request.stream, request.content_length)), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+
+@upload_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    try:
+        return jsonify(upload_status(upload_id)), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+
+
+
 @upload_bp.route('/public/<path:filename>', methods=['GET'])
 def uploaded_file(filename):
     return send_from_directory('public', filename)
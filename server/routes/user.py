@@ -32,6 +32,7 @@ from services.metrics_service import check_and_update_metrics
 from services.debug_logging import log_debug_info
 from services.encryption import encrypt_data, decrypt_data
 from services.ip_location import get_ip_location
+from services.presence_cache import presence_cache
 
 # Import utils
 from utils.helpers import generate_random_password, allowed_file
@@ -104,6 +105,7 @@ def delete_account():
             user.password = generate_password_hash(random_password)
 
             db.session.commit()
+            presence_cache.invalidate_user(user.user_id)
 
             return jsonify({
                 'success': True,
@@ -183,6 +185,7 @@ def update_username():
     # Update the username
     user.username = new_username
     db.session.commit()
+    presence_cache.invalidate_user(user.user_id)
 
     return jsonify({"message": "Username updated successfully"}), 200
 
@@ -340,6 +343,7 @@ def upload_avatar():
             user.avatar = thumbnail_filename
             user.avatar_full = avatar_filename
             db.session.commit()
+            presence_cache.invalidate_user(user.user_id)
 
         return jsonify({"message": "Avatar uploaded successfully", "avatar_url": f"/api/avatar/{current_user_id}"}), 201
 
@@ -6,7 +6,14 @@ Imports and exports all service functions
 # Import service functions
 from .encryption import simple_encrypt, simple_decrypt
 from .ip_location import get_ip_location
-from .translation import get_new_translated_string, get_new_translated_string_4o_stylish
+from .translation import (
+    get_new_translated_string,
+    get_new_translated_string_4o_stylish,
+    translate_for_language,
+    translate_to_languages
+)
+from .translation_cache import translation_cache
+from .translation_backends import translation_backends
 from .token_service import check_and_update_tokens
 from .metrics_service import (
     check_and_update_metrics,
@@ -26,6 +33,10 @@ __all__ = [
     # Translation
     'get_new_translated_string',
     'get_new_translated_string_4o_stylish',
+    'translate_for_language',
+    'translate_to_languages',
+    'translation_cache',
+    'translation_backends',
     # Token Management
     'check_and_update_tokens',
     # Metrics
@@ -0,0 +1,480 @@
+"""
+Audio Stream Service - Incremental transcription of streamed audio chunks
+Business logic for audio_stream
+
+Clients push small PCM16 (or WAV) chunks over the audio_chunk event. Each
+socket session keeps its audio in a preallocated ring buffer and a voice
+activity detector cuts it into segments at a pause, or when a segment
+reaches AUDIO_STREAM_MAX_SEGMENT_SECONDS. Segments are transcribed (and
+translated, if the client asked for target languages) in order on the socket
+job pool, and the growing transcript is sent to the chatroom through
+user_speaking_to_client_content_transcript.
+"""
+import base64
+import io
+import struct
+import threading
+import wave
+from collections import deque
+
+import numpy as np
+from flask import current_app
+
+from extensions import db, sio, openAI_client
+from job_pool import socket_job_pool, JobRejected
+from services.debug_logging import log_transcription
+from services.translation import translate_to_languages
+from services.billing import TranslationBilling
+from services.presence_cache import presence_cache
+from config.constants import (
+    AUDIO_UNIT_PRICE_PER_MINUTE,
+    AUDIO_STREAM_SAMPLE_RATE,
+    AUDIO_STREAM_MAX_CHUNK_BYTES,
+    AUDIO_STREAM_FRAME_MS,
+    AUDIO_STREAM_SILENCE_MS,
+    AUDIO_STREAM_MIN_SPEECH_MS,
+    AUDIO_STREAM_PREROLL_MS,
+    AUDIO_STREAM_MAX_SEGMENT_SECONDS,
+    AUDIO_STREAM_VAD_AGGRESSIVENESS,
+    AUDIO_STREAM_ENERGY_THRESHOLD,
+    AUDIO_STREAM_MAX_PENDING_SEGMENTS
+)
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+WEBRTC_VAD_SAMPLE_RATES = (8000, 16000, 32000, 48000)
+_PROMPT_CONTEXT_CHARS = 200  # Tail of the transcript passed to Whisper for continuity
+
+
+class PcmRingBuffer:
+    """Fixed-capacity byte ring; writing past capacity overwrites the oldest bytes"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        """
+        Append data
+
+        Returns:
+            int: Oldest bytes overwritten to make room
+        """
+        count = len(data)
+        if count >= self.capacity:
+            overwritten = self._size + count - self.capacity
+            self._buffer[:] = data[count - self.capacity:]
+            self._start, self._size = 0, self.capacity
+            return overwritten
+        overwritten = max(0, self._size + count - self.capacity)
+        if overwritten:
+            self._start = (self._start + overwritten) % self.capacity
+            self._size -= overwritten
+        end = (self._start + self._size) % self.capacity
+        first = min(count, self.capacity - end)
+        self._buffer[end:end + first] = data[:first]
+        if first < count:
+            self._buffer[:count - first] = data[first:]
+        self._size += count
+        return overwritten
+
+    def keep_last(self, count):
+        """Discard all but the newest count bytes"""
+        if self._size > count:
+            self._start = (self._start + self._size - count) % self.capacity
+            self._size = count
+
+    def drain(self):
+        """Return the contents and empty the buffer"""
+        end = self._start + self._size
+        if end <= self.capacity:
+            data = bytes(self._buffer[self._start:end])
+        else:
+            data = bytes(self._buffer[self._start:]) + bytes(self._buffer[:end - self.capacity])
+        self._start = self._size = 0
+        return data
+
+
+def make_vad(sample_rate, frame_ms):
+    """
+    Speech detector for one frame of PCM16 mono audio
+
+    Uses webrtcvad when it is installed and supports the sample rate, and an
+    RMS energy threshold otherwise.
+    """
+    if webrtcvad is not None and sample_rate in WEBRTC_VAD_SAMPLE_RATES and frame_ms in (10, 20, 30):
+        vad = webrtcvad.Vad(AUDIO_STREAM_VAD_AGGRESSIVENESS)
+        return lambda frame: vad.is_speech(frame, sample_rate)
+
+    def is_loud(frame):
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        return float(np.sqrt(np.mean(samples * samples))) >= AUDIO_STREAM_ENERGY_THRESHOLD
+    return is_loud
+
+
+class SpeechSegmenter:
+    """
+    Cuts a PCM16 mono stream into speech segments
+
+    Before speech starts only AUDIO_STREAM_PREROLL_MS of audio is kept, so
+    the ring buffer never holds more than one segment plus its pre-roll.
+    """
+
+    def __init__(self, sample_rate, frame_ms=AUDIO_STREAM_FRAME_MS, silence_ms=AUDIO_STREAM_SILENCE_MS,
+                 min_speech_ms=AUDIO_STREAM_MIN_SPEECH_MS, preroll_ms=AUDIO_STREAM_PREROLL_MS,
+                 max_segment_seconds=AUDIO_STREAM_MAX_SEGMENT_SECONDS, vad=None):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.preroll_bytes = preroll_ms * sample_rate // 1000 * 2 // self.frame_bytes * self.frame_bytes
+        self.max_segment_bytes = int(max_segment_seconds * sample_rate) * 2 // self.frame_bytes * self.frame_bytes
+        self.vad = vad or make_vad(sample_rate, frame_ms)
+        self._ring = PcmRingBuffer(self.max_segment_bytes + self.preroll_bytes)
+        self._partial = bytearray()
+        self._in_speech = False
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def buffered_ms(self):
+        return (len(self._ring) + len(self._partial)) * 1000 // (self.sample_rate * 2)
+
+    def feed(self, pcm):
+        """
+        Add PCM16 mono audio
+
+        Returns:
+            list: Completed segments (bytes), oldest first
+        """
+        self._partial += pcm
+        whole = len(self._partial) // self.frame_bytes * self.frame_bytes
+        frames = memoryview(bytes(self._partial[:whole]))
+        del self._partial[:whole]
+
+        segments = []
+        for offset in range(0, whole, self.frame_bytes):
+            frame = frames[offset:offset + self.frame_bytes]
+            voiced = self.vad(bytes(frame))
+            self._ring.write(frame)
+            if not self._in_speech:
+                if voiced:
+                    self._in_speech = True
+                    self._speech_frames, self._silent_frames = 1, 0
+                else:
+                    self._ring.keep_last(self.preroll_bytes)
+                continue
+            if voiced:
+                self._speech_frames += 1
+                self._silent_frames = 0
+            else:
+                self._silent_frames += 1
+            if self._silent_frames >= self.silence_frames:
+                segment = self._cut()
+                self._in_speech = False
+                if segment:
+                    segments.append(segment)
+            elif len(self._ring) >= self.max_segment_bytes:
+                # Long utterance: cut without waiting for a pause and keep listening
+                segment = self._cut()
+                self._speech_frames = self._silent_frames = 0
+                if segment:
+                    segments.append(segment)
+        return segments
+
+    def flush(self):
+        """End of stream: return the segment in progress, or None"""
+        self._ring.write(bytes(self._partial))
+        self._partial.clear()
+        segment = self._cut() if self._in_speech else None
+        self._ring.drain()
+        self._in_speech = False
+        return segment
+
+    def _cut(self):
+        pcm = self._ring.drain()
+        if self._speech_frames < self.min_speech_frames:
+            return None  # A click or a cough, not worth a transcription
+        return pcm
+
+
+def pcm_to_wav(pcm, sample_rate):
+    """Wrap PCM16 mono audio in a WAV container for the transcription API"""
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return output.getvalue()
+
+
+def decode_audio_chunk(audio, sample_rate):
+    """
+    Turn an audio_chunk payload into PCM16 mono
+
+    Args:
+        audio: Raw PCM16 little-endian bytes, a WAV file (the RecordRTC
+               StereoAudioRecorder slices), or either one base64 encoded
+        sample_rate (int): Rate of raw PCM input
+
+    Returns:
+        tuple: (pcm bytes, sample rate)
+    """
+    if isinstance(audio, str):
+        audio = base64.b64decode(audio.split(',', 1)[-1])
+    audio = bytes(audio)
+    if not (audio[:4] == b'RIFF' and audio[8:12] == b'WAVE'):
+        return audio[:len(audio) // 2 * 2], sample_rate
+
+    channels, rate, sample_width, data = 1, sample_rate, 2, b''
+    offset = 12
+    while offset + 8 <= len(audio):
+        chunk_id, size = struct.unpack('<4sI', audio[offset:offset + 8])
+        body = audio[offset + 8:offset + 8 + size]
+        if chunk_id == b'fmt ':
+            channels, rate = struct.unpack('<HI', body[2:8])
+            sample_width = struct.unpack('<H', body[14:16])[0] // 8
+        elif chunk_id == b'data':
+            data = body
+            break
+        offset += 8 + size + (size & 1)
+    if sample_width != 2:
+        raise ValueError("Only 16-bit PCM audio is supported")
+    data = data[:len(data) // (2 * channels) * 2 * channels]
+    if channels > 1:
+        samples = np.frombuffer(data, dtype='<i2').reshape(-1, channels)
+        data = samples.mean(axis=1).astype('<i2').tobytes()
+    return data, rate
+
+
+class AudioStreamSession:
+    """Audio and transcript of one socket's stream"""
+
+    def __init__(self, sid, data, sample_rate, app):
+        self.sid = sid
+        self.app = app
+        self.user_id = data.get('userId')
+        self.username = data.get('username')
+        self.chatroom_id = data.get('chatroomId')
+        self.room = str(self.chatroom_id) if self.chatroom_id else sid
+        self.payer_id = data.get('currHostUserId') if data.get('isGuestMode') and data.get('currHostUserId') else self.user_id
+        if data.get('isSplit'):
+            self.languages = [data.get('toLanguageMeFirst'), data.get('toLanguageMeSecond')]
+        else:
+            self.languages = [data.get('toLanguageMe') or data.get('targetLanguage')]
+        self.languages = [language for language in self.languages if language]
+        self.low_cost_mode = data.get('lowCostMode', '0')
+        self.avatar = None
+        self.segmenter = SpeechSegmenter(sample_rate)
+        self.lock = threading.Lock()
+        self.segments = deque()
+        self.draining = False
+        self.ended = False
+        self.transcript = []
+        self.translations = {}
+        self.segments_done = 0
+        self.segments_dropped = 0
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = {'chunks': 0, 'bytes': 0, 'segments': 0, 'segments_dropped': 0, 'transcription_failures': 0}
+
+
+def feed_audio_chunk(sid, data):
+    """
+    Buffer one audio_chunk and queue any segments it completes
+
+    Call inside the app context.
+
+    Returns:
+        dict: Ack for the client
+    """
+    audio = data.get('audio', data.get('buffer'))
+    if not audio:
+        return {'ok': False, 'error': 'audio is missing'}
+    if len(audio) > AUDIO_STREAM_MAX_CHUNK_BYTES:
+        return {'ok': False, 'error': f'audio chunk exceeds {AUDIO_STREAM_MAX_CHUNK_BYTES} bytes'}
+    try:
+        pcm, sample_rate = decode_audio_chunk(audio, int(data.get('sampleRate') or AUDIO_STREAM_SAMPLE_RATE))
+    except (ValueError, TypeError, struct.error) as e:
+        return {'ok': False, 'error': f'Unreadable audio chunk: {str(e)}'}
+
+    with _sessions_lock:
+        session = _sessions.get(sid)
+        if session is None:
+            session = _sessions[sid] = AudioStreamSession(sid, data, sample_rate, current_app._get_current_object())
+        _stats['chunks'] += 1
+        _stats['bytes'] += len(pcm)
+    if session.segmenter.sample_rate != sample_rate:
+        return {'ok': False, 'error': 'sampleRate changed mid-stream; end the stream first'}
+
+    with session.lock:
+        for segment in session.segmenter.feed(pcm):
+            _queue_segment(session, segment)
+        if data.get('final'):
+            _end_session(session)
+        return {'ok': True, 'bufferedMs': session.segmenter.buffered_ms(), 'pendingSegments': len(session.segments)}
+
+
+def end_audio_stream(sid):
+    """
+    Transcribe what is left of the stream; the last transcript event has final=True
+
+    Returns:
+        dict: Ack for the client
+    """
+    with _sessions_lock:
+        session = _sessions.get(sid)
+    if session is None:
+        return {'ok': False, 'error': 'No audio stream in progress'}
+    with session.lock:
+        _end_session(session)
+        return {'ok': True, 'pendingSegments': len(session.segments)}
+
+
+def discard_audio_stream(sid):
+    """Drop a stream without transcribing the rest (the socket disconnected)"""
+    with _sessions_lock:
+        session = _sessions.pop(sid, None)
+    if session is not None:
+        with session.lock:
+            session.ended = True
+            session.segments.clear()
+
+
+def _end_session(session):
+    # Called with session.lock held
+    if session.ended:
+        return
+    segment = session.segmenter.flush()
+    session.ended = True
+    with _sessions_lock:
+        if _sessions.get(session.sid) is session:
+            del _sessions[session.sid]
+    if segment:
+        _queue_segment(session, segment)
+    elif not session.draining:
+        _emit_transcript(session, '', {}, final=True)
+
+
+def _queue_segment(session, segment):
+    # Called with session.lock held; one drain job per session keeps segments in order
+    if len(session.segments) >= AUDIO_STREAM_MAX_PENDING_SEGMENTS:
+        session.segments.popleft()
+        session.segments_dropped += 1
+        _stats['segments_dropped'] += 1
+        print(f"[AUDIO STREAM] Transcription is behind for {session.sid}, dropped the oldest segment")
+    session.segments.append(segment)
+    _stats['segments'] += 1
+    if session.draining:
+        return
+    try:
+        socket_job_pool.submit('audio_segment', session.user_id or session.sid, _drain_segments, session)
+        session.draining = True
+    except JobRejected as e:
+        session.segments.clear()
+        sio.emit('audio_upload_failed', {"error": str(e)}, room=session.sid)
+
+
+def _drain_segments(session):
+    final = False
+    with session.app.app_context():
+        while True:
+            with session.lock:
+                if not session.segments:
+                    session.draining = False
+                    if session.ended and not final:
+                        _emit_transcript(session, '', {}, final=True)
+                    return
+                segment = session.segments.popleft()
+                final = session.ended and not session.segments
+            try:
+                _transcribe_segment(session, segment, final)
+            except Exception as e:
+                _stats['transcription_failures'] += 1
+                current_app.logger.error(f"Error transcribing audio segment: {str(e)}")
+                sio.emit('audio_upload_failed', {"error": str(e)}, room=session.sid)
+            finally:
+                db.session.remove()
+
+
+def _transcribe_segment(session, pcm, final):
+    from models.message import Message
+
+    if session.avatar is None and session.user_id:
+        profile = presence_cache.user_profile(session.user_id)
+        session.avatar = (profile['avatar'] if profile else None) or ''
+
+    seconds = len(pcm) / (session.segmenter.sample_rate * 2)
+    previous = ' '.join(session.transcript)
+    transcript = openAI_client.audio.transcriptions.create(
+        model="whisper-1",
+        file=("segment.wav", pcm_to_wav(pcm, session.segmenter.sample_rate)),
+        prompt=previous[-_PROMPT_CONTEXT_CHARS:]
+    )
+    log_transcription('audio_stream', seconds, transcript)
+
+    # Whisper and the segment's translations are charged through the token ledger
+    billing = TranslationBilling()
+    payer_id = session.payer_id if session.payer_id and billing.payer_exists(session.payer_id) else None
+    if payer_id:
+        billing.charge(payer_id, AUDIO_UNIT_PRICE_PER_MINUTE * seconds / 60.0)
+
+    text = transcript.text.strip()
+    translations = {}
+    try:
+        if text and session.languages:
+            results = translate_to_languages(text, session.languages, session.low_cost_mode,
+                                             room=session.chatroom_id, mainstream=True)
+            price_key = 'price_gpt4o_mini' if session.low_cost_mode == '1' else 'price_gpt4o'
+            for language, (translated, response) in results.items():
+                translations[language] = translated
+                if payer_id and response is not None:
+                    billing.charge(payer_id, Message._token_usage(response)[price_key])
+    finally:
+        db.session.commit()
+        billing.apply()
+    if text:
+        session.transcript.append(text)
+        for language, translated in translations.items():
+            session.translations.setdefault(language, []).append(translated)
+    session.segments_done += 1
+    _emit_transcript(session, text, translations, final=final)
+
+
+def _emit_transcript(session, segment_text, segment_translations, final=False):
+    sio.emit('user_speaking_to_client_content_transcript', {
+        'userId': session.user_id,
+        'username': session.username,
+        'avatar': session.avatar or None,
+        'streamingTranscript': ' '.join(session.transcript),
+        'streamingTranslations': {language: ' '.join(parts) for language, parts in session.translations.items()},
+        'segmentIndex': session.segments_done - 1,
+        'segmentText': segment_text,
+        'segmentTranslations': segment_translations,
+        'final': final,
+        'source': 'server',
+    }, room=session.room)
+
+
+def audio_stream_stats():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        stats = dict(_stats)
+    stats.update({
+        'vad': 'webrtcvad' if webrtcvad is not None else 'energy',
+        'active_streams': len(sessions),
+        'buffered_ms': sum(session.segmenter.buffered_ms() for session in sessions),
+        'pending_segments': sum(len(session.segments) for session in sessions),
+    })
+    return stats
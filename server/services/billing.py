@@ -0,0 +1,203 @@
+"""
+Billing Service - Translation view charges through the token ledger
+Business logic for billing
+
+Serving a translation no longer locks the payer's user row. Charges are
+summed per payer for the request into one token_ledger entry, committed with
+the request's translation views, and then applied to User.tokens in one
+atomic decrement. Entries that were committed but never applied (the worker
+died, the decrement timed out) are applied by reconcile_token_ledger.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, select, inspect
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models.token_ledger import TokenLedger
+from models.message_translation import TranslationView
+from config.constants import BILLING_RECONCILE_GRACE_SECONDS, BILLING_RECONCILE_BATCH_SIZE
+
+_VIEW_PREFETCH_CHUNK = 500  # Message ids per IN list
+
+
+class TranslationBilling:
+    """
+    Charges collected while serving one request
+
+    Usage:
+        billing = TranslationBilling()
+        message.get_translation_priced(user_id, language, low_cost_mode, billing=billing)
+        db.session.commit()
+        billing.apply()
+
+    For a page of messages, billing.prefetch_views(user_id, message_ids)
+    first, and billing.flush_views() before the commit.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._amounts = {}
+        self._payers = {}
+        self._views = {}  # user_id -> {message_id: languages viewed}
+        self._pending_views = []
+
+    def payer_exists(self, user_id):
+        """Whether user_id is a user, looked up once per request"""
+        if user_id not in self._payers:
+            from models.user import User
+            self._payers[user_id] = db.session.query(User.id).filter_by(user_id=user_id).first() is not None
+        return self._payers[user_id]
+
+    def charge(self, user_id, price):
+        """
+        Add one translation view's price to the payer's ledger entry for this request
+
+        The entry joins the session, so it is committed together with the view.
+        """
+        if price <= 0:
+            return
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = TokenLedger(user_id=user_id, amount=0.0, views=0)
+            db.session.add(entry)
+        self._amounts[user_id] = self._amounts.get(user_id, 0.0) + price
+        entry.amount = self._amounts[user_id]
+        entry.views += 1
+
+    def prefetch_views(self, user_id, message_ids):
+        """Load which of message_ids user_id has viewed, so pricing them needs no query per message"""
+        seen = self._views.setdefault(user_id, {})
+        message_ids = [message_id for message_id in dict.fromkeys(message_ids)
+                       if message_id is not None and message_id not in seen]
+        for message_id in message_ids:
+            seen[message_id] = set()
+        for start in range(0, len(message_ids), _VIEW_PREFETCH_CHUNK):
+            rows = db.session.query(TranslationView.message_id, TranslationView.language).filter(
+                TranslationView.user_id == user_id,
+                TranslationView.message_id.in_(message_ids[start:start + _VIEW_PREFETCH_CHUNK])
+            )
+            for message_id, language in rows:
+                seen[message_id].add(language)
+
+    def viewed(self, user_id, message_id, language):
+        """
+        Returns:
+            bool: Whether user_id has viewed the translation, or None if it was not prefetched
+        """
+        seen = self._views.get(user_id, {}).get(message_id)
+        return None if seen is None else language in seen
+
+    def record_view(self, user_id, message_id, language, price):
+        """Queue a first view of a prefetched message; flush_views inserts and charges it"""
+        self._views[user_id][message_id].add(language)
+        self._pending_views.append((user_id, message_id, language, price))
+
+    def flush_views(self):
+        """
+        Insert the queued views in one batch and charge them; call before the commit
+
+        If a concurrent request recorded some of them first, the views are
+        inserted one by one and only the ones this request stored are charged.
+
+        Returns:
+            int: Views inserted
+        """
+        pending, self._pending_views = self._pending_views, []
+        if not pending:
+            return 0
+        table = TranslationView.__table__
+        now = datetime.utcnow()
+        rows = [{'message_id': message_id, 'language': language, 'user_id': user_id, 'viewed_at': now}
+                for user_id, message_id, language, _ in pending]
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert(), rows)
+            inserted = pending
+        except IntegrityError:
+            inserted = []
+            for view, row in zip(pending, rows):
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(table.insert(), [row])
+                    inserted.append(view)
+                except IntegrityError:
+                    pass
+        for user_id, _, _, price in inserted:
+            self.charge(user_id, price)
+        return len(inserted)
+
+    def apply(self):
+        """
+        Take the committed charges from the payers' tokens; call after the commit
+
+        Returns:
+            float: Total amount applied
+        """
+        applied = 0.0
+        for user_id, entry in self._entries.items():
+            identity = inspect(entry).identity  # Read without reloading the expired entry
+            amount = self._amounts[user_id]
+            if identity is None or amount <= 0:
+                continue  # Rolled back, or nothing to charge
+            try:
+                if apply_ledger_entry(identity[0], user_id, amount):
+                    applied += amount
+            except Exception as e:
+                # Left unapplied; reconcile_token_ledger retries it
+                print(f"[BILLING] Could not apply ledger entry {identity[0]} for {user_id}: {str(e)}")
+        self._entries = {}
+        self._amounts = {}
+        return applied
+
+
+def apply_ledger_entry(entry_id, user_id, amount):
+    """
+    Mark a ledger entry applied and take its amount from the user, atomically
+
+    Returns:
+        bool: False if the entry had already been applied
+    """
+    from models.user import User
+    ledger = TokenLedger.__table__
+    users = User.__table__
+    with db.engine.begin() as connection:
+        marked = connection.execute(
+            update(ledger).where(ledger.c.id == entry_id, ledger.c.applied_at.is_(None))
+            .values(applied_at=datetime.utcnow())
+        ).rowcount
+        if not marked:
+            return False
+        connection.execute(
+            update(users).where(users.c.user_id == user_id).values(tokens=users.c.tokens - amount)
+        )
+    return True
+
+
+def reconcile_token_ledger(grace_seconds=BILLING_RECONCILE_GRACE_SECONDS, batch_size=BILLING_RECONCILE_BATCH_SIZE):
+    """
+    Apply ledger entries older than grace_seconds that were never applied
+
+    Returns:
+        dict: Entries applied and total amount
+    """
+    ledger = TokenLedger.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    with db.engine.connect() as connection:
+        pending = connection.execute(
+            select(ledger.c.id, ledger.c.user_id, ledger.c.amount)
+            .where(ledger.c.applied_at.is_(None), ledger.c.created_at < cutoff)
+            .order_by(ledger.c.created_at.asc()).limit(batch_size)
+        ).all()
+
+    stats = {'entries': 0, 'amount': 0.0}
+    for entry_id, user_id, amount in pending:
+        try:
+            if apply_ledger_entry(entry_id, user_id, amount or 0.0):
+                stats['entries'] += 1
+                stats['amount'] += amount or 0.0
+        except Exception as e:
+            print(f"[BILLING] Reconciliation of ledger entry {entry_id} failed: {str(e)}")
+    if stats['entries']:
+        print(f"[BILLING] Reconciled {stats['entries']} ledger entries ({stats['amount']:.6f} tokens)")
+    return stats
@@ -1,17 +1,222 @@
 """
 Debug Logging Service - API call and transcription logging
 Business logic for debug_logging
+
+DebugLog rows are written behind the request: the log functions build the row
+on the calling thread and put it on a bounded queue, and a background writer
+inserts queued rows in batches on its own connection. The caller's session is
+never touched, so logging neither commits the caller's work nor waits on the
+database. When the queue is full DEBUG_LOG_DROP_POLICY decides what is lost.
 """
+import atexit
+import os
+import queue
+import threading
 from datetime import datetime
+
 from extensions import db
 from models.debug_log import DebugLog
+from config.constants import (
+    DEBUG_LOG_WRITE_BEHIND,
+    DEBUG_LOG_QUEUE_SIZE,
+    DEBUG_LOG_BATCH_SIZE,
+    DEBUG_LOG_FLUSH_INTERVAL_SECONDS,
+    DEBUG_LOG_DROP_POLICY,
+    DEBUG_LOG_BLOCK_TIMEOUT_SECONDS
+)
+
+DROP_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+# Every row carries every column so a batch is one executemany
+_COLUMNS = tuple(column.name for column in DebugLog.__table__.columns if column.name != 'id')
+
+
+class DebugLogWriter:
+    """
+    Bounded queue of DebugLog rows drained by one background writer thread
+
+    Drop policies when the queue is full:
+        drop_newest: discard the row being logged
+        drop_oldest: discard the oldest queued row to make room
+        block: wait up to block_timeout seconds for room, then discard the row
+    """
+
+    def __init__(self, max_queue=DEBUG_LOG_QUEUE_SIZE, batch_size=DEBUG_LOG_BATCH_SIZE,
+                 flush_interval=DEBUG_LOG_FLUSH_INTERVAL_SECONDS, drop_policy=DEBUG_LOG_DROP_POLICY,
+                 block_timeout=DEBUG_LOG_BLOCK_TIMEOUT_SECONDS, write_behind=DEBUG_LOG_WRITE_BEHIND):
+        if drop_policy not in DROP_POLICIES:
+            print(f"[DEBUG LOG] Unknown drop policy {drop_policy!r}, using drop_newest")
+            drop_policy = 'drop_newest'
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._app = None
+        self._pid = None
+        self._worker = None
+        self._closed = not write_behind
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._batches = 0
+
+    def submit(self, row):
+        """
+        Queue a DebugLog row (a dict of column values) for the writer
+
+        Returns:
+            bool: False if the row was dropped
+        """
+        if self._closed:
+            return self._write_now([row])
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if not self._put_when_full(row):
+                with self._lock:
+                    self._dropped += 1
+                return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _put_when_full(self, row):
+        if self.drop_policy == 'block':
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+        if self.drop_policy == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+                with self._lock:
+                    self._dropped += 1
+                self._queue.put_nowait(row)
+                return True
+            except (queue.Empty, queue.Full):
+                return False
+        return False
+
+    def _ensure_worker(self):
+        # Started lazily from the first log call and restarted after a fork (gunicorn preload_app)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            from flask import current_app
+            self._app = current_app._get_current_object()
+            self._worker = threading.Thread(target=self._work, name='debug-log-writer', daemon=True)
+            self._worker.start()
+            self._pid = os.getpid()
+
+    def _next_batch(self):
+        """Block for the first row, then take what else is queued up to batch_size"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while not self._closed:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, rows):
+        """Insert rows in one statement on the writer's own connection"""
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        DebugLog.__table__.insert(),
+                        [{column: row.get(column) for column in _COLUMNS} for row in rows]
+                    )
+        except Exception as e:
+            with self._lock:
+                self._failed += len(rows)
+            print(f"[DEBUG LOG] Failed to write {len(rows)} debug log rows: {str(e)}")
+            return False
+        with self._lock:
+            self._written += len(rows)
+            self._batches += 1
+        return True
+
+    def _write_now(self, rows):
+        # Writer is gone (shutdown, or write-behind disabled): insert on the caller's thread
+        if self._app is None:
+            from flask import current_app
+            self._app = current_app._get_current_object()
+        return self._write(rows)
+
+    def flush(self):
+        """
+        Write every queued row on the calling thread
+
+        Returns:
+            int: Rows taken from the queue
+        """
+        taken = 0
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return taken
+            taken += len(batch)
+            self._write(batch)
+
+    def close(self):
+        """Stop the writer and flush what is left; later rows are written synchronously"""
+        self._closed = True
+        if self._app is None:
+            return
+        flushed = self.flush()
+        if flushed:
+            print(f"[DEBUG LOG] Flushed {flushed} debug log rows on shutdown")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'write_behind': not self._closed,
+                'drop_policy': self.drop_policy,
+                'queue_depth': self._queue.qsize(),
+                'queue_size': self._queue.maxsize,
+                'batch_size': self.batch_size,
+                'enqueued': self._enqueued,
+                'written': self._written,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'batches': self._batches,
+                'worker_alive': bool(self._worker and self._worker.is_alive())
+            }
+
+
+debug_log_writer = DebugLogWriter()
+atexit.register(debug_log_writer.close)
+
 
 def log_api_call(function_name, input_text, response, model_used):
     try:
-        debug_log = DebugLog(
-            function_name=function_name,
-            input_text=input_text,
-            response={
+        debug_log_writer.submit({
+            'timestamp': datetime.utcnow(),
+            'function_name': function_name,
+            'input_text': input_text,
+            'response': {
                 'model': response.model,
                 'content': response.choices[0].message.content if hasattr(response.choices[0], 'message') else response.text,
                 'usage': {
@@ -20,34 +225,29 @@ def log_api_call(function_name, input_text, response, model_used):
                     'total_tokens': getattr(response.usage, 'total_tokens', 0)
                 }
             },
-            model_used=model_used,
-            tokens_used=getattr(response.usage, 'total_tokens', 0)
-        )
-        db.session.add(debug_log)
-        db.session.commit()
+            'model_used': model_used,
+            'tokens_used': getattr(response.usage, 'total_tokens', 0)
+        })
     except Exception as e:
-        from flask import current_app
-        current_app.logger.error(f"Error logging API call: {str(e)}")
+        print(f"[DEBUG LOG] Error logging API call: {str(e)}")
 
 def log_transcription(function_name, file_duration, response):
     try:
-        debug_log = DebugLog(
-            function_name=function_name,
-            input_type='audio',
-            input_text=f"Audio file (duration: {file_duration:.2f}s)",
-            response={
+        debug_log_writer.submit({
+            'timestamp': datetime.utcnow(),
+            'function_name': function_name,
+            'input_type': 'audio',
+            'input_text': f"Audio file (duration: {file_duration:.2f}s)",
+            'response': {
                 'model': 'whisper-1 ',
                 'text': response.text,
                 'duration': file_duration
             },
-            model_used='whisper-1',
-            duration=file_duration
-        )
-        db.session.add(debug_log)
-        db.session.commit()
+            'model_used': 'whisper-1',
+            'duration': file_duration
+        })
     except Exception as e:
-        from flask import current_app
-        current_app.logger.error(f"Error logging transcription: {str(e)}")
+        print(f"[DEBUG LOG] Error logging transcription: {str(e)}")
 
 # Stub function for backwards compatibility
 def log_debug_info(*args, **kwargs):
@@ -1,39 +1,122 @@
 """
 Encryption Service
 Simple XOR-based encryption/decryption for text
+
+Stored values carry a codec version so they can be re-encoded over time:
+    v0: every code point XOR 42, no prefix (the original format)
+    v1: CODEC_MARKER + '1' + base64 of the UTF-8 bytes XOR 42
+Reads accept every version; writes use ENCRYPTION_CODEC_VERSION.
 """
+import base64
+import binascii
+
+from config.constants import ENCRYPTION_CODEC_VERSION
+
+_KEY = 42  # Simple encryption key
+
+# v0 output starts with U+FFD5 only for text starting with the noncharacter
+# U+FFFF, so the marker never collides with legacy data
+CODEC_MARKER = '\uffd5'
+
+
+class _XorTable(dict):
+    """str.translate table for v0: code point -> code point XOR key, filled on first use"""
+
+    def __missing__(self, codepoint):
+        self[codepoint] = value = codepoint ^ _KEY
+        return value
+
+
+_V0_TABLE = _XorTable()
+_V1_TABLE = bytes(byte ^ _KEY for byte in range(256))
+
+
+def _encode_v0(text):
+    return text.translate(_V0_TABLE)
+
+
+def _decode_v0(stored):
+    return stored.translate(_V0_TABLE)  # XOR is its own inverse
+
+
+def _encode_v1(text):
+    payload = text.encode('utf-8', 'surrogatepass').translate(_V1_TABLE)
+    return CODEC_MARKER + '1' + base64.b64encode(payload).decode('ascii')
+
+
+def _decode_v1(stored):
+    payload = base64.b64decode(stored[2:])
+    return payload.translate(_V1_TABLE).decode('utf-8', 'surrogatepass')
+
+
+_ENCODERS = {0: _encode_v0, 1: _encode_v1}
+_DECODERS = {0: _decode_v0, 1: _decode_v1}
 
 
-def simple_encrypt(text):
+def codec_version(stored):
+    """
+    Codec version of a stored value
+
+    Args:
+        stored (str): Encrypted value
+
+    Returns:
+        int: 0 for legacy values, otherwise the version in the prefix
+    """
+    if len(stored) >= 2 and stored[0] == CODEC_MARKER and stored[1].isdigit():
+        return int(stored[1])
+    return 0
+
+
+def simple_encrypt(text, version=None):
     """
     Fast bitwise XOR encryption
-    
+
     Args:
         text (str): Text to encrypt
-        
+        version (int): Codec version; defaults to ENCRYPTION_CODEC_VERSION
+
     Returns:
         str: Encrypted text, or None if input is empty
     """
     if not text:
         return None
-    key = 42  # Simple encryption key
-    return ''.join(chr(ord(c) ^ key) for c in text)
+    return _ENCODERS[ENCRYPTION_CODEC_VERSION if version is None else version](text)
 
 
 def simple_decrypt(encrypted_text):
     """
-    Fast bitwise XOR decryption (same as encryption)
-    XOR is its own inverse operation
-    
+    Fast bitwise XOR decryption of a value written by any codec version
+
     Args:
         encrypted_text (str): Text to decrypt
-        
+
     Returns:
         str: Decrypted text, or None if input is empty
     """
     if not encrypted_text:
         return None
-    return simple_encrypt(encrypted_text)  # XOR is its own inverse
+    if encrypted_text[0] != CODEC_MARKER:
+        return encrypted_text.translate(_V0_TABLE)  # Legacy value; the common case
+    decode = _DECODERS.get(codec_version(encrypted_text), _decode_v0)
+    try:
+        return decode(encrypted_text)
+    except (binascii.Error, UnicodeDecodeError):
+        # Not a valid value of that version after all: read it as legacy
+        return _decode_v0(encrypted_text)
+
+
+def reencode(encrypted_text, version=None):
+    """
+    Re-encrypt a stored value with another codec version
+
+    Returns:
+        str: The value unchanged if it already uses that version
+    """
+    version = ENCRYPTION_CODEC_VERSION if version is None else version
+    if not encrypted_text or codec_version(encrypted_text) == version:
+        return encrypted_text
+    return simple_encrypt(simple_decrypt(encrypted_text), version)
 
 # Aliases for backwards compatibility
 encrypt_data = simple_encrypt
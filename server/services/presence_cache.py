@@ -0,0 +1,267 @@
+"""
+Presence Cache Service - Room membership and user profiles for socket events
+Business logic for presence_cache
+
+join_room and the user_speaking_* events used to query the database on every
+event. Membership (the user ids of a chatroom's participants) and user
+profiles (username, avatar) are now read through the same local + shared
+(Redis) tiers as the translation cache. Routes that change membership or a
+profile invalidate the entry, and join_room's last_used_chatroom_id updates
+are written in batches by LastUsedRoomWriter.
+
+With Redis, invalidations are also published on a channel every worker
+listens to, so no worker keeps serving its local copy of a changed entry.
+Without Redis the cache is per process and only this worker sees them.
+"""
+import atexit
+import os
+import threading
+import time
+
+from sqlalchemy import select, update, bindparam
+
+from extensions import db, redis_client
+from services.translation_cache import LRUCacheTier, RedisCacheTier
+from config.constants import (
+    PRESENCE_CACHE_LOCAL_TTL_SECONDS,
+    PRESENCE_CACHE_SHARED_TTL_SECONDS,
+    PRESENCE_CACHE_MAX_ENTRIES,
+    LAST_USED_ROOM_FLUSH_SECONDS
+)
+
+
+class PresenceCache:
+    """
+    Read-through membership and profile cache; every miss is one small query
+
+    Args:
+        tiers (list): Cache tiers, fastest first
+        client: Redis client used to broadcast invalidations, or None
+        channel (str): Pub/sub channel for invalidations
+    """
+
+    def __init__(self, tiers, client=None, channel='presence:invalidate'):
+        self.tiers = list(tiers)
+        self.local_tiers = [tier for tier in self.tiers if isinstance(tier, LRUCacheTier)]
+        self.client = client
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._pid = None
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'remote_invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _get(self, key, load):
+        self._ensure_listener()
+        for index, tier in enumerate(self.tiers):
+            payload = tier.get(key)
+            if payload is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(key, payload)
+                self._count('hits')
+                return payload
+        self._count('misses')
+        payload = load()
+        if payload is not None:  # Missing rooms and users are not cached
+            for tier in self.tiers:
+                tier.set(key, payload)
+        return payload
+
+    def _delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+        self._count('invalidations')
+        if self.client is not None:
+            try:
+                self.client.publish(self.channel, key)
+            except Exception as e:
+                print(f"[PRESENCE] Failed to broadcast invalidation of {key}: {str(e)}")
+
+    def _ensure_listener(self):
+        # Started before this worker first fills its local tier, and restarted after a fork
+        if self.client is None or not self.local_tiers or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._listen, name='presence-invalidations', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _listen(self):
+        """Drop local copies of entries other workers invalidate"""
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                # Invalidations published while unsubscribed are lost; start clean
+                for tier in self.local_tiers:
+                    tier.clear()
+                for message in pubsub.listen():
+                    key = message['data']
+                    key = key.decode('utf-8') if isinstance(key, bytes) else key
+                    for tier in self.local_tiers:
+                        tier.delete(key)
+                    self._count('remote_invalidations')
+            except Exception as e:
+                print(f"[PRESENCE] Invalidation listener failed, resubscribing: {str(e)}")
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def room_members(self, chatroom_id):
+        """
+        User ids of a chatroom's participants
+
+        Returns:
+            frozenset: Participant user ids, or None if the chatroom does not exist
+        """
+        members = self._get(f'members:{int(chatroom_id)}', lambda: _load_room_members(int(chatroom_id)))
+        return frozenset(members) if members is not None else None
+
+    def user_profile(self, user_id):
+        """
+        Returns:
+            dict: username and avatar, or None if the user does not exist
+        """
+        return self._get(f'user:{user_id}', lambda: _load_user_profile(user_id))
+
+    def invalidate_room(self, chatroom_id):
+        """Call after a chatroom's participants change"""
+        self._delete(f'members:{int(chatroom_id)}')
+
+    def invalidate_user(self, user_id):
+        """Call after a user's username or avatar changes"""
+        self._delete(f'user:{user_id}')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        for tier in self.local_tiers:
+            stats['local_size'] = len(tier)
+        stats['tiers'] = [tier.name for tier in self.tiers]
+        stats['broadcast_invalidations'] = self.client is not None
+        return stats
+
+
+def _load_room_members(chatroom_id):
+    from models.chatroom import ChatRoom
+    from models.associations import user_chatroom
+    if db.session.query(ChatRoom.id).filter_by(id=chatroom_id).first() is None:
+        return None
+    rows = db.session.execute(select(user_chatroom.c.user_id).where(user_chatroom.c.chatroom_id == chatroom_id))
+    return [row[0] for row in rows]
+
+
+def _load_user_profile(user_id):
+    from models.user import User
+    row = db.session.query(User.username, User.avatar).filter_by(user_id=user_id).first()
+    return {'username': row.username, 'avatar': row.avatar} if row else None
+
+
+def create_presence_cache():
+    """Build the process-wide cache from configuration"""
+    tiers = [LRUCacheTier(PRESENCE_CACHE_MAX_ENTRIES, PRESENCE_CACHE_LOCAL_TTL_SECONDS)]
+    if redis_client is not None:
+        tiers.append(RedisCacheTier(redis_client, PRESENCE_CACHE_SHARED_TTL_SECONDS, prefix='presence:'))
+    return PresenceCache(tiers, client=redis_client)
+
+
+presence_cache = create_presence_cache()
+
+
+class LastUsedRoomWriter:
+    """
+    Coalesces last_used_chatroom_id updates
+
+    Joins only record the room; a background thread writes the latest room
+    of every user who joined since the last flush in one executemany.
+    """
+
+    def __init__(self, flush_interval=LAST_USED_ROOM_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._pid = None
+        self._recorded = 0
+        self._written = 0
+        self._failed = 0
+
+    def record(self, user_id, chatroom_id):
+        """Remember user_id's room; call inside the app context"""
+        self._ensure_worker()
+        with self._lock:
+            self._pending[user_id] = chatroom_id
+            self._recorded += 1
+
+    def pending(self, user_id):
+        """The room recorded for user_id that is not written yet, or None"""
+        with self._lock:
+            return self._pending.get(user_id)
+
+    def _ensure_worker(self):
+        # Started lazily from the first join and restarted after a fork (gunicorn preload_app)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            from flask import current_app
+            self._app = current_app._get_current_object()
+            threading.Thread(target=self._work, name='last-used-room-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending rooms
+
+        Returns:
+            int: Users updated
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self._app is None:
+            return 0
+        from models.user import User
+        users = User.__table__
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        update(users).where(users.c.user_id == bindparam('b_user_id'))
+                        .values(last_used_chatroom_id=bindparam('b_chatroom_id')),
+                        [{'b_user_id': user_id, 'b_chatroom_id': chatroom_id} for user_id, chatroom_id in pending.items()]
+                    )
+        except Exception as e:
+            with self._lock:
+                self._failed += len(pending)
+                for user_id, chatroom_id in pending.items():
+                    self._pending.setdefault(user_id, chatroom_id)  # Retried next flush unless superseded
+            print(f"[PRESENCE] Failed to write last used chatroom for {len(pending)} users: {str(e)}")
+            return 0
+        with self._lock:
+            self._written += len(pending)
+        return len(pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'recorded': self._recorded,
+                'written': self._written,
+                'failed': self._failed
+            }
+
+
+last_used_room_writer = LastUsedRoomWriter()
+atexit.register(last_used_room_writer.flush)
@@ -0,0 +1,231 @@
+"""
+Single-Flight Service
+Coalesces concurrent identical work so one caller does it and the rest share
+the result: in-process by sharing one Future, across gunicorn workers through
+a Redis lease plus a short-lived result slot
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+# Delete the lease only if this caller still owns it
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _SharedWait:
+    """A Future waiting on another worker's lease for key"""
+
+    def __init__(self, future, submit_work, encode, decode, give_up_at):
+        self.future = future
+        self.submit_work = submit_work
+        self.encode = encode
+        self.decode = decode
+        self.give_up_at = give_up_at
+
+
+class SingleFlight:
+    """
+    Coalescing happens before the work is submitted: only the leader's
+    submit_work() runs, and followers in other workers wait on a Future that
+    one background thread per process resolves by polling Redis, so no
+    executor thread is ever spent waiting on another worker.
+
+    Args:
+        client: Redis client, or None to coalesce within this process only
+        lease_seconds (float): Lease lifetime; must exceed the slowest call
+        wait_seconds (float): How long a follower waits before doing the work itself
+        result_ttl_seconds (float): How long a finished result is shared
+    """
+
+    def __init__(self, client=None, prefix='sflight:', lease_seconds=60, wait_seconds=10,
+                 result_ttl_seconds=60, poll_interval=0.05):
+        self.client = client
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+        self._futures = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._waiting_changed = threading.Condition(self._lock)
+        self._pid = None
+        self._counters = {'leaders': 0, 'local_followers': 0, 'shared_followers': 0, 'shared_fallbacks': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _lease_key(self, key):
+        return f"{self.prefix}lease:{key}"
+
+    def _result_key(self, key):
+        return f"{self.prefix}result:{key}"
+
+    def submit(self, key, submit_work, encode=lambda result: result, decode=lambda payload: payload):
+        """
+        Return the in-flight Future for key, or start one
+
+        Without Redis, or when this worker wins the lease, submit_work() is
+        called. If another worker holds the lease, the returned Future
+        resolves to that worker's published result instead.
+
+        Args:
+            key (str): Work identity
+            submit_work (callable): Starts the work and returns a Future
+            encode/decode (callable): Convert the result to and from a
+                                      JSON-serializable value for Redis
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self._counters['local_followers'] += 1
+                return future
+            if self.client is None:
+                future = submit_work()
+            else:
+                future = Future()
+            self._futures[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        if self.client is not None:
+            self._coordinate(key, future, submit_work, encode, decode)
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def _coordinate(self, key, future, submit_work, encode, decode):
+        # Two quick Redis calls on the caller's thread; waiting, if any, happens in _poll_shared
+        token = uuid.uuid4().hex
+        try:
+            raw = self.client.get(self._result_key(key))
+            if raw is not None:
+                self._count('shared_followers')
+                future.set_result(decode(json.loads(raw)))
+                return
+            leased = self.client.set(self._lease_key(key), token, nx=True, px=int(self.lease_seconds * 1000))
+        except Exception as e:
+            print(f"[SINGLE FLIGHT] Shared coordination failed for {key}: {str(e)}")
+            self._lead(key, future, submit_work, encode, None)
+            return
+        if leased:
+            self._count('leaders')
+            self._lead(key, future, submit_work, encode, token)
+            return
+        with self._waiting_changed:
+            self._ensure_poller()
+            self._waiting[key] = _SharedWait(future, submit_work, encode, decode,
+                                             time.monotonic() + self.wait_seconds)
+            self._waiting_changed.notify()
+
+    def _lead(self, key, future, submit_work, encode, token):
+        """Do the work; publish the result and release the lease (when token is set) once it lands"""
+        try:
+            work = submit_work()
+        except Exception as e:
+            self._release(key, token)
+            future.set_exception(e)
+            return
+
+        def finish(done):
+            error = done.exception()
+            if error is None and token is not None:
+                try:
+                    self.client.set(self._result_key(key), json.dumps(encode(done.result()), ensure_ascii=False),
+                                    px=int(self.result_ttl_seconds * 1000))
+                except Exception as e:
+                    print(f"[SINGLE FLIGHT] Failed to publish result for {key}: {str(e)}")
+            self._release(key, token)
+            if error is None:
+                future.set_result(done.result())
+            else:
+                future.set_exception(error)
+
+        work.add_done_callback(finish)
+
+    def _release(self, key, token):
+        if token is None:
+            return
+        try:
+            self.client.eval(_RELEASE_LEASE_SCRIPT, 1, self._lease_key(key), token)
+        except Exception:
+            pass  # The lease expires on its own
+
+    def _ensure_poller(self):
+        # Started lazily under _lock and restarted after a fork (gunicorn preload_app)
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._poll_shared, name='single-flight-poller', daemon=True).start()
+
+    def _poll_shared(self):
+        """Resolve waiting followers: one pipelined round trip per poll covers every key"""
+        while True:
+            with self._waiting_changed:
+                while not self._waiting:
+                    self._waiting_changed.wait()
+                waiting = list(self._waiting.items())
+            time.sleep(self.poll_interval)
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for key, _ in waiting:
+                    pipe.get(self._result_key(key))
+                    pipe.exists(self._lease_key(key))
+                replies = pipe.execute()
+            except Exception as e:
+                print(f"[SINGLE FLIGHT] Shared coordination failed for {len(waiting)} keys: {str(e)}")
+                replies = None
+            now = time.monotonic()
+            for index, (key, wait) in enumerate(waiting):
+                if replies is not None:
+                    raw, leased = replies[2 * index], replies[2 * index + 1]
+                    if raw is not None:
+                        self._resolve(key, wait, raw)
+                        continue
+                    if not leased:
+                        # The leader failed or died without a result; one follower retries
+                        token = uuid.uuid4().hex
+                        if self._acquire(key, token):
+                            self._stop_waiting(key, 'leaders')
+                            self._lead(key, wait.future, wait.submit_work, wait.encode, token)
+                        continue
+                    if now < wait.give_up_at:
+                        continue
+                self._stop_waiting(key, 'shared_fallbacks')
+                self._lead(key, wait.future, wait.submit_work, wait.encode, None)
+
+    def _acquire(self, key, token):
+        try:
+            return self.client.set(self._lease_key(key), token, nx=True, px=int(self.lease_seconds * 1000))
+        except Exception:
+            return False
+
+    def _stop_waiting(self, key, counter):
+        with self._lock:
+            self._waiting.pop(key, None)
+            self._counters[counter] += 1
+
+    def _resolve(self, key, wait, raw):
+        self._stop_waiting(key, 'shared_followers')
+        try:
+            wait.future.set_result(wait.decode(json.loads(raw)))
+        except Exception as e:
+            wait.future.set_exception(e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._futures)
+            stats['waiting_on_other_workers'] = len(self._waiting)
+        return stats
+
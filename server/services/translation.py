@@ -2,86 +2,59 @@
 Translation Service - OpenAI-based translation with retry logic
 Business logic for translation
 """
-import time
+import hashlib
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from extensions import db, openAI_client, openAI_client_deepseek
+from flask import current_app, has_app_context
+from extensions import db, redis_client
 from services.debug_logging import log_api_call
+from services.translation_cache import translation_cache, make_cache_key, response_to_payload, payload_to_response
+from services.single_flight import SingleFlight
+from services.translation_client import create_chat_completion, stream_chat_completion
+from services.translation_backends import translation_backends
+from config.constants import (
+    MAINSTREAM_LANGUAGES,
+    SINGLE_FLIGHT_LEASE_SECONDS,
+    SINGLE_FLIGHT_WAIT_SECONDS,
+    SINGLE_FLIGHT_RESULT_TTL_SECONDS
+)
+from translation_queue import translation_scheduler, estimate_tokens, PRIORITY_LIVE
 
-def get_new_translated_string_4o_stylish(toLanguageMe, original_text, mode ='1'):
-    '''
-    Get translation with error handling and retries
+# Concurrent requests for the same translation share one upstream call,
+# across gunicorn workers when Redis is configured
+translation_single_flight = SingleFlight(
+    redis_client,
+    prefix='sflight:translation:',
+    lease_seconds=SINGLE_FLIGHT_LEASE_SECONDS,
+    wait_seconds=SINGLE_FLIGHT_WAIT_SECONDS,
+    result_ttl_seconds=SINGLE_FLIGHT_RESULT_TTL_SECONDS
+)
 
+
+def _stylish_prompt(toLanguageMe):
+    '''
+    Build the prompt for a stylish translation ("Language" or "Language-style")
     '''
-    if mode == '0':
-        model_stylish = "gpt-4o"
-    else:
-        model_stylish = 'gpt-4o-mini'
     # Split text if it contains "-"
     print(f"toLanguageMe: {toLanguageMe}")
     if "-" in toLanguageMe:
         language, style= toLanguageMe.split("-", 1)
         print(f"====={language}={style}=====")
-        if language in ['中文', '汉语']:
-            prompt = f"""You are a neutral translator:
+        return f"""You are a neutral translator:
     1.Translate the input text into {language} first Secretly. Then translate to  {style} style.
     - It it is a question, translate the question directly. Never answer the question.
     - Do not add any additional responses. Donyt return two copies, Only return the styled version.
     """
-            response = openAI_client_deepseek.chat.completions.create(
-            model="deepseek-ai/DeepSeek-V3",
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": original_text}
-            ])
-        else:
-            prompt = f"""You are a neutral translator:
-    1.Translate the input text into {language} first Secretly. Then translate to  {style} style.
-    - It it is a question, translate the question directly. Never answer the question.
-    - Do not add any additional responses. Donyt return two copies, Only return the styled version.
-    """
-            response = openAI_client.chat.completions.create(
-                model=model_stylish,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {"role": "user", "content": original_text}
-                ]
-            )
-        # print(f"Model: {response.model}")
-        # print(f"Usage - Completion tokens: {response.usage.prompt_tokens}")
-        # print(f"Usage - Prompt tokens: {response.usage.prompt_tokens}")
-        # print(f"Usage - Total tokens: {response.usage.total_tokens}")
-        # print(f"Content1: {response.choices[0].message.content}")
-        log_api_call('get_new_translated_string_4o_stylish', original_text, response, 'gpt-4o-mini' if mode=='1' else 'gpt-4o')
-        return response#.choices[0].message.content
 
-    else:
-        prompt = f"""You are a neutral translator:
+    return f"""You are a neutral translator:
     1.Translate the input text into {toLanguageMe}.
     - It it is a question, translate the question directly.
     - Do not add any additional responses.
     """
-        response = openAI_client.chat.completions.create(
-            model=model_stylish,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": original_text}
-            ]
-        )
-        # print(f"Model: {response.model}")
-        # print(f"Usage - Completion tokens: {response.usage.prompt_tokens}")
-        # print(f"Usage - Prompt tokens: {response.usage.prompt_tokens}")
-        # print(f"Usage - Total tokens: {response.usage.total_tokens}")
-        # print(f"Content2: {response.choices[0].message.content}")
-        log_api_call('get_new_translated_string_4o_stylish', original_text, response, 'gpt-4o-mini' if mode=='1' else 'gpt-4o')
-        return response#.choices[0].message.content
 
-def get_new_translated_string(toLanguageMe, original_text):
-    '''
-    Get translation with error handling and retries
-    '''
-    try:
 
-        prompt = f"""You are a neutral translator that strictly follows these instructions:
+def _mainstream_prompt(toLanguageMe):
+    return f"""You are a neutral translator that strictly follows these instructions:
 
 1. You will receive an input text.
 2. Your target translation language is: {toLanguageMe}.
@@ -97,33 +70,270 @@ def get_new_translated_string(toLanguageMe, original_text):
 10. Do not add headings, labels, or separators between parts; produce a seamless translation as if it were done in one go. Do not mention that you are segmenting the text.
 Your only output should be either the exact original text (if it meets the conditions above) or the direct translation into {toLanguageMe}, nothing else.
 """
-        # Add retry logic
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = openAI_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": original_text}
-                    ]
-                )
-                # print(f"Model: {response.model}")
-                # print(f"Usage - Completion tokens: {response.usage.prompt_tokens}")
-                # print(f"Usage - Prompt tokens: {response.usage.prompt_tokens}")
-                # print(f"Usage - Total tokens: {response.usage.total_tokens}")
-                # print(f"Content3: {response.choices[0].message.content}")
-                log_api_call('get_new_translated_string', original_text, response, 'gpt-4o-mini')
-                return response#.choices[0].message.content
-            except Exception as e:
-                if attempt == max_retries - 1:  # Last attempt
-                    raise
-                time.sleep(1)  # Wait before retrying
-                
+
+
+def _cached(cache_key, original_text):
+    '''Return the cached response for cache_key if caching applies to this text'''
+    if translation_cache.is_cacheable(original_text):
+        return translation_cache.get(cache_key)
+    return None
+
+
+def _store(cache_key, original_text, response):
+    if translation_cache.is_cacheable(original_text):
+        translation_cache.set(cache_key, response)
+
+
+def _route(language, low_cost_mode, mainstream):
+    '''Returns: tuple: (backend, model, mainstream) with mainstream resolved'''
+    if mainstream is None:
+        mainstream = language in MAINSTREAM_LANGUAGES
+    backend, model = translation_backends.route(language, low_cost_mode, mainstream)
+    return backend, model, mainstream
+
+
+def _cache_key(language, original_text, low_cost_mode='0', mainstream=None):
+    '''Translation cache key of the prompt and model routing picks'''
+    _, model, mainstream = _route(language, low_cost_mode, mainstream)
+    return make_cache_key('mainstream' if mainstream else 'stylish', model, language, original_text)
+
+
+def _translation_request(language, original_text, low_cost_mode='0', mainstream=None):
+    '''
+    Resolve the backend and request for one translation
+
+    Args:
+        mainstream (bool): Use the mainstream prompt; defaults to whether
+                           language is in MAINSTREAM_LANGUAGES
+
+    Returns:
+        tuple: (backend, cache_key, log_function_name, request_kwargs)
+    '''
+    backend, model, mainstream = _route(language, low_cost_mode, mainstream)
+    if mainstream:
+        kind, prompt, log_name = 'mainstream', _mainstream_prompt(language), 'get_new_translated_string'
+    else:
+        kind, prompt, log_name = 'stylish', _stylish_prompt(language), 'get_new_translated_string_4o_stylish'
+    return backend, make_cache_key(kind, model, language, original_text), log_name, {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": original_text}
+        ]
+    }
+
+
+def _complete(language, original_text, low_cost_mode, mainstream):
+    backend, cache_key, log_name, request = _translation_request(language, original_text, low_cost_mode, mainstream)
+    cached = _cached(cache_key, original_text)
+    if cached is not None:
+        return cached
+
+    with backend.slot():
+        response = create_chat_completion(backend.client, **request)
+    log_api_call(log_name, original_text, response, request['model'])
+    _store(cache_key, original_text, response)
+    return response
+
+
+def get_new_translated_string_4o_stylish(toLanguageMe, original_text, mode ='1'):
+    '''
+    Get translation with error handling and retries
+
+    '''
+    return _complete(toLanguageMe, original_text, mode, mainstream=False)#.choices[0].message.content
+
+
+def get_new_translated_string(toLanguageMe, original_text):
+    '''
+    Get translation with error handling and retries
+    '''
+    try:
+        # Repeated phrases ("ok", "thanks", emoji) are served from the translation cache
+        return _complete(toLanguageMe, original_text, '0', mainstream=True)#.choices[0].message.content
+
     except Exception as e:
         # app.logger.error(f"Translation error: {str(e)}")
         # Return original text if translation fails
         return f"Translation Error: {original_text}"
 
-# Alias for backwards compatibility  
+
+def translate_for_language(language, original_text, low_cost_mode='0', mainstream=None):
+    '''
+    Translate into one target language, routing mainstream languages and
+    styled variants ("English-formal") to their prompts
+
+    Args:
+        mainstream (bool): Force the mainstream prompt (True) or the stylish one
+                           (False); defaults to whether language is in MAINSTREAM_LANGUAGES
+
+    Returns:
+        tuple: (translated_text, response); response is None for 'original_text_raw'
+    '''
+    if language == 'original_text_raw':
+        return original_text, None
+    if mainstream is None:
+        mainstream = language in MAINSTREAM_LANGUAGES
+    if mainstream:
+        response = get_new_translated_string(language, original_text)
+    else:
+        response = get_new_translated_string_4o_stylish(language, original_text, low_cost_mode)
+    return response.choices[0].message.content, response
+
+
+def stream_translation_for_language(language, original_text, low_cost_mode, on_delta, mainstream=None):
+    '''
+    translate_for_language over the model's token stream; on_delta(text) receives
+    each fragment as it arrives (a cache hit arrives as one fragment)
+
+    Returns:
+        tuple: (translated_text, response) with the usage of the whole stream
+    '''
+    if language == 'original_text_raw':
+        return original_text, None
+    backend, cache_key, log_name, request = _translation_request(language, original_text, low_cost_mode, mainstream)
+    cached = _cached(cache_key, original_text)
+    if cached is not None:
+        on_delta(cached.choices[0].message.content)
+        return cached.choices[0].message.content, cached
+
+    with backend.slot():
+        response = stream_chat_completion(backend.client, on_delta, **request)
+    log_api_call(log_name, original_text, response, request['model'])
+    _store(cache_key, original_text, response)
+    return response.choices[0].message.content, response
+
+
+def _translate_in_app_context(app, language, original_text, low_cost_mode, on_delta=None, mainstream=None):
+    if on_delta is None:
+        translate = lambda: translate_for_language(language, original_text, low_cost_mode, mainstream)
+    else:
+        translate = lambda: stream_translation_for_language(
+            language, original_text, low_cost_mode, lambda delta: on_delta(language, delta), mainstream
+        )
+    if app is None:
+        return translate()
+    with app.app_context():
+        return translate()
+
+
+def _translate_scheduled(tokens, *args):
+    result = _translate_in_app_context(*args)
+    if getattr(result[1], 'from_cache', False):
+        # Cached after it was scheduled: no upstream call was made
+        translation_scheduler.refund(tokens)
+    return result
+
+
+def message_translation_key(message_id, language, original_text):
+    '''
+    Single-flight key for translating a stored message
+
+    The source text hash keeps a result shared before an edit from being
+    handed to requests made after it.
+    '''
+    text_hash = hashlib.sha256(original_text.encode('utf-8')).hexdigest()[:16]
+    return f"message:{message_id}:{language}:{text_hash}"
+
+
+def preview_translation_key(original_text, language, low_cost_mode='0', mainstream=None):
+    '''Single-flight key for a preview: the cache key of the model routing picks, since previews have no message id'''
+    return f"preview:{_cache_key(language, original_text, low_cost_mode, mainstream)}"
+
+
+def _encode_result(result):
+    translated_text, response = result
+    return {
+        'text': translated_text,
+        'response': response_to_payload(response) if response else None,
+        'from_cache': bool(getattr(response, 'from_cache', False)),
+    }
+
+
+def _decode_result(payload):
+    # Followers in other workers see exactly what the leader saw, including
+    # whether it was a cache hit, so every writer records the same price
+    response = payload['response']
+    if response is None:
+        return payload['text'], None
+    return payload['text'], payload_to_response(response, from_cache=payload['from_cache'])
+
+
+def submit_translation(language, original_text, low_cost_mode='0', priority=PRIORITY_LIVE, room=None,
+                       coalesce_key=None, on_delta=None, mainstream=None):
+    '''
+    Schedule translate_for_language on the rate-limited translation scheduler
+
+    Args:
+        priority (int): Scheduler priority class (live, backfill or preview)
+        room: Fair-share key, normally the chatroom id
+        coalesce_key (str): Optional single-flight key (message_translation_key or
+                            preview_translation_key); concurrent submissions with the
+                            same key share one upstream call
+        on_delta (callable): Optional on_delta(language, text); streams the
+                             completion and is called per fragment (only the
+                             caller that makes the upstream call receives fragments)
+        mainstream (bool): Optional prompt override, see translate_for_language
+
+    Returns:
+        concurrent.futures.Future: resolves to (translated_text, response)
+    '''
+    # Cache hits ("ok", "thanks", emoji) never wait for or spend rate budget
+    cached = _cached(_cache_key(language, original_text, low_cost_mode, mainstream), original_text)
+    if cached is not None:
+        translated_text = cached.choices[0].message.content
+        if on_delta is not None:
+            on_delta(language, translated_text)
+        future = Future()
+        future.set_result((translated_text, cached))
+        return future
+
+    app = current_app._get_current_object() if has_app_context() else None
+    tokens = estimate_tokens(original_text)
+    submit_work = lambda: translation_scheduler.submit(
+        _translate_scheduled, tokens, app, language, original_text, low_cost_mode, on_delta, mainstream,
+        priority=priority, room=room, tokens=tokens
+    )
+    if coalesce_key is None:
+        return submit_work()
+    # Followers never occupy a scheduler worker: only the leader's job is scheduled
+    return translation_single_flight.submit(coalesce_key, submit_work, encode=_encode_result, decode=_decode_result)
+
+
+def translate_to_languages(original_text, languages, low_cost_mode='0', priority=PRIORITY_LIVE, room=None,
+                           coalesce_keys=None, on_delta=None, mainstream=None):
+    '''
+    Translate one source text into several target languages concurrently
+
+    Args:
+        original_text (str): Source text
+        languages (list): Target languages; duplicates and None are ignored
+        low_cost_mode (str): '1' to use the cheaper model for styled languages
+        priority (int): Scheduler priority class
+        room: Fair-share key, normally the chatroom id
+        coalesce_keys (dict): Optional {language: single-flight key}
+        on_delta (callable): Optional on_delta(language, text) to stream each
+                             translation as it is generated
+        mainstream (bool): True to translate every language with the mainstream
+                           prompt, as live chat messages always have
+
+    Returns:
+        dict: {language: (translated_text, response)}; response carries the
+              per-language usage and is None for 'original_text_raw'
+    '''
+    coalesce_keys = coalesce_keys or {}
+    targets = [lang for lang in dict.fromkeys(languages) if lang]
+    remote = [lang for lang in targets if lang != 'original_text_raw']
+    results = {lang: (original_text, None) for lang in targets if lang == 'original_text_raw'}
+
+    futures = {
+        lang: submit_translation(lang, original_text, low_cost_mode, priority=priority, room=room,
+                                 coalesce_key=coalesce_keys.get(lang), on_delta=on_delta, mainstream=mainstream)
+        for lang in remote
+    }
+    for lang, future in futures.items():
+        results[lang] = future.result()
+    return results
+
+# Alias for backwards compatibility
 translate_text = get_new_translated_string
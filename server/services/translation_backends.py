@@ -0,0 +1,296 @@
+"""
+Translation Backends
+Registry of model providers used for translation, the routing rules that pick
+one per language/style, and a deterministic local stand-in for load tests and CI
+"""
+import hashlib
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+
+from extensions import build_openai_client, openAI_client
+from services.translation_cache import payload_to_response
+from config.constants import (
+    TRANSLATION_BACKEND,
+    OPENAI_TRANSLATION_MAX_CONCURRENCY,
+    DEEPSEEK_API_KEY,
+    DEEPSEEK_BASE_URL,
+    DEEPSEEK_MODEL,
+    DEEPSEEK_MAX_CONCURRENCY,
+    LOCAL_BACKEND_LATENCY_MS,
+    FAKE_OPENAI_BASE_URL
+)
+
+LOCAL_MODEL = 'local-stand-in'
+
+
+class TranslationBackend:
+    """
+    A model provider and what it costs to use
+
+    Args:
+        name (str): Registry name used by routing rules
+        client_factory (callable): Builds the OpenAI-compatible client on first use
+        max_concurrency (int): Calls allowed in flight per worker; None for unlimited
+        latency_ms (float): Typical latency of one translation, reported next to the observed latency
+        model_costs (dict): {model: (USD per 1M prompt tokens, USD per 1M completion tokens)}
+        model_override (str): Serve every request with this model (stand-ins)
+    """
+
+    def __init__(self, name, client_factory, max_concurrency=None,
+                 latency_ms=None, model_costs=None, model_override=None):
+        self.name = name
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.latency_ms = latency_ms
+        self.model_costs = model_costs or {}
+        self.model_override = model_override
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self._client = None
+        self._in_flight = 0
+        self._calls = 0
+        self._observed_latency_ms = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    def model_for(self, model):
+        return self.model_override or model
+
+    def estimated_cost(self, model, prompt_tokens, completion_tokens):
+        """USD cost of a call by the declared list prices; 0 for unknown models"""
+        prompt_price, completion_price = self.model_costs.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+    def _started(self):
+        with self._lock:
+            self._in_flight += 1
+            self._calls += 1
+        return time.monotonic()
+
+    def _finished(self, started_at):
+        elapsed_ms = (time.monotonic() - started_at) * 1000
+        with self._lock:
+            self._in_flight -= 1
+            # Exponentially weighted moving average of observed latency
+            if self._observed_latency_ms is None:
+                self._observed_latency_ms = elapsed_ms
+            else:
+                self._observed_latency_ms = 0.9 * self._observed_latency_ms + 0.1 * elapsed_ms
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's concurrency slots for a blocking call"""
+        if self._slots:
+            self._slots.acquire()
+        started_at = self._started()
+        try:
+            yield
+        finally:
+            self._finished(started_at)
+            if self._slots:
+                self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'calls': self._calls,
+                'declared_latency_ms': self.latency_ms,
+                'observed_latency_ms': round(self._observed_latency_ms, 1) if self._observed_latency_ms else None,
+                'model_costs': self.model_costs,
+            }
+
+
+@dataclass
+class RoutingRule:
+    """
+    Send matching translations to backend/model; None fields match anything
+
+    languages matches the base language of styled targets ("中文" in "中文-formal")
+    """
+    backend: str
+    model: str
+    mainstream: Optional[bool] = None
+    languages: Optional[tuple] = None
+    styled: Optional[bool] = None
+    low_cost_mode: Optional[str] = None
+
+    def matches(self, language, style, mainstream, low_cost_mode):
+        return ((self.mainstream is None or self.mainstream == mainstream) and
+                (self.languages is None or language in self.languages) and
+                (self.styled is None or self.styled == bool(style)) and
+                (self.low_cost_mode is None or self.low_cost_mode == low_cost_mode))
+
+
+class TranslationBackendRegistry:
+    """
+    Args:
+        override (str): Backend name that serves every translation, ignoring
+                        the backends named by the rules (TRANSLATION_BACKEND)
+    """
+
+    def __init__(self, override=None):
+        self.override = override or None
+        self._backends = {}
+        self._rules = []
+
+    def register(self, backend):
+        self._backends[backend.name] = backend
+        return backend
+
+    def get(self, name):
+        if name not in self._backends:
+            raise KeyError(f"Unknown translation backend: {name}")
+        return self._backends[name]
+
+    def add_rule(self, rule):
+        """Append a routing rule; the first matching rule wins"""
+        self._rules.append(rule)
+
+    def route(self, target_language, low_cost_mode='0', mainstream=False):
+        """
+        Pick the backend and model for one translation
+
+        Args:
+            target_language (str): Target such as "English" or "中文-formal"
+            low_cost_mode (str): '1' when the user chose the cheaper models
+            mainstream (bool): Whether the mainstream (plain) prompt is used
+
+        Returns:
+            tuple: (TranslationBackend, model)
+        """
+        language, _, style = target_language.partition('-')
+        for rule in self._rules:
+            if rule.matches(language, style, mainstream, low_cost_mode):
+                backend = self.get(self.override or rule.backend)
+                return backend, backend.model_for(rule.model)
+        raise LookupError(f"No translation route for {target_language}")
+
+    def stats(self):
+        return {
+            'override': self.override,
+            'backends': {name: backend.stats() for name, backend in self._backends.items()},
+        }
+
+
+# =================== Local stand-in ===================
+_TARGET_PATTERNS = (
+    re.compile(r"target translation language is: (.+?)\.\s"),
+    re.compile(r"Translate the input text into (.+?)(?: first Secretly)?\.\s"),
+)
+
+
+def _local_tokens(text):
+    return len(text) // 4 + 1
+
+
+def local_completion_payload(model, messages):
+    """
+    Deterministic stand-in translation: "[<target>] <source text>"
+
+    Returns:
+        dict: Payload in the translation_cache.response_to_payload shape
+    """
+    system = next((message['content'] for message in messages if message['role'] == 'system'), '')
+    source = next((message['content'] for message in reversed(messages) if message['role'] == 'user'), '')
+    for pattern in _TARGET_PATTERNS:
+        match = pattern.search(system)
+        if match:
+            target = match.group(1).strip()
+            break
+    else:
+        target = hashlib.sha256(system.encode('utf-8')).hexdigest()[:8]
+    prompt_tokens = sum(_local_tokens(message['content']) for message in messages)
+    content = f"[{target}] {source}"
+    completion_tokens = _local_tokens(content)
+    return {
+        'model': model,
+        'content': content,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+    }
+
+
+def local_stream_chunks(payload, include_usage=True):
+    """Split a payload into chat.completion.chunk-shaped objects, word by word"""
+    for word in re.findall(r'\S+\s*|\s+', payload['content']):
+        yield SimpleNamespace(model=payload['model'], usage=None,
+                              choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+    if include_usage:
+        yield SimpleNamespace(model=payload['model'], choices=[], usage=SimpleNamespace(
+            prompt_tokens=payload['prompt_tokens'],
+            completion_tokens=payload['completion_tokens'],
+            total_tokens=payload['total_tokens']
+        ))
+
+
+class _LocalCompletions:
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def create(self, model, messages, stream=False, stream_options=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        payload = local_completion_payload(model, messages)
+        if stream:
+            return local_stream_chunks(payload, bool((stream_options or {}).get('include_usage')))
+        return payload_to_response(payload, from_cache=False)
+
+
+class LocalChatClient:
+    """In-process object with the slice of the OpenAI client API translation uses"""
+
+    def __init__(self, latency_ms=0):
+        self.chat = SimpleNamespace(completions=_LocalCompletions(latency_ms))
+
+    def with_options(self, **options):
+        return self
+
+
+# =================== Default registry ===================
+translation_backends = TranslationBackendRegistry(override=TRANSLATION_BACKEND)
+
+translation_backends.register(TranslationBackend(
+    'openai',
+    client_factory=lambda: openAI_client,
+    max_concurrency=OPENAI_TRANSLATION_MAX_CONCURRENCY,
+    latency_ms=800,
+    model_costs={'gpt-4o': (2.50, 10.00), 'gpt-4o-mini': (0.15, 0.60)}
+))
+translation_backends.register(TranslationBackend(
+    'deepseek',
+    client_factory=lambda: build_openai_client(DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL),
+    max_concurrency=DEEPSEEK_MAX_CONCURRENCY,
+    latency_ms=1500,
+    model_costs={DEEPSEEK_MODEL: (0.38, 0.89)}
+))
+translation_backends.register(TranslationBackend(
+    'local',
+    client_factory=lambda: LocalChatClient(LOCAL_BACKEND_LATENCY_MS),
+    latency_ms=LOCAL_BACKEND_LATENCY_MS,
+    model_override=LOCAL_MODEL
+))
+translation_backends.register(TranslationBackend(
+    'fake',
+    client_factory=lambda: build_openai_client('fake', FAKE_OPENAI_BASE_URL),
+    model_override=LOCAL_MODEL
+))
+
+
+# Same choices get_new_translated_string_4o_stylish used to hard-code
+translation_backends.add_rule(RoutingRule('openai', 'gpt-4o-mini', mainstream=True))
+translation_backends.add_rule(RoutingRule('deepseek', DEEPSEEK_MODEL, languages=('中文', '汉语'), styled=True))
+translation_backends.add_rule(RoutingRule('openai', 'gpt-4o-mini', low_cost_mode='1'))
+translation_backends.add_rule(RoutingRule('openai', 'gpt-4o'))
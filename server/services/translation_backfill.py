@@ -0,0 +1,113 @@
+"""
+Translation Backfill Service - Fill in missing history translations in bulk
+Business logic for translation_backfill
+"""
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from flask import current_app
+from services.translation import submit_translation, message_translation_key
+from services.translation_cache import response_to_payload, payload_to_response
+from config.constants import TRANSLATION_BACKFILL_MAX_IN_FLIGHT
+from translation_queue import PRIORITY_BACKFILL
+
+
+def _find_missing(messages, languages):
+    """
+    Collect the (source text, language) jobs needed by messages
+
+    Returns:
+        tuple: (ready, jobs, missing) where ready lists messages with nothing to
+               translate, jobs maps (text, language) to the messages waiting on
+               it, and missing maps id(message) to its outstanding languages
+    """
+    ready = []
+    jobs = {}
+    missing = {}
+    for message in messages:
+        outstanding = set()
+        for language in languages:
+            if message.translation_for(language):
+                continue
+            if language == 'original_text_raw':
+                message.add_translation_if_absent(language, message.original_text)
+                continue
+            jobs.setdefault((message.original_text, language), []).append(message)
+            outstanding.add(language)
+        if outstanding:
+            missing[id(message)] = outstanding
+        else:
+            ready.append(message)
+    return ready, jobs, missing
+
+
+def _run_jobs(jobs, low_cost_mode, max_in_flight, room):
+    """Yield ((text, language), result_or_exception) as translations land"""
+    queue = list(jobs)
+    in_flight = {}
+    while queue or in_flight:
+        while queue and len(in_flight) < max_in_flight:
+            text, language = job = queue.pop(0)
+            # Concurrent requests for the same message (e.g. a whole room fetching
+            # a new message at once) wait on a single model call
+            coalesce_key = message_translation_key(jobs[job][0].id, language, text)
+            future = submit_translation(language, text, low_cost_mode, priority=PRIORITY_BACKFILL, room=room,
+                                        coalesce_key=coalesce_key)
+            in_flight[future] = job
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            job = in_flight.pop(future)
+            try:
+                yield job, future.result()
+            except Exception as e:
+                yield job, e
+
+
+def backfill_translations(messages, languages, low_cost_mode='0', on_message_ready=None,
+                          max_in_flight=TRANSLATION_BACKFILL_MAX_IN_FLIGHT, room=None):
+    """
+    Add every missing translation of messages for the given languages
+
+    Identical (text, language) pairs are translated once, at most
+    max_in_flight model calls run at a time, and results are only applied to
+    the ORM objects here in the calling thread. Each result is stored with a
+    per-language compare-and-set (Message.add_translation_if_absent), so the
+    messages are read without row locks and concurrent backfills of the same
+    room never overwrite each other. on_message_ready(message) fires as soon
+    as a message has all of its languages, in completion order.
+
+    Args:
+        messages (list): Message instances
+        languages (list): Target languages; duplicates and None are ignored
+        low_cost_mode (str): '1' to use the cheaper model for styled languages
+        on_message_ready (callable): Optional per-message callback for streaming
+        room: Scheduler fair-share key, normally the chatroom id
+
+    Returns:
+        int: Number of model translations performed
+    """
+    languages = [language for language in dict.fromkeys(languages) if language]
+    ready, jobs, missing = _find_missing(messages, languages)
+
+    if on_message_ready:
+        for message in ready:
+            on_message_ready(message)
+
+    for (text, language), result in _run_jobs(jobs, low_cost_mode, max_in_flight, room):
+        if isinstance(result, Exception):
+            current_app.logger.error(f"Backfill translation to {language} failed: {str(result)}")
+        else:
+            translated_text, response = result
+        for index, message in enumerate(jobs[(text, language)]):
+            if not isinstance(result, Exception):
+                # Only the first message pays for a shared model call
+                if index == 0 or response is None:
+                    message.add_translation_if_absent(language, translated_text, response)
+                else:
+                    message.add_translation_if_absent(language, translated_text,
+                                                      payload_to_response(response_to_payload(response)))
+            outstanding = missing[id(message)]
+            outstanding.discard(language)
+            if not outstanding and on_message_ready:
+                on_message_ready(message)
+
+    return len(jobs)
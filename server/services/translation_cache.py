@@ -0,0 +1,249 @@
+"""
+Translation Cache Service
+Content-addressed cache for model translations with an in-process LRU tier
+and an optional shared (Redis) tier visible to all gunicorn workers
+"""
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from extensions import redis_client
+from config.constants import (
+    TRANSLATION_CACHE_ENABLED,
+    TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_CACHE_TTL_SECONDS,
+    TRANSLATION_CACHE_MAX_TEXT_LENGTH
+)
+
+# Bump when prompts change so stale translations are not served
+CACHE_KEY_VERSION = 1
+
+
+def normalize_text(text):
+    """Normalize text so trivially different inputs share a cache entry"""
+    return unicodedata.normalize('NFC', text or '').strip()
+
+
+def make_cache_key(kind, model, language, original_text):
+    """
+    Build a content-addressed key from the prompt inputs
+
+    Args:
+        kind (str): Prompt family ('mainstream', 'stylish', ...)
+        model (str): Model name the translation is requested from
+        language (str): Target language, including any "-style" suffix
+        original_text (str): Source text
+
+    Returns:
+        str: Hex sha256 digest
+    """
+    payload = json.dumps(
+        [CACHE_KEY_VERSION, kind, model, language, normalize_text(original_text)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def response_to_payload(response):
+    """Extract the cacheable fields of a chat completion response"""
+    return {
+        'model': response.model,
+        'content': response.choices[0].message.content,
+        'prompt_tokens': getattr(response.usage, 'prompt_tokens', 0),
+        'completion_tokens': getattr(response.usage, 'completion_tokens', 0),
+        'total_tokens': getattr(response.usage, 'total_tokens', 0),
+    }
+
+
+def payload_to_response(payload, from_cache=True):
+    """
+    Rebuild a response object shaped like an OpenAI chat completion
+    (``.model``, ``.usage``, ``.choices[0].message.content``)
+    """
+    return SimpleNamespace(
+        model=payload['model'],
+        usage=SimpleNamespace(
+            prompt_tokens=payload['prompt_tokens'],
+            completion_tokens=payload['completion_tokens'],
+            total_tokens=payload['total_tokens']
+        ),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=payload['content']))],
+        from_cache=from_cache
+    )
+
+
+class LRUCacheTier:
+    """In-process tier: size-bounded LRU with per-entry TTL"""
+
+    name = 'local'
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheTier:
+    """Shared tier: Redis keys with TTL, eviction bounded by Redis maxmemory policy"""
+
+    name = 'shared'
+
+    def __init__(self, client, ttl_seconds=3600, prefix='tcache:'):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            print(f"[TRANSLATION CACHE] Shared tier get failed: {str(e)}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def set(self, key, payload):
+        try:
+            self.client.setex(self.prefix + key, self.ttl_seconds, json.dumps(payload, ensure_ascii=False))
+        except Exception as e:
+            print(f"[TRANSLATION CACHE] Shared tier set failed: {str(e)}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            print(f"[TRANSLATION CACHE] Shared tier delete failed: {str(e)}")
+
+    def clear(self):
+        try:
+            for key in self.client.scan_iter(match=self.prefix + '*'):
+                self.client.delete(key)
+        except Exception as e:
+            print(f"[TRANSLATION CACHE] Shared tier clear failed: {str(e)}")
+
+
+class TranslationCache:
+    """
+    Read-through cache over an ordered list of tiers. Lookups go from the
+    fastest tier to the slowest and promote shared hits into the local tier.
+    """
+
+    def __init__(self, tiers, max_text_length=None, enabled=True):
+        self.tiers = list(tiers)
+        self.max_text_length = max_text_length
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'sets': 0}
+        for tier in self.tiers:
+            self._counters[f'hits_{tier.name}'] = 0
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def is_cacheable(self, original_text):
+        if not self.enabled or not original_text:
+            return False
+        return self.max_text_length is None or len(original_text) <= self.max_text_length
+
+    def get(self, key):
+        """Return a cached response object, or None on miss"""
+        for index, tier in enumerate(self.tiers):
+            payload = tier.get(key)
+            if payload is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(key, payload)
+                self._count('hits')
+                self._count(f'hits_{tier.name}')
+                return payload_to_response(payload)
+        self._count('misses')
+        return None
+
+    def set(self, key, response):
+        """Store a successful chat completion response in every tier"""
+        try:
+            payload = response_to_payload(response)
+        except (AttributeError, IndexError, TypeError):
+            return  # Error strings and partial responses are never cached
+        for tier in self.tiers:
+            tier.set(key, payload)
+        self._count('sets')
+
+    def get_or_create(self, key, original_text, create):
+        """Return the cached response for key, calling create() on a miss"""
+        if not self.is_cacheable(original_text):
+            return create()
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        response = create()
+        self.set(key, response)
+        return response
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        for tier in self.tiers:
+            if isinstance(tier, LRUCacheTier):
+                stats['local_size'] = len(tier)
+                stats['local_evictions'] = tier.evictions
+        stats['tiers'] = [tier.name for tier in self.tiers]
+        return stats
+
+
+def create_translation_cache():
+    """Build the process-wide cache from configuration"""
+    tiers = [LRUCacheTier(TRANSLATION_CACHE_MAX_ENTRIES, TRANSLATION_CACHE_TTL_SECONDS)]
+    if redis_client is not None:
+        tiers.append(RedisCacheTier(redis_client, TRANSLATION_CACHE_TTL_SECONDS))
+    return TranslationCache(
+        tiers,
+        max_text_length=TRANSLATION_CACHE_MAX_TEXT_LENGTH,
+        enabled=TRANSLATION_CACHE_ENABLED
+    )
+
+
+translation_cache = create_translation_cache()
@@ -0,0 +1,135 @@
+"""
+Translation Client - Deadline-bounded model calls with backoff
+Retry policy shared by the blocking and streaming translation paths
+"""
+import random
+import time
+
+import openai
+
+from services.translation_cache import payload_to_response
+from config.constants import (
+    TRANSLATION_DEADLINE_SECONDS,
+    TRANSLATION_MAX_ATTEMPTS,
+    TRANSLATION_BACKOFF_BASE_SECONDS,
+    TRANSLATION_BACKOFF_MAX_SECONDS
+)
+
+# Transient failures worth another attempt; 4xx request errors are not
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # Includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def backoff_delay(attempt, base=TRANSLATION_BACKOFF_BASE_SECONDS, cap=TRANSLATION_BACKOFF_MAX_SECONDS):
+    """
+    Exponential backoff with full jitter
+
+    Args:
+        attempt (int): Zero-based attempt number that just failed
+
+    Returns:
+        float: Seconds to wait before the next attempt
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _next_delay(attempt, max_attempts, deadline, error):
+    """Return the wait before retrying, or re-raise when out of attempts or time"""
+    if not isinstance(error, RETRYABLE_ERRORS) or attempt == max_attempts - 1:
+        raise error
+    delay = backoff_delay(attempt)
+    if time.monotonic() + delay >= deadline:
+        raise error
+    return delay
+
+
+def _remaining(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Translation deadline exceeded")
+    return remaining
+
+
+def create_chat_completion(client, deadline_seconds=TRANSLATION_DEADLINE_SECONDS,
+                           max_attempts=TRANSLATION_MAX_ATTEMPTS, **request):
+    """
+    Call client.chat.completions.create with a per-call deadline
+
+    Each attempt's HTTP timeout is the time left before the deadline, and the
+    SDK's own retries are disabled so the whole call never overruns it.
+    """
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_attempts):
+        bounded_client = client.with_options(timeout=_remaining(deadline), max_retries=0)
+        try:
+            return bounded_client.chat.completions.create(**request)
+        except Exception as e:
+            time.sleep(_next_delay(attempt, max_attempts, deadline, e))
+
+
+def _count_tokens(text):
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception:
+        return len(text)  # Upper bound: one token per character
+
+
+def _streamed_response(model, content, usage, request):
+    """Assemble a response object (see payload_to_response) from a finished stream"""
+    if usage is None:
+        # Provider ignored stream_options.include_usage; bill an estimate instead of nothing
+        prompt_tokens = sum(_count_tokens(message['content']) for message in request.get('messages', []))
+        completion_tokens = _count_tokens(content)
+    else:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    return payload_to_response({
+        'model': model,
+        'content': content,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+    }, from_cache=False)
+
+
+def stream_chat_completion(client, on_delta, deadline_seconds=TRANSLATION_DEADLINE_SECONDS,
+                           max_attempts=TRANSLATION_MAX_ATTEMPTS, **request):
+    """
+    Streaming create_chat_completion: on_delta(text) is called for every content
+    fragment as it arrives
+
+    Retries only happen before the first fragment has been delivered, and the
+    deadline bounds the whole stream, not just time-to-first-token.
+
+    Returns:
+        SimpleNamespace: Response shaped like a chat completion, with the full
+                         content and the usage reported at the end of the stream
+    """
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_attempts):
+        bounded_client = client.with_options(timeout=_remaining(deadline), max_retries=0)
+        parts = []
+        try:
+            stream = bounded_client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                **request
+            )
+            model, usage = request.get('model'), None
+            for chunk in stream:
+                _remaining(deadline)
+                model = chunk.model or model
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                for choice in chunk.choices:
+                    if choice.delta and choice.delta.content:
+                        parts.append(choice.delta.content)
+                        on_delta(choice.delta.content)
+            return _streamed_response(model, ''.join(parts), usage, request)
+        except Exception as e:
+            if parts:
+                raise  # Already shown to users; a retry would duplicate text
+            time.sleep(_next_delay(attempt, max_attempts, deadline, e))
@@ -0,0 +1,189 @@
+"""
+Translation Migration Service - Move legacy JSON translations into rows and
+re-encode stored message text with the current encryption codec
+Business logic for translation_migration
+"""
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+
+from extensions import db
+from models import Message, MessageTranslation, TranslationView
+from services.encryption import reencode
+from config.constants import TRANSLATION_MIGRATION_BATCH_SIZE, ENCRYPTION_CODEC_VERSION
+
+
+def _viewed_at(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+
+def _migrate_message(message, recorded_views):
+    """
+    Move one message's translations, token usage and viewers out of its JSON columns
+
+    Returns:
+        tuple: (translations moved, views moved)
+    """
+    legacy_translations = dict(message._translations or {})
+    legacy_tokens = message.translation_tokens or {}
+    legacy_viewers = message.translation_viewers or {}
+
+    translations = 0
+    for language, encrypted in legacy_translations.items():
+        if language in message.translation_rows:
+            continue  # Rewritten since, the row is newer
+        row = MessageTranslation(language=language)
+        row._text = encrypted
+        if legacy_tokens.get(language):
+            row.set_usage(legacy_tokens[language])
+        message.translation_rows[language] = row
+        translations += 1
+
+    views = 0
+    for language, viewers in legacy_viewers.items():
+        for user_id, viewed_at in (viewers or {}).items():
+            if (message.id, language, user_id) in recorded_views:
+                continue
+            db.session.add(TranslationView(message_id=message.id, language=language,
+                                           user_id=user_id, viewed_at=_viewed_at(viewed_at)))
+            views += 1
+
+    message._translations = {}
+    message.translation_tokens = {}
+    message.translation_viewers = {}
+    message._invalidate_decrypted()
+    return translations, views
+
+
+def migrate_legacy_translations(batch_size=TRANSLATION_MIGRATION_BATCH_SIZE, max_batches=None):
+    """
+    Move translations kept in the legacy JSON columns of message into
+    message_translation and translation_view rows
+
+    Runs in batches of messages ordered by id with a commit per batch, so it
+    can be stopped and re-run at any time; messages already migrated are skipped.
+
+    Args:
+        batch_size (int): Messages per batch/commit
+        max_batches (int): Stop after this many batches; None to run to the end
+
+    Returns:
+        dict: Messages scanned and migrated, rows created, and whether the end was reached
+    """
+    stats = {'scanned': 0, 'migrated_messages': 0, 'translations': 0, 'views': 0, 'done': False}
+    last_id = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        messages = (Message.query.options(selectinload(Message.translation_rows))
+                    .filter(Message.id > last_id).order_by(Message.id.asc()).limit(batch_size).all())
+        if not messages:
+            stats['done'] = True
+            break
+
+        legacy = [message for message in messages
+                  if message._translations or message.translation_tokens or message.translation_viewers]
+        recorded_views = set()
+        if legacy:
+            recorded_views = set(db.session.query(
+                TranslationView.message_id, TranslationView.language, TranslationView.user_id
+            ).filter(TranslationView.message_id.in_([message.id for message in legacy])))
+
+        for message in legacy:
+            translations, views = _migrate_message(message, recorded_views)
+            stats['migrated_messages'] += 1
+            stats['translations'] += translations
+            stats['views'] += views
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[TRANSLATION MIGRATION] Batch after message {last_id} failed: {str(e)}")
+            raise
+
+        stats['scanned'] += len(messages)
+        last_id = messages[-1].id
+        batches += 1
+        print(f"[TRANSLATION MIGRATION] Up to message {last_id}: {stats['migrated_messages']} messages migrated")
+    return stats
+
+
+def _reencode_message(message, version):
+    """
+    Re-encode every encrypted field of one message
+
+    Returns:
+        int: Number of values rewritten
+    """
+    changed = 0
+    for attribute in ('_original_text', '_translated_text'):
+        stored = getattr(message, attribute)
+        updated = reencode(stored, version)
+        if updated != stored:
+            setattr(message, attribute, updated)
+            changed += 1
+
+    if message._translations:
+        legacy = {language: reencode(stored, version) for language, stored in message._translations.items()}
+        rewritten = sum(legacy[language] != stored for language, stored in message._translations.items())
+        if rewritten:
+            message._translations = legacy
+            changed += rewritten
+
+    for row in message.translation_rows.values():
+        updated = reencode(row._text, version)
+        if updated != row._text:
+            row._text = updated
+            changed += 1
+        content = (row.usage or {}).get('content')
+        updated = reencode(content, version)
+        if updated != content:
+            row.usage = dict(row.usage, content=updated)
+            changed += 1
+    return changed
+
+
+def reencode_stored_texts(version=ENCRYPTION_CODEC_VERSION, batch_size=TRANSLATION_MIGRATION_BATCH_SIZE,
+                          max_batches=None):
+    """
+    Rewrite message text and translations stored with another encryption
+    codec version (see services/encryption.py)
+
+    Batched and resumable like migrate_legacy_translations; values already
+    in the target version are left untouched.
+
+    Args:
+        version (int): Target codec version
+        batch_size (int): Messages per batch/commit
+        max_batches (int): Stop after this many batches; None to run to the end
+
+    Returns:
+        dict: Messages scanned, values rewritten, and whether the end was reached
+    """
+    stats = {'scanned': 0, 'rewritten': 0, 'done': False}
+    last_id = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        messages = (Message.query.options(selectinload(Message.translation_rows))
+                    .filter(Message.id > last_id).order_by(Message.id.asc()).limit(batch_size).all())
+        if not messages:
+            stats['done'] = True
+            break
+
+        for message in messages:
+            stats['rewritten'] += _reencode_message(message, version)
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[TRANSLATION MIGRATION] Re-encoding after message {last_id} failed: {str(e)}")
+            raise
+
+        stats['scanned'] += len(messages)
+        last_id = messages[-1].id
+        batches += 1
+        print(f"[TRANSLATION MIGRATION] Up to message {last_id}: {stats['rewritten']} values re-encoded to v{version}")
+    return stats
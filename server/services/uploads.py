@@ -0,0 +1,229 @@
+"""
+Upload Service - Binary audio payloads and chunked HTTP uploads
+Business logic for uploads
+
+upload_audio takes the recording as a Socket.IO binary attachment, as a
+base64 string from older clients, or as the id of a finished chunked upload.
+Chunked uploads go to /api/uploads and each chunk is streamed straight into a
+file under UPLOAD_INCOMING_FOLDER, so a worker never holds more than one
+chunk of an upload in memory.
+"""
+import base64
+import fcntl
+import io
+import json
+import os
+import re
+import time
+import uuid
+
+from config.constants import UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES, UPLOAD_INCOMING_FOLDER, UPLOAD_STALE_SECONDS
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+_COPY_BLOCK_BYTES = 64 * 1024
+
+# Leading bytes of the containers browsers record to; Whisper goes by the file extension
+_AUDIO_SIGNATURES = (
+    (0, b'\x1a\x45\xdf\xa3', 'webm'),
+    (0, b'RIFF', 'wav'),
+    (0, b'OggS', 'ogg'),
+    (0, b'fLaC', 'flac'),
+    (0, b'ID3', 'mp3'),
+    (4, b'ftyp', 'm4a'),
+)
+
+
+class UploadError(Exception):
+    """Invalid upload; status is the HTTP status the routes answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def audio_filename(header):
+    """
+    Name the audio after its container, read from the first bytes
+
+    Args:
+        header: bytes-like holding at least the first 12 bytes
+
+    Returns:
+        str: e.g. 'audio.webm'; 'audio.mp3' when the format is not recognised
+    """
+    header = memoryview(header)
+    for offset, signature, extension in _AUDIO_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return f'audio.{extension}'
+    return 'audio.mp3'
+
+
+def open_audio_payload(data):
+    """
+    Open the audio of an upload_audio event
+
+    Args:
+        data (dict): Event payload with 'audio' (bytes or base64 string) or 'uploadId'
+
+    Returns:
+        tuple: (filename, file object) for the transcription API; close the file when done
+
+    Raises:
+        UploadError: Missing, oversized or unfinished audio
+    """
+    upload_id = data.get('uploadId')
+    if upload_id:
+        return open_completed_upload(upload_id, data.get('userId'))
+
+    audio = data.get('audio')
+    if isinstance(audio, str):
+        # Older clients: base64 inside the JSON packet
+        if len(audio) // 4 * 3 > UPLOAD_MAX_BYTES:
+            raise UploadError(f"Audio exceeds {UPLOAD_MAX_BYTES} bytes", 413)
+        audio = base64.b64decode(audio)
+    if not isinstance(audio, (bytes, bytearray, memoryview)) or not len(audio):
+        raise UploadError("audio must be a binary attachment")
+    view = memoryview(audio)
+    if view.nbytes > UPLOAD_MAX_BYTES:
+        raise UploadError(f"Audio exceeds {UPLOAD_MAX_BYTES} bytes", 413)
+    # BytesIO shares a bytes object's buffer instead of copying it
+    return audio_filename(view[:12]), io.BytesIO(audio if isinstance(audio, bytes) else view.tobytes())
+
+
+def _paths(upload_id):
+    if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+        raise UploadError("Unknown upload", 404)
+    base = os.path.join(UPLOAD_INCOMING_FOLDER, upload_id)
+    return base + '.part', base + '.json'
+
+
+def _read_meta(upload_id):
+    part_path, meta_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            return part_path, json.load(f)
+    except FileNotFoundError:
+        raise UploadError("Unknown upload", 404)
+
+
+def create_upload(user_id, size, content_type=None):
+    """
+    Start a chunked upload
+
+    Returns:
+        dict: uploadId and the largest chunk the server accepts
+    """
+    if not user_id:
+        raise UploadError("userId is required")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("size must be an integer")
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > UPLOAD_MAX_BYTES:
+        raise UploadError(f"Upload exceeds {UPLOAD_MAX_BYTES} bytes", 413)
+
+    os.makedirs(UPLOAD_INCOMING_FOLDER, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = _paths(upload_id)
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w') as f:
+        json.dump({'user_id': user_id, 'size': size, 'content_type': content_type, 'created_at': time.time()}, f)
+    return {'uploadId': upload_id, 'chunkSize': UPLOAD_CHUNK_BYTES, 'received': 0}
+
+
+def upload_status(upload_id):
+    """Bytes received so far, for resuming an interrupted upload"""
+    part_path, meta = _read_meta(upload_id)
+    return {'uploadId': upload_id, 'size': meta['size'], 'received': os.path.getsize(part_path)}
+
+
+def write_upload_chunk(upload_id, offset, stream, length):
+    """
+    Append one chunk read from stream at offset
+
+    A chunk that was already received (a client retry) is accepted without
+    being written again.
+
+    Returns:
+        dict: Upload status after the chunk
+    """
+    part_path, meta = _read_meta(upload_id)
+    if length is None or length <= 0:
+        raise UploadError("Chunk is empty or has no Content-Length", 411)
+    if length > UPLOAD_CHUNK_BYTES:
+        raise UploadError(f"Chunk exceeds {UPLOAD_CHUNK_BYTES} bytes", 413)
+    if offset < 0 or offset + length > meta['size']:
+        raise UploadError("Chunk is outside the declared upload size", 416)
+
+    with open(part_path, 'r+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        received = os.fstat(f.fileno()).st_size
+        if offset + length <= received:
+            return {'uploadId': upload_id, 'size': meta['size'], 'received': received}
+        if offset != received:
+            raise UploadError(f"Expected offset {received}", 409)
+        f.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(_COPY_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            f.write(block)
+            remaining -= len(block)
+        if remaining:
+            f.truncate(offset)  # Connection dropped mid-chunk; the client resends it
+            raise UploadError("Chunk ended early", 400)
+        received = offset + length
+    return {'uploadId': upload_id, 'size': meta['size'], 'received': received}
+
+
+def open_completed_upload(upload_id, user_id=None):
+    """
+    Open a finished upload for reading
+
+    Returns:
+        tuple: (filename, file object)
+    """
+    part_path, meta = _read_meta(upload_id)
+    if user_id and meta['user_id'] != user_id:
+        raise UploadError("Unknown upload", 404)
+    if os.path.getsize(part_path) != meta['size']:
+        raise UploadError("Upload is not complete", 409)
+    audio_file = open(part_path, 'rb')
+    name = audio_filename(audio_file.read(12))
+    audio_file.seek(0)
+    return name, audio_file
+
+
+def discard_upload(upload_id):
+    """Delete an upload's files"""
+    for path in _paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_stale_uploads(max_age=UPLOAD_STALE_SECONDS):
+    """
+    Delete uploads that have not received a chunk for max_age seconds
+
+    Returns:
+        int: Uploads deleted
+    """
+    if not os.path.isdir(UPLOAD_INCOMING_FOLDER):
+        return 0
+    cutoff = time.time() - max_age
+    purged = 0
+    for name in os.listdir(UPLOAD_INCOMING_FOLDER):
+        upload_id, extension = os.path.splitext(name)
+        if extension != '.part' or not _UPLOAD_ID.match(upload_id):
+            continue
+        if os.path.getmtime(os.path.join(UPLOAD_INCOMING_FOLDER, name)) < cutoff:
+            discard_upload(upload_id)
+            purged += 1
+    if purged:
+        print(f"[UPLOADS] Deleted {purged} stale uploads")
+    return purged
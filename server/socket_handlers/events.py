@@ -6,13 +6,13 @@ from flask import current_app
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from PIL import Image
-import base64
 import json
 import os
-import io
+import uuid
 
 # Import from extensions
 from extensions import db, sio, openAI_client
+from job_pool import socket_job_pool, JobRejected
 # Import get_app for accessing app context in socket handlers
 from socket_handlers import get_app
 
@@ -29,8 +29,25 @@ from config.constants import (
 from models import User, ChatRoom, Message, Notification
 
 # Import services
-from services.translation import translate_text, get_new_translated_string, get_new_translated_string_4o_stylish
+from services.translation import translate_text, get_new_translated_string, get_new_translated_string_4o_stylish, translate_to_languages
 from services.token_service import check_and_update_tokens
+from services.billing import TranslationBilling
+from services.audio_stream import feed_audio_chunk, end_audio_stream, discard_audio_stream
+from services.uploads import open_audio_payload, discard_upload
+from services.presence_cache import presence_cache, last_used_room_writer
+
+
+def _translation_delta_emitter(chatroom_id, user_id, stream_id):
+    """Return an on_delta(language, text) callback that forwards model tokens to the chatroom"""
+    def on_delta(language, delta):
+        sio.emit('translation_delta', {
+            'streamId': stream_id,
+            'chatroom_id': chatroom_id,
+            'userId': user_id,
+            'language': language,
+            'delta': delta,
+        }, room=str(chatroom_id))
+    return on_delta
 
 
 def add_user(user_id, username):
@@ -51,7 +68,7 @@ def connect(sid, environ):
 
 @sio.event
 def disconnect(sid):
-    pass
+    discard_audio_stream(sid)
     # print(f"Client disconnected: {sid}")
 
 
@@ -60,34 +77,27 @@ def disconnect(sid):
 
 @sio.event
 def audio_chunk(sid, data):
-    print(f"[SOCKET.IO] Received audio_chunk from {sid}, size: {len(data.get('audio', b''))} bytes")
-    # print(f"Received audio chunk from {sid}")
-    # # print("Received data:", data)  # Debug: Print the entire data object
-
-    # Safely get values from the data dictionary
-    audio_data = data.get('buffer')
-    target_language = data.get('targetLanguage')
-    user_id = data.get('userId')
-    is_voice_clone_tts_enabled = data.get('isVoiceCloneTTSEnabled')
-
-    # # Check if required data is present
-    # if not audio_data:
-    #     # print("Error: No audio data received")
-    #     return
-    # if not target_language:
-    #     # print("Warning: No target language specified")
-    # if not user_id:
-    #     # print("Warning: No userId specified")
-    #     # You might want to use a default user ID or skip processing
-    #     # user_id = "default_user"  # Uncomment this if you want to use a default
-    #     return  # Or return here if you want to skip processing without a user ID
-
-    # Proceed with audio processing
+    """Buffer a streamed audio chunk; segments are transcribed as pauses are detected"""
+    with get_app().app_context():
+        try:
+            return feed_audio_chunk(sid, data)
+        except Exception as e:
+            print(f"Error processing audio: {str(e)}")
+            return {'ok': False, 'error': str(e)}
+
+
+@sio.event
+def audio_stream_end(sid, data=None):
+    """Transcribe the rest of the stream; the last transcript event carries final=True"""
     try:
-        # audio_processor.process_audio(audio_data, target_language, user_id, is_voice_clone_tts_enabled)
-        a=0
+        return end_audio_stream(sid)
     except Exception as e:
-        print(f"Error processing audio: {str(e)}")
+        print(f"Error ending audio stream: {str(e)}")
+        return {'ok': False, 'error': str(e)}
+
+
+# The walkie-talkie page ends its stream with stop_stream
+sio.on('stop_stream', audio_stream_end)
 
 
 
@@ -97,17 +107,13 @@ def join_room(sid, data):
         user_id = data['userId']
         chatroom_id = str(data['chatroomId'])  # Convert to string
         sio.enter_room(sid, chatroom_id)
-        # Check if user is still a participant
-        chatroom = ChatRoom.query.get(int(chatroom_id))
-        if not chatroom:
-            return False
-
-        user = User.query.filter_by(user_id=user_id).first()
-        if not user:
+        # Check if user is still a participant (membership is cached, see services/presence_cache.py)
+        members = presence_cache.room_members(int(chatroom_id))
+        if members is None:
             return False
 
         # Check if user is in participants list
-        if user not in chatroom.participants:
+        if user_id not in members:
             # Emit the leave message
             sio.emit('already_leave_chatroom', {
                 'chatroomId': chatroom_id,
@@ -121,10 +127,8 @@ def join_room(sid, data):
         # sid: Socket.IO session ID for the client
         # chatroom_id: ID of the chatroom to join
 
-        # Update user's last used chatroom
-        user.last_used_chatroom_id = chatroom.id
-        db.session.add(user)
-        db.session.commit()
+        # Update user's last used chatroom; written in batches
+        last_used_room_writer.record(user_id, int(chatroom_id))
 
         # print(f"User {user_id} has joined chatroom {chatroom_id}")
         sio.emit('room_joined', {'message': f'Joined room {chatroom_id}'}, room=sid)
@@ -138,9 +142,17 @@ def join_room(sid, data):
 
 @sio.on('ask_ai')
 def handle_ask_ai(sid, data):
-    selected_text = data.get('selectedText', '')
-    prompt_text = data.get('promptText', '')
+    """Queue the AI answer on the job pool; the result arrives as an ai_response event"""
+    request_id = data.get('requestId')
+    try:
+        job_id = socket_job_pool.submit('ask_ai', data.get('userId') or sid, answer_ask_ai, sid, request_id,
+                                        data.get('selectedText', ''), data.get('promptText', ''))
+    except JobRejected as e:
+        return {'error': str(e), 'requestId': request_id}
+    return {'queued': True, 'jobId': job_id, 'requestId': request_id}
 
+
+def answer_ask_ai(sid, request_id, selected_text, prompt_text):
     try:
         # Combine the selected text and prompt
         combined_prompt = f"Selected text: {selected_text}\n\nUser prompt: {prompt_text}\n\nPlease provide a response based on the selected text and the user's prompt:"
@@ -156,11 +168,11 @@ def handle_ask_ai(sid, data):
 
         ai_response = response.choices[0].message.content
 
-        # Return the AI response to the client
-        return {'aiResponse': ai_response}
+        # Send the AI response to the client
+        sio.emit('ai_response', {'requestId': request_id, 'aiResponse': ai_response}, room=sid)
     except Exception as e:
         # app.logger.error(f"Error in AI processing: {str(e)}")
-        return {'error': str(e)}
+        sio.emit('ai_response', {'requestId': request_id, 'error': str(e)}, room=sid)
 
 # ... rest of the file ...
 
@@ -483,9 +495,12 @@ def handle_edit_text(sid, data):
                             message.edit_translation(to_language_me, response.choices[0].message.content, response)
                 # If in guest mode, use host user ID for pricing
                 pricing_user_id = curr_host_user_id if is_guest_mode and curr_host_user_id else user_id
-                priced_translation = message.get_translation_priced(pricing_user_id, to_language_me, low_cost_mode)
+                billing = TranslationBilling()
+                priced_translation = message.get_translation_priced(pricing_user_id, to_language_me, low_cost_mode,
+                                                                    billing=billing)
                 db.session.add(message)
                 db.session.commit()
+                billing.apply()
 
                 # Emit updated message to all users in the chatroom
                 sio.emit('receive_edited_message', {
@@ -513,8 +528,8 @@ def user_speaking_from_client_start(sid, data):
             user_id = data.get('userId')
             username = data.get('username')
             chatroom_id = str(data.get('chatroomId'))  # Convert to string
-            user = User.query.filter_by(user_id=user_id).first()
-            avatar = user.avatar if user else None
+            profile = presence_cache.user_profile(user_id) if user_id else None
+            avatar = profile['avatar'] if profile else None
             # Relay the message to all users in the chatroom
             sio.emit('user_speaking_to_client_start', {
                 'userId': user_id,
@@ -536,8 +551,8 @@ def user_speaking_from_client_stop(sid, data):
             user_id = data.get('userId')
             username = data.get('username')
             chatroom_id = str(data.get('chatroomId'))  # Convert to string
-            user = User.query.filter_by(user_id=user_id).first()
-            avatar = user.avatar if user else None
+            profile = presence_cache.user_profile(user_id) if user_id else None
+            avatar = profile['avatar'] if profile else None
             # Relay the message to all users in the chatroom
             sio.emit('user_speaking_to_client_stop', {
                 'userId': user_id,
@@ -562,8 +577,8 @@ def user_speaking_from_client_content_transcript(sid, data):
             username = data.get('username')
             chatroom_id = str(data.get('chatroomId'))
             streaming_transcript = data.get('streamingTranscript')
-            user = User.query.filter_by(user_id=user_id).first()
-            avatar = user.avatar if user else None
+            profile = presence_cache.user_profile(user_id) if user_id else None
+            avatar = profile['avatar'] if profile else None
             # print(f"Received transcript from {username}: {streaming_transcript}")  # Debug log
 
             if all([user_id, username, chatroom_id, streaming_transcript]):
@@ -635,11 +650,23 @@ class ChatNamespace(Namespace):
 
     @staticmethod
     def on_upload_audio(sid, data):
+        # Transcription and translation run on the job pool; ack as soon as the job is queued
+        if not data.get('userId') or not (data.get('audio') or data.get('uploadId')):
+            sio.emit('audio_upload_failed', {"error": "userId or audio data is missing"}, room=sid)
+            return False
+        try:
+            job_id = socket_job_pool.submit('upload_audio', data.get('userId'), ChatNamespace.process_upload_audio, sid, data)
+        except JobRejected as e:
+            sio.emit('audio_upload_failed', {"error": str(e)}, room=sid)
+            return False
+        return {'queued': True, 'jobId': job_id}
+
+    @staticmethod
+    def process_upload_audio(sid, data):
         with get_app().app_context():
             # current_app.logger.info("Received audio message via Socket.IO")
             user_id = data.get('userId')
             chatroom_id = data.get('chatroomId')
-            base64_audio = data.get('audio')
             username = data.get('username')
             target_language = data.get('toLanguageMe')
             target_language_first = data.get('toLanguageMeFirst')
@@ -650,8 +677,11 @@ class ChatNamespace(Namespace):
             duration_in_minutes = data.get('durationInMinutes', 0)
             is_guest_mode = data.get('isGuestMode', False)
             curr_host_user_id = data.get('currHostUserId')
+            # Opt-in: stream translation_delta events before the final new_message
+            stream = data.get('stream', False)
+            stream_id = data.get('streamId') or uuid.uuid4().hex
             
-            if not user_id or not base64_audio:
+            if not user_id or not (data.get('audio') or data.get('uploadId')):
                 sio.emit('audio_upload_failed', {"error": "userId or audio data is missing"}, room=sid)
                 return
 
@@ -662,14 +692,16 @@ class ChatNamespace(Namespace):
                     add_user(user_id, username)
                     user = User.query.filter_by(user_id=user_id).first()
 
-                # Decode base64 audio
-                audio_data = base64.b64decode(base64_audio)
-                audio_file = io.BytesIO(audio_data)
+                # Binary attachment, base64 from older clients, or a finished chunked upload
+                audio_name, audio_file = open_audio_payload(data)
 
                 # Use OpenAI Whisper API to transcribe the audio
-                transcript = openAI_client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=("audio.mp3", audio_file))
+                with audio_file:
+                    transcript = openAI_client.audio.transcriptions.create(
+                        model="whisper-1", 
+                        file=(audio_name, audio_file))
+                if data.get('uploadId'):
+                    discard_upload(data['uploadId'])
                 
                 audio_token_cost = AUDIO_UNIT_PRICE_PER_MINUTE * duration_in_minutes
                 log_transcription('upload_audio', duration_in_minutes * 60.0, transcript)
@@ -708,38 +740,31 @@ class ChatNamespace(Namespace):
                 new_message.add_translation('original_text_raw', transcript.text)
 
                 if is_split:
-                    # Get translations for both languages in split mode
-                    if target_language_first == 'original_text_raw':
-                        new_message.add_translation(target_language_first, transcript.text)
-                    else:
-                        response = get_new_translated_string(target_language_first, transcript.text)
-                        new_message.add_translation(target_language_first, response.choices[0].message.content, response)
-                    
-                    if target_language_second == 'original_text_raw':
-                        new_message.add_translation(target_language_second, transcript.text)
-                    else:
-                        response = get_new_translated_string(target_language_second, transcript.text)
-                        new_message.add_translation(target_language_second, response.choices[0].message.content, response)
-                    
-                    translated_text = new_message.translations[target_language_first]
+                    # Translate into both languages concurrently in split mode
+                    target_languages = [target_language_first, target_language_second]
                 else:
                     # Single language mode
-                    if target_language == 'original_text_raw':
-                        new_message.add_translation(target_language, transcript.text)
-                        translated_text = transcript.text
-                    else:
-                        response = get_new_translated_string(target_language, transcript.text)
-                        new_message.add_translation(target_language, response.choices[0].message.content, response)
-                        translated_text = response.choices[0].message.content
+                    target_languages = [target_language]
+
+                on_delta = _translation_delta_emitter(chatroom_id, user_id, stream_id) if stream else None
+                translation_results = translate_to_languages(transcript.text, target_languages, low_cost_mode,
+                                                             room=chatroom_id, on_delta=on_delta, mainstream=True)
+                for language, (text, response) in translation_results.items():
+                    new_message.add_translation(language, text, response)
+                translated_text = translation_results.get(target_languages[0], (transcript.text, None))[0]
 
                 # Set the translated_text field
                 new_message.translated_text = translated_text
+                billing = TranslationBilling()
                 if is_guest_mode:
-                    priced_translation = new_message.get_translation_priced(curr_host_user_id, target_language, low_cost_mode)
+                    priced_translation = new_message.get_translation_priced(curr_host_user_id, target_language, low_cost_mode,
+                                                                            billing=billing)
                 else:
-                    priced_translation = new_message.get_translation_priced(user_id, target_language, low_cost_mode)
+                    priced_translation = new_message.get_translation_priced(user_id, target_language, low_cost_mode,
+                                                                            billing=billing)
                 db.session.add(new_message)
                 db.session.commit()
+                billing.apply()
 
                 # Emit with message ID included
                 sio.emit('new_message', {
@@ -755,6 +780,7 @@ class ChatNamespace(Namespace):
                     'is_recalled': '0',
                     'is_edited': '0',
                     'reply_to_message_id': reply_to_message_id,
+                    'streamId': stream_id if stream else None,
                 }, room=str(chatroom_id))
 
                 return True
@@ -766,6 +792,19 @@ class ChatNamespace(Namespace):
 
     @staticmethod
     def on_upload_text(sid, data):
+        # Translation runs on the job pool; ack as soon as the job is queued
+        if not data.get('userId') or not data.get('message'):
+            sio.emit('text_upload_failed', {"error": "userId or message is missing"}, room=sid)
+            return False
+        try:
+            job_id = socket_job_pool.submit('upload_text', data.get('userId'), ChatNamespace.process_upload_text, sid, data)
+        except JobRejected as e:
+            sio.emit('text_upload_failed', {"error": str(e)}, room=sid)
+            return False
+        return {'queued': True, 'jobId': job_id}
+
+    @staticmethod
+    def process_upload_text(sid, data):
         with get_app().app_context():
             user_id = data.get('userId')
             chatroom_id = data.get('chatroomId')
@@ -779,6 +818,9 @@ class ChatNamespace(Namespace):
             low_cost_mode = data.get('lowCostMode', '0')
             is_guest_mode = data.get('isGuestMode', False)
             curr_host_user_id = data.get('currHostUserId')
+            # Opt-in: stream translation_delta events before the final new_message
+            stream = data.get('stream', False)
+            stream_id = data.get('streamId') or uuid.uuid4().hex
 
             if not user_id or not message:
                 sio.emit('text_upload_failed', {"error": "userId or message is missing"}, room=sid)
@@ -807,38 +849,31 @@ class ChatNamespace(Namespace):
                 new_message.add_translation('original_text_raw', message)
 
                 if is_split:
-                    # Get translations for both languages in split mode
-                    if toLanguageMeFirst == 'original_text_raw':
-                        new_message.add_translation(toLanguageMeFirst, message)
-                    else:
-                        response = get_new_translated_string(toLanguageMeFirst, message)
-                        new_message.add_translation(toLanguageMeFirst, response.choices[0].message.content, response)
-                    
-                    if toLanguageMeSecond == 'original_text_raw':
-                        new_message.add_translation(toLanguageMeSecond, message)
-                    else:
-                        response = get_new_translated_string(toLanguageMeSecond, message)
-                        new_message.add_translation(toLanguageMeSecond, response.choices[0].message.content, response)
-                    
-                    translated_text = new_message.translations[toLanguageMeFirst]
+                    # Translate into both languages concurrently in split mode
+                    target_languages = [toLanguageMeFirst, toLanguageMeSecond]
                 else:
                     # Single language mode
-                    if toLanguageMe == 'original_text_raw':
-                        new_message.add_translation(toLanguageMe, message)
-                        translated_text = message
-                    else:
-                        response = get_new_translated_string(toLanguageMe, message)
-                        new_message.add_translation(toLanguageMe, response.choices[0].message.content, response)
-                        translated_text = response.choices[0].message.content
+                    target_languages = [toLanguageMe]
+
+                on_delta = _translation_delta_emitter(chatroom_id, user_id, stream_id) if stream else None
+                translation_results = translate_to_languages(message, target_languages, low_cost_mode,
+                                                             room=chatroom_id, on_delta=on_delta, mainstream=True)
+                for language, (text, response) in translation_results.items():
+                    new_message.add_translation(language, text, response)
+                translated_text = translation_results.get(target_languages[0], (message, None))[0]
 
                 # Set the translated_text field
                 new_message.translated_text = translated_text
+                billing = TranslationBilling()
                 if is_guest_mode and curr_host_user_id:
-                    priced_translation = new_message.get_translation_priced(curr_host_user_id, toLanguageMe, low_cost_mode)
+                    priced_translation = new_message.get_translation_priced(curr_host_user_id, toLanguageMe, low_cost_mode,
+                                                                            billing=billing)
                 else:
-                    priced_translation = new_message.get_translation_priced(user_id, toLanguageMe, low_cost_mode)
+                    priced_translation = new_message.get_translation_priced(user_id, toLanguageMe, low_cost_mode,
+                                                                            billing=billing)
                 db.session.add(new_message)
                 db.session.commit()
+                billing.apply()
 
                 # Emit with message ID included
                 sio.emit('new_message', {
@@ -854,6 +889,7 @@ class ChatNamespace(Namespace):
                     'is_recalled': '0',
                     'is_edited': '0',
                     'reply_to_message_id': reply_to_message_id,
+                    'streamId': stream_id if stream else None,
                 }, room=str(chatroom_id))
 
                 return True
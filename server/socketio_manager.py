@@ -0,0 +1,335 @@
+"""
+Socket.IO Client Managers
+Share rooms and emits between workers and hosts through a message queue
+
+SOCKETIO_MESSAGE_QUEUE selects the backend:
+    ''                 one process only (python-socketio's default manager)
+    redis://...        Redis pub/sub, across workers and hosts
+    unix:///path.sock  local broker on a Unix socket, across the workers of one host
+
+Every emit is still delivered to this worker's own clients directly; the
+queue carries it to the other workers. Messages published within
+SOCKETIO_PUBLISH_BATCH_MS are sent to the queue as one batch.
+
+The Unix socket broker must outlive the workers. Under gunicorn the master
+runs it as a child process (gunicorn_config.py on_starting), or it is run on
+its own:
+
+    python socketio_manager.py broker /tmp/yoohi-socketio.sock
+
+If no broker is reachable, the first worker that finds none hosts one
+(SOCKETIO_BROKER_AUTOSTART). That is meant for development: the broker dies
+with its worker, so emits are lost until the workers reconnect and elect
+another one.
+"""
+import errno
+import fcntl
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+
+import socketio
+
+from config.constants import (
+    SOCKETIO_MESSAGE_QUEUE,
+    SOCKETIO_CHANNEL,
+    SOCKETIO_BROKER_AUTOSTART,
+    SOCKETIO_PUBLISH_BATCH_MS,
+    SOCKETIO_PUBLISH_BATCH_MAX
+)
+
+_FRAME_HEADER = struct.Struct('!I')
+
+
+class BatchingPublisherMixin:
+    """
+    Coalesce the messages a worker publishes within batch_interval seconds
+    into one queue message, and unpack batches on the listening side
+    """
+
+    def _init_batching(self, batch_interval, batch_max):
+        self.batch_interval = batch_interval
+        self.batch_max = max(1, batch_max)
+        self._batch = []
+        self._batch_lock = threading.Lock()
+        self._flush_scheduled = False
+        self.published_messages = 0
+        self.published_batches = 0
+        # With gunicorn preload_app the manager is created before the fork;
+        # each worker needs its own host id or workers ignore each other's messages
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.host_id = uuid.uuid4().hex
+        self._batch = []
+        self._batch_lock = threading.Lock()
+        self._flush_scheduled = False
+
+    def _publish(self, data):
+        if self.batch_interval <= 0:
+            return super()._publish(data)
+        with self._batch_lock:
+            self._batch.append(data)
+            full = len(self._batch) >= self.batch_max
+            schedule = not full and not self._flush_scheduled
+            if schedule:
+                self._flush_scheduled = True
+        if full:
+            self._flush()
+        elif schedule:
+            self._start_task(self._flush_later)
+
+    def _start_task(self, target):
+        if self.server is not None:
+            return self.server.start_background_task(target)
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _flush_later(self):
+        if self.server is not None:
+            self.server.sleep(self.batch_interval)
+        else:
+            time.sleep(self.batch_interval)
+        self._flush()
+
+    def _flush(self):
+        with self._batch_lock:
+            batch, self._batch = self._batch, []
+            self._flush_scheduled = False
+        if not batch:
+            return
+        self.published_messages += len(batch)
+        self.published_batches += 1
+        if len(batch) == 1:
+            return super()._publish(batch[0])
+        return super()._publish({'method': 'batch', 'messages': batch, 'host_id': self.host_id})
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if not isinstance(message, dict):
+                try:
+                    data = self.json.loads(message)
+                except Exception:
+                    yield message
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'batch':
+                # Each message keeps its own host id, so the receiver still skips its own
+                for item in data.get('messages', []):
+                    yield item
+            else:
+                yield data
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'host_id': self.host_id,
+            'batch_interval_ms': self.batch_interval * 1000,
+            'published_messages': self.published_messages,
+            'published_batches': self.published_batches,
+        }
+
+
+class BatchingRedisManager(BatchingPublisherMixin, socketio.RedisManager):
+    name = 'redis'
+
+    def __init__(self, url, channel=SOCKETIO_CHANNEL, batch_interval=SOCKETIO_PUBLISH_BATCH_MS / 1000.0,
+                 batch_max=SOCKETIO_PUBLISH_BATCH_MAX, **kwargs):
+        super().__init__(url, channel=channel, **kwargs)
+        self._init_batching(batch_interval, batch_max)
+
+
+def _read_exactly(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _read_frame(conn):
+    header = _read_exactly(conn, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    return _read_exactly(conn, _FRAME_HEADER.unpack(header)[0])
+
+
+class UnixSocketBroker:
+    """Relays every frame a client sends to all connected clients, sender included"""
+
+    def __init__(self, path):
+        self.path = path
+        self._clients = {}  # connection -> send lock, so relayed frames never interleave
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def bind(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        listener.listen(128)
+        self._listener = listener
+
+    def serve_forever(self):
+        while True:
+            conn, _ = self._listener.accept()
+            with self._lock:
+                self._clients[conn] = threading.Lock()
+            threading.Thread(target=self._relay, args=(conn,), daemon=True).start()
+
+    def start(self):
+        """Bind and serve from a daemon thread"""
+        self.bind()
+        threading.Thread(target=self.serve_forever, name='socketio-broker', daemon=True).start()
+        print(f"[SOCKETIO] Broker listening on {self.path} (pid {os.getpid()})")
+
+    def _relay(self, conn):
+        try:
+            while True:
+                payload = _read_frame(conn)
+                if payload is None:
+                    break
+                frame = _FRAME_HEADER.pack(len(payload)) + payload
+                with self._lock:
+                    clients = list(self._clients.items())
+                for client, send_lock in clients:
+                    try:
+                        with send_lock:
+                            client.sendall(frame)
+                    except OSError:
+                        self._drop(client)
+        except OSError:
+            pass
+        finally:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self._lock:
+            self._clients.pop(conn, None)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+
+class _UnixSocketPubSub(socketio.PubSubManager):
+    """Pub/sub through a UnixSocketBroker: one connection to publish, one to listen"""
+    name = 'unix'
+
+    def __init__(self, path, channel=SOCKETIO_CHANNEL, autostart=SOCKETIO_BROKER_AUTOSTART, **kwargs):
+        super().__init__(channel=channel, **kwargs)
+        self.path = path
+        self.autostart = autostart
+        self._sender = None
+        self._sender_pid = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+            return conn
+        except OSError as e:
+            conn.close()
+            if not self.autostart or e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+        self._start_broker()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(self.path)
+        return conn
+
+    def _start_broker(self):
+        # Workers race for the broker: the lock lets exactly one replace a stale socket file
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(self.path)
+                    return  # Another worker started it meanwhile
+                except OSError:
+                    pass
+                finally:
+                    probe.close()
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+                UnixSocketBroker(self.path).start()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _publish(self, data):
+        payload = self.json.dumps(data).encode('utf-8')
+        frame = _FRAME_HEADER.pack(len(payload)) + payload
+        with self._send_lock:
+            for attempt in range(2):
+                try:
+                    if self._sender is None or self._sender_pid != os.getpid():
+                        self._sender = self._connect()
+                        self._sender_pid = os.getpid()
+                    self._sender.sendall(frame)
+                    return
+                except OSError as e:
+                    self._sender = None
+                    if attempt:
+                        self._get_logger().error(f'Cannot publish to {self.path}: {e}')
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                conn = self._connect()
+                retry_sleep = 1
+                while True:
+                    payload = _read_frame(conn)
+                    if payload is None:
+                        break
+                    yield payload
+                conn.close()
+            except OSError as e:
+                self._get_logger().error(f'Cannot listen on {self.path}: {e}; retrying in {retry_sleep}s')
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+class UnixSocketManager(BatchingPublisherMixin, _UnixSocketPubSub):
+    """Client manager for the workers of one host"""
+
+    def __init__(self, path, batch_interval=SOCKETIO_PUBLISH_BATCH_MS / 1000.0,
+                 batch_max=SOCKETIO_PUBLISH_BATCH_MAX, **kwargs):
+        super().__init__(path, **kwargs)
+        self._init_batching(batch_interval, batch_max)
+
+
+def build_client_manager(url=SOCKETIO_MESSAGE_QUEUE):
+    """
+    Client manager for SOCKETIO_MESSAGE_QUEUE
+
+    Returns:
+        socketio.Manager: None for a single process (python-socketio's default)
+    """
+    if not url:
+        return None
+    if url.startswith('unix://'):
+        return UnixSocketManager(url[len('unix://'):])
+    if url.startswith(('redis://', 'rediss://', 'redis+sentinel://')):
+        return BatchingRedisManager(url)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE {url!r}; use redis://... or unix:///path")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'broker':
+        print("Usage: python socketio_manager.py broker /path/to/socketio.sock")
+        sys.exit(1)
+    broker = UnixSocketBroker(sys.argv[2])
+    if os.path.exists(broker.path):
+        os.unlink(broker.path)
+    broker.bind()
+    print(f"[SOCKETIO] Broker listening on {broker.path}")
+    broker.serve_forever()
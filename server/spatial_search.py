@@ -1,24 +1,327 @@
+"""
+Spatial Search
+Nearby OSM nodes for the location endpoints
+
+Workers read a compact binary index built offline from the OSM dump:
+
+    python spatial_search.py build [--input map_db/....json] [--output map_db/....spidx]
+
+The file is memory-mapped read-only, so opening it takes milliseconds and
+every worker shares the same pages through the page cache instead of holding
+its own copy of the dataset. Layout (little-endian, every section 8-byte aligned):
+
+    header      magic, version, tag key count, grid_size, node_count, cell_count,
+                vocabulary offset and length
+    lat, lon    float64[node_count], nodes sorted by grid cell
+    ids         int64[node_count]
+    cell_keys   int64[cell_count], sorted; lat_idx * 2**32 + lon_idx
+    cell_starts int64[cell_count + 1], first node of each cell
+    tag_offsets int64[node_count + 1], into the tag blob
+    tag_codes   int32[tag key count * node_count], one column per SPATIAL_TAG_KEYS
+                key; 0 = no such tag, n = n-th value of the key in the vocabulary
+    tag blob    UTF-8 JSON of each node's remaining fields (tags, ...)
+    vocabulary  JSON {"keys": [...], "values": [[...], ...]}
+
+Without an index file the JSON dump is loaded as before. Both indexes answer
+radius, k-nearest and bounding-box queries over the same grid: candidates
+come from the cells the query covers (k-nearest widens a square of cells
+around the point until the k-th match is provably nearer than anything
+outside it), tag filters are applied to the candidates, and with NumPy the
+distances of all candidates are computed in one array operation and only the
+nearest `limit` are sorted (argpartition).
+
+Tag filters map an OSM key to a value or list of values, or to None for any
+value; a node matches if any entry matches:
+    {'amenity': ['cafe', 'restaurant'], 'shop': 'bakery', 'tourism': None}
+"""
 import json
-from math import radians, cos, sin, asin, sqrt
+from math import radians, cos, sin, asin, sqrt, pi
+import argparse
+import bisect
 import collections
+import mmap
+import os
+import struct
+import sys
 import time
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Scalar radius search; k-nearest and bounding-box queries need NumPy
+
+from config.constants import SPATIAL_OSM_DATA_PATH, SPATIAL_INDEX_PATH, SPATIAL_GRID_SIZE, SPATIAL_TAG_KEYS
+
 # Global variables to store the loaded data and spatial index
 _spatial_index = None
 _data_loaded = False
 
-class SpatialIndex:
-    def __init__(self, grid_size=0.01):  # Approximately 1km grid cells
+INDEX_MAGIC = b'YHSPIDX\0'
+INDEX_VERSION = 2
+_HEADER = struct.Struct('<8sIIdQQQQ')
+_HEADER_SIZE = 64
+_CELL_ROW = 1 << 32
+_NODE_FIELDS = ('type', 'id', 'lat', 'lon')
+_KM_PER_DEGREE = 6371 * pi / 180
+
+
+def _grid_cell(lat, lon, grid_size):
+    # Convert coordinates to grid cell indices
+    return (int(lat / grid_size), int(lon / grid_size))
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate the distance between two points in kilometers"""
+    R = 6371  # Earth's radius in kilometers
+
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    return R * c
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """Distances in kilometers from one point to arrays of points"""
+    R = 6371  # Earth's radius in kilometers
+
+    lat1, lon1 = radians(lat), radians(lon)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - lon1
+
+    a = np.sin(dlat/2)**2 + cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return R * c
+
+
+def _top(distances, limit):
+    """
+    Indices into distances, nearest first, at most limit of them
+
+    Only the nearest `limit` are sorted; ties keep their order.
+    """
+    if limit is not None and limit < len(distances):
+        if limit <= 0:
+            return np.zeros(0, dtype=np.int64)
+        order = np.sort(np.argpartition(distances, limit - 1)[:limit])
+    else:
+        order = np.arange(len(distances))
+    return order[np.argsort(distances[order], kind='stable')]
+
+
+def _limited(results, limit):
+    return results if limit is None else results[:max(limit, 0)]
+
+
+def _cell_radius(radius_km, grid_size):
+    # Convert radius to approximate grid cells
+    return int(radius_km / (grid_size * 111)) + 1  # 111km per degree
+
+
+def _ring_bound_km(lat, cell_radius, grid_size):
+    """
+    Lower bound on the distance from a point to any node outside the square
+    of cells cell_radius around the point's own cell
+    """
+    if cell_radius <= 0:
+        return 0.0
+    degrees = cell_radius * grid_size  # Every cell is at least grid_size wide
+    lon_scale = cos(radians(min(90.0, abs(lat) + degrees)))
+    return degrees * _KM_PER_DEGREE * lon_scale * 0.999
+
+
+def _annulus(center_lat, center_lon, inner, outer):
+    """Cell rectangles covering the square of radius outer minus the square of radius inner"""
+    if inner < 0:
+        return [(center_lat - outer, center_lat + outer, center_lon - outer, center_lon + outer)]
+    if outer <= inner:
+        return []
+    return [
+        (center_lat - outer, center_lat - inner - 1, center_lon - outer, center_lon + outer),
+        (center_lat + inner + 1, center_lat + outer, center_lon - outer, center_lon + outer),
+        (center_lat - inner, center_lat + inner, center_lon - outer, center_lon - inner - 1),
+        (center_lat - inner, center_lat + inner, center_lon + inner + 1, center_lon + outer),
+    ]
+
+
+def normalize_tag_filter(tags):
+    """
+    Normalize a tag filter to {key: frozenset of values or None}
+
+    Args:
+        tags (dict): {key: value | [values] | None}
+
+    Returns:
+        dict: None if tags is empty
+    """
+    if not tags:
+        return None
+    if not isinstance(tags, dict):
+        raise ValueError("tags must map OSM keys to a value, a list of values or null")
+    normalized = {}
+    for key, values in tags.items():
+        if values is None:
+            normalized[str(key)] = None
+        elif isinstance(values, (list, tuple, set, frozenset)):
+            normalized[str(key)] = frozenset(str(value) for value in values)
+        else:
+            normalized[str(key)] = frozenset([str(values)])
+    return normalized
+
+
+def _node_matches(node, tags):
+    node_tags = node.get('tags') or {}
+    for key, values in tags.items():
+        if key in node_tags and (values is None or node_tags[key] in values):
+            return True
+    return False
+
+
+class _GridQueries:
+    """
+    Radius, k-nearest and bounding-box queries over a grid index
+
+    Subclasses provide the nodes of a rectangle of cells (_rect_positions),
+    their coordinates, tag matching, node dicts and the extent of the data.
+    """
+
+    def _get_grid_cell(self, lat, lon):
+        return _grid_cell(lat, lon, self.grid_size)
+
+    def _candidates(self, lat_low, lat_high, lon_low, lon_high, tags):
+        """Positions of nodes in the cells lat_low..lat_high x lon_low..lon_high passing the tag filter"""
+        positions = self._rect_positions(lat_low, lat_high, lon_low, lon_high)
+        if tags and len(positions):
+            positions = positions[self._tag_mask(positions, tags)]
+        return positions
+
+    def _results(self, positions, distances):
+        return [
+            {'node': self._node_at(position), 'distance': distance}
+            for position, distance in zip(positions.tolist(), distances.tolist())
+        ]
+
+    def search_nearby(self, lat, lon, radius_km=1.0, limit=None, tags=None):
+        """
+        Search for nodes within radius_km of the given coordinates
+
+        Args:
+            limit (int): Return only the nearest `limit` nodes
+            tags (dict): Tag filter (see normalize_tag_filter)
+
+        Returns:
+            list: [{'node': ..., 'distance': km}], nearest first
+        """
+        tags = normalize_tag_filter(tags)
+        if np is None:
+            results = self._search_scalar(lat, lon, radius_km)
+            if tags:
+                results = [result for result in results if _node_matches(result['node'], tags)]
+            return _limited(results, limit)
+
+        cell_radius = _cell_radius(radius_km, self.grid_size)
+        center_lat, center_lon = self._get_grid_cell(lat, lon)
+        positions = self._candidates(center_lat - cell_radius, center_lat + cell_radius,
+                                     center_lon - cell_radius, center_lon + cell_radius, tags)
+        if not len(positions):
+            return []
+        distances = haversine_distances(lat, lon, *self._coordinates(positions))
+        within = np.flatnonzero(distances <= radius_km)
+        order = within[_top(distances[within], limit)]
+        return self._results(positions[order], distances[order])
+
+    def nearest(self, lat, lon, k=10, tags=None, max_radius_km=None):
+        """
+        The k nodes nearest to the given coordinates
+
+        Args:
+            k (int): Number of nodes
+            tags (dict): Tag filter (see normalize_tag_filter)
+            max_radius_km (float): Ignore nodes farther than this
+
+        Returns:
+            list: [{'node': ..., 'distance': km}], nearest first
+        """
+        if np is None:
+            raise RuntimeError("k-nearest search requires NumPy")
+        tags = normalize_tag_filter(tags)
+        extent = self._cell_extent()
+        if k <= 0 or extent is None:
+            return []
+        lat_min, lat_max, lon_min, lon_max = extent
+        center_lat, center_lon = self._get_grid_cell(lat, lon)
+        # Square of cells that reaches every node
+        full_radius = max(center_lat - lat_min, lat_max - center_lat, center_lon - lon_min, lon_max - center_lon, 0)
+
+        found_positions, found_distances = [], []
+        scanned, cell_radius = -1, 1
+        while True:
+            cell_radius = min(cell_radius, full_radius)
+            for rect in _annulus(center_lat, center_lon, scanned, cell_radius):
+                positions = self._candidates(*rect, tags)
+                if not len(positions):
+                    continue
+                distances = haversine_distances(lat, lon, *self._coordinates(positions))
+                if max_radius_km is not None:
+                    keep = distances <= max_radius_km
+                    positions, distances = positions[keep], distances[keep]
+                found_positions.append(positions)
+                found_distances.append(distances)
+            scanned = cell_radius
+
+            # Stop once k matches are nearer than anything in the cells not yet scanned
+            bound = _ring_bound_km(lat, cell_radius, self.grid_size)
+            if cell_radius >= full_radius or (max_radius_km is not None and bound >= max_radius_km):
+                break
+            if sum(int(np.count_nonzero(distances <= bound)) for distances in found_distances) >= k:
+                break
+            cell_radius *= 2
+
+        if not found_positions:
+            return []
+        positions = np.concatenate(found_positions)
+        distances = np.concatenate(found_distances)
+        order = _top(distances, k)
+        return self._results(positions[order], distances[order])
+
+    def within_bbox(self, south, west, north, east, limit=None, tags=None):
+        """
+        Nodes inside a bounding box (not crossing the antimeridian)
+
+        Args:
+            limit (int): Return only the `limit` nodes nearest the box center
+            tags (dict): Tag filter (see normalize_tag_filter)
+
+        Returns:
+            list: [{'node': ..., 'distance': km from the box center}], nearest first
+        """
+        if np is None:
+            raise RuntimeError("Bounding-box search requires NumPy")
+        tags = normalize_tag_filter(tags)
+        south, north = min(south, north), max(south, north)
+        west, east = min(west, east), max(west, east)
+        lat_low, lon_low = self._get_grid_cell(south, west)
+        lat_high, lon_high = self._get_grid_cell(north, east)
+        positions = self._candidates(lat_low, lat_high, lon_low, lon_high, tags)
+        if not len(positions):
+            return []
+        lats, lons = self._coordinates(positions)
+        inside = np.flatnonzero((lats >= south) & (lats <= north) & (lons >= west) & (lons <= east))
+        distances = haversine_distances((south + north) / 2, (west + east) / 2, lats[inside], lons[inside])
+        order = _top(distances, limit)
+        return self._results(positions[inside[order]], distances[order])
+
+
+class SpatialIndex(_GridQueries):
+    def __init__(self, grid_size=SPATIAL_GRID_SIZE):  # Approximately 1km grid cells
         self.grid_size = grid_size
         self.grid = collections.defaultdict(list)
         self.nodes = {}
-    
-    def _get_grid_cell(self, lat, lon):
-        # Convert coordinates to grid cell indices
-        lat_idx = int(lat / self.grid_size)
-        lon_idx = int(lon / self.grid_size)
-        return (lat_idx, lon_idx)
-    
+        self._arrays = None
+
     def build_index(self, nodes):
         """Build spatial index from nodes data"""
         for node in nodes:
@@ -27,111 +330,414 @@ class SpatialIndex:
                 cell = self._get_grid_cell(lat, lon)
                 self.grid[cell].append(node['id'])
                 self.nodes[node['id']] = node
+        self._arrays = None
 
-    def haversine_distance(self, lat1, lon1, lat2, lon2):
-        """Calculate the distance between two points in kilometers"""
-        R = 6371  # Earth's radius in kilometers
+    def _get_arrays(self):
+        """Coordinate arrays of all nodes and each cell's positions in them, built on first search"""
+        if self._arrays is None:
+            node_list = list(self.nodes.values())
+            positions = {node['id']: position for position, node in enumerate(node_list)}
+            lats = np.array([node['lat'] for node in node_list], dtype=np.float64)
+            lons = np.array([node['lon'] for node in node_list], dtype=np.float64)
+            cells = {cell: np.array([positions[node_id] for node_id in node_ids], dtype=np.int64)
+                     for cell, node_ids in self.grid.items()}
+            self._arrays = (node_list, lats, lons, cells)
+        return self._arrays
+
+    def _rect_positions(self, lat_low, lat_high, lon_low, lon_high):
+        cells = self._get_arrays()[3]
+        if (lat_high - lat_low + 1) * (lon_high - lon_low + 1) <= len(cells):
+            found = [cells[(i, j)] for i in range(lat_low, lat_high + 1)
+                     for j in range(lon_low, lon_high + 1) if (i, j) in cells]
+        else:
+            found = [positions for (i, j), positions in cells.items()
+                     if lat_low <= i <= lat_high and lon_low <= j <= lon_high]
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
 
-        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+    def _coordinates(self, positions):
+        _, lats, lons, _ = self._get_arrays()
+        return lats[positions], lons[positions]
 
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
-        return R * c
+    def _tag_mask(self, positions, tags):
+        node_list = self._get_arrays()[0]
+        return np.array([_node_matches(node_list[position], tags) for position in positions.tolist()], dtype=bool)
 
-    def search_nearby(self, lat, lon, radius_km=1.0):
-        """Search for nodes within radius_km of the given coordinates"""
-        # Convert radius to approximate grid cells
-        cell_radius = int(radius_km / (self.grid_size * 111)) + 1  # 111km per degree
+    def _node_at(self, position):
+        return self._get_arrays()[0][position]
+
+    def _cell_extent(self):
+        if not self.grid:
+            return None
+        lat_cells = [cell[0] for cell in self.grid]
+        lon_cells = [cell[1] for cell in self.grid]
+        return min(lat_cells), max(lat_cells), min(lon_cells), max(lon_cells)
+
+    def haversine_distance(self, lat1, lon1, lat2, lon2):
+        return haversine_distance(lat1, lon1, lat2, lon2)
+
+    def _search_scalar(self, lat, lon, radius_km):
+        cell_radius = _cell_radius(radius_km, self.grid_size)
         center_cell = self._get_grid_cell(lat, lon)
-        
+
         nearby_nodes = []
-        
+
         # Search surrounding grid cells
         for i in range(-cell_radius, cell_radius + 1):
             for j in range(-cell_radius, cell_radius + 1):
                 cell = (center_cell[0] + i, center_cell[1] + j)
-                
+
                 # Get nodes in this cell
                 for node_id in self.grid.get(cell, []):
                     node = self.nodes[node_id]
                     distance = self.haversine_distance(
-                        lat, lon, 
+                        lat, lon,
                         node['lat'], node['lon']
                     )
-                    
+
                     if distance <= radius_km:
                         nearby_nodes.append({
                             'node': node,
                             'distance': distance
                         })
-        
+
         # Sort by distance
         nearby_nodes.sort(key=lambda x: x['distance'])
         return nearby_nodes
 
+
+class BinarySpatialIndex(_GridQueries):
+    """Read-only view of an index file built by build_binary_index"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, key_count, grid_size, node_count, cell_count, vocabulary_offset, vocabulary_length = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} spatial index; rebuild it")
+        self.path = path
+        self.grid_size = grid_size
+        self.node_count = node_count
+        self.cell_count = cell_count
+
+        view = memoryview(self._mmap)
+        sections = {}
+        offset = _HEADER_SIZE
+        for name, code, length in _sections(node_count, cell_count, key_count):
+            size = struct.calcsize(code) * length
+            sections[name] = view[offset:offset + size].cast(code)
+            offset += _aligned(size)
+        self.lat = sections['lat']
+        self.lon = sections['lon']
+        self.ids = sections['ids']
+        self.cell_keys = sections['cell_keys']
+        self.cell_starts = sections['cell_starts']
+        self.tag_offsets = sections['tag_offsets']
+        self._tags = view[offset:vocabulary_offset]
+
+        vocabulary = json.loads(bytes(view[vocabulary_offset:vocabulary_offset + vocabulary_length]))
+        self.tag_keys = vocabulary['keys']
+        # value -> code per indexed key; code 0 means the node has no such tag
+        self._tag_values = {
+            key: {value: code for code, value in enumerate(values, start=1)}
+            for key, values in zip(vocabulary['keys'], vocabulary['values'])
+        }
+        if np is not None:
+            # Zero-copy views of the mapped columns
+            self._lat_array = np.frombuffer(self.lat, dtype=np.float64)
+            self._lon_array = np.frombuffer(self.lon, dtype=np.float64)
+            tag_codes = np.frombuffer(sections['tag_codes'], dtype=np.int32)
+            self._tag_columns = {key: tag_codes[index * node_count:(index + 1) * node_count]
+                                 for index, key in enumerate(self.tag_keys)}
+
+    def node(self, position):
+        """Rebuild the OSM node dict stored at position"""
+        node = {'type': 'node', 'id': self.ids[position], 'lat': self.lat[position], 'lon': self.lon[position]}
+        start, end = self.tag_offsets[position], self.tag_offsets[position + 1]
+        if end > start:
+            node.update(json.loads(bytes(self._tags[start:end])))
+        return node
+
+    _node_at = node
+
+    def _row_span(self, lat_idx, lon_low, lon_high):
+        """Node positions of the cells (lat_idx, lon_low..lon_high), contiguous in the file"""
+        row = lat_idx * _CELL_ROW
+        first = bisect.bisect_left(self.cell_keys, row + lon_low)
+        last = bisect.bisect_right(self.cell_keys, row + lon_high)
+        if first == last:
+            return 0, 0
+        return self.cell_starts[first], self.cell_starts[last]
+
+    def _spans(self, lat_low, lat_high, lon_low, lon_high):
+        if self.cell_count:
+            # Rows outside the data hold nothing
+            lat_low = max(lat_low, _cell_lat(self.cell_keys[0]))
+            lat_high = min(lat_high, _cell_lat(self.cell_keys[self.cell_count - 1]))
+        for lat_idx in range(lat_low, lat_high + 1):
+            start, end = self._row_span(lat_idx, lon_low, lon_high)
+            if end > start:
+                yield start, end
+
+    def _rect_positions(self, lat_low, lat_high, lon_low, lon_high):
+        spans = list(self._spans(lat_low, lat_high, lon_low, lon_high))
+        if not spans:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in spans])
+
+    def _coordinates(self, positions):
+        return self._lat_array[positions], self._lon_array[positions]
+
+    def _tag_mask(self, positions, tags):
+        mask = np.zeros(len(positions), dtype=bool)
+        unindexed = {}
+        for key, values in tags.items():
+            column = self._tag_columns.get(key)
+            if column is None:
+                unindexed[key] = values
+                continue
+            codes = column[positions]
+            if values is None:
+                mask |= codes != 0
+            else:
+                wanted = [self._tag_values[key][value] for value in values if value in self._tag_values[key]]
+                if wanted:
+                    mask |= np.isin(codes, wanted)
+        if unindexed:
+            # Keys without a column: read the remaining candidates' tags
+            for index, position in enumerate(positions.tolist()):
+                if not mask[index] and _node_matches(self.node(position), unindexed):
+                    mask[index] = True
+        return mask
+
+    def _cell_extent(self):
+        if not self.cell_count:
+            return None
+        keys = np.frombuffer(self.cell_keys, dtype=np.int64)
+        lon_cells = keys - _cell_lat(keys) * _CELL_ROW
+        return (_cell_lat(self.cell_keys[0]), _cell_lat(self.cell_keys[self.cell_count - 1]),
+                int(lon_cells.min()), int(lon_cells.max()))
+
+    def _search_scalar(self, lat, lon, radius_km):
+        cell_radius = _cell_radius(radius_km, self.grid_size)
+        center_lat, center_lon = self._get_grid_cell(lat, lon)
+        matches = []
+        for start, end in self._spans(center_lat - cell_radius, center_lat + cell_radius,
+                                      center_lon - cell_radius, center_lon + cell_radius):
+            for position in range(start, end):
+                distance = haversine_distance(lat, lon, self.lat[position], self.lon[position])
+                if distance <= radius_km:
+                    matches.append((distance, position))
+
+        # Sort by distance; only matches are decoded into dicts
+        matches.sort()
+        return [{'node': self.node(position), 'distance': distance} for distance, position in matches]
+
+
+def _cell_lat(key):
+    # Keys are lat_idx * 2**32 + lon_idx with |lon_idx| < 2**31
+    return (key + _CELL_ROW // 2) // _CELL_ROW
+
+
+def _aligned(size):
+    return (size + 7) // 8 * 8
+
+
+def _sections(node_count, cell_count, key_count):
+    return (
+        ('lat', 'd', node_count),
+        ('lon', 'd', node_count),
+        ('ids', 'q', node_count),
+        ('cell_keys', 'q', cell_count),
+        ('cell_starts', 'q', cell_count + 1),
+        ('tag_offsets', 'q', node_count + 1),
+        ('tag_codes', 'i', key_count * node_count),
+    )
+
+
+def build_binary_index(input_path=SPATIAL_OSM_DATA_PATH, output_path=SPATIAL_INDEX_PATH,
+                       grid_size=SPATIAL_GRID_SIZE, tag_keys=SPATIAL_TAG_KEYS):
+    """
+    Convert an OSM JSON dump into the binary index read by BinarySpatialIndex
+
+    Args:
+        input_path (str): OSM JSON dump ({"elements": [...]})
+        output_path (str): Index file to write; replaced atomically
+        grid_size (float): Grid cell size in degrees
+        tag_keys (list): Tag keys stored as filterable columns
+
+    Returns:
+        int: Number of nodes written
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    nodes = []
+    for elem in data.get('elements', []):
+        if elem.get('type') == 'node' and 'lat' in elem and 'lon' in elem:
+            lat_idx, lon_idx = _grid_cell(elem['lat'], elem['lon'], grid_size)
+            nodes.append((lat_idx * _CELL_ROW + lon_idx, elem))
+    del data
+    nodes.sort(key=lambda item: item[0])
+
+    tag_keys = list(tag_keys)
+    vocabulary = {key: {} for key in tag_keys}
+    tag_codes = [[0] * len(nodes) for _ in tag_keys]
+    cell_keys, cell_starts, tag_offsets, blobs = [], [], [0], []
+    for position, (key, node) in enumerate(nodes):
+        if not cell_keys or cell_keys[-1] != key:
+            cell_keys.append(key)
+            cell_starts.append(position)
+        extra = {field: value for field, value in node.items() if field not in _NODE_FIELDS}
+        blob = json.dumps(extra, ensure_ascii=False, separators=(',', ':')).encode('utf-8') if extra else b''
+        blobs.append(blob)
+        tag_offsets.append(tag_offsets[-1] + len(blob))
+        node_tags = node.get('tags') or {}
+        for column, tag_key in enumerate(tag_keys):
+            if tag_key in node_tags:
+                values = vocabulary[tag_key]
+                tag_codes[column][position] = values.setdefault(str(node_tags[tag_key]), len(values) + 1)
+    cell_starts.append(len(nodes))
+
+    columns = {
+        'lat': [node['lat'] for _, node in nodes],
+        'lon': [node['lon'] for _, node in nodes],
+        'ids': [node['id'] for _, node in nodes],
+        'cell_keys': cell_keys,
+        'cell_starts': cell_starts,
+        'tag_offsets': tag_offsets,
+        'tag_codes': [code for column in tag_codes for code in column],
+    }
+    vocabulary_blob = json.dumps({
+        'keys': tag_keys,
+        'values': [list(vocabulary[key]) for key in tag_keys],  # In code order
+    }, ensure_ascii=False).encode('utf-8')
+
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.seek(_HEADER_SIZE)
+        for name, code, length in _sections(len(nodes), len(cell_keys), len(tag_keys)):
+            section = struct.pack(f'<{length}{code}', *columns[name])
+            f.write(section.ljust(_aligned(len(section)), b'\0'))
+        for blob in blobs:
+            f.write(blob)
+        vocabulary_offset = f.tell()
+        f.write(vocabulary_blob)
+        f.seek(0)
+        f.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(tag_keys), grid_size, len(nodes), len(cell_keys),
+                             vocabulary_offset, len(vocabulary_blob)))
+    os.replace(temp_path, output_path)
+    return len(nodes)
+
+
+def _index_is_current(index_path, data_path):
+    if not os.path.exists(index_path):
+        return False
+    # The dump may be absent (only the index is deployed) or older than the index
+    return not os.path.exists(data_path) or os.path.getmtime(index_path) >= os.path.getmtime(data_path)
+
+
+def _load_json_index():
+    # Read the JSON file
+    with open(SPATIAL_OSM_DATA_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # Initialize spatial index and build index
+    spatial_index = SpatialIndex()
+    nodes = [elem for elem in data.get('elements', []) if elem.get('type') == 'node']
+    spatial_index.build_index(nodes)
+    return spatial_index
+
+
 def initialize_data():
     """Load data and initialize spatial index once at server startup"""
     global _spatial_index, _data_loaded
-    
+
     if _data_loaded:
         return _spatial_index
-        
+
     try:
         start_load = time.time()
-        
-        # Read the JSON file
-        with open('map_db/tokyo_osm_data_11042024.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Initialize spatial index and build index
-        _spatial_index = SpatialIndex()
-        nodes = [elem for elem in data.get('elements', []) if elem.get('type') == 'node']
-        _spatial_index.build_index(nodes)
-        
+
+        _spatial_index = None
+        if _index_is_current(SPATIAL_INDEX_PATH, SPATIAL_OSM_DATA_PATH):
+            try:
+                _spatial_index = BinarySpatialIndex(SPATIAL_INDEX_PATH)
+            except ValueError as e:
+                print(f"[SPATIAL] {str(e)}")
+        if _spatial_index is None:
+            print(f"[SPATIAL] No current index at {SPATIAL_INDEX_PATH}; loading {SPATIAL_OSM_DATA_PATH} "
+                  f"(build one with: python spatial_search.py build)")
+            _spatial_index = _load_json_index()
+
         load_time = time.time() - start_load
         print("\nInitial Data Loading Time:", f"{load_time:.3f} seconds")
-        
+
         _data_loaded = True
         return _spatial_index
-        
+
     except Exception as e:
         print(f"Error initializing data: {str(e)}")
         return None
 
-def load_and_search(lat, lon, radius_km=1.0):
-    """Perform spatial search using pre-loaded data"""
+def _timed_query(query, *args, **kwargs):
+    """Run a query method of the pre-loaded index, loading it first if needed"""
     global _spatial_index
-    
+
     try:
         # Use existing spatial index or initialize if not loaded
         if not _spatial_index:
             _spatial_index = initialize_data()
             if not _spatial_index:
                 return []
-        
+
         # Perform search
         start_search = time.time()
-        results = _spatial_index.search_nearby(lat, lon, radius_km)
+        results = getattr(_spatial_index, query)(*args, **kwargs)
         search_time = time.time() - start_search
-        
+
         print(f"Search execution: {search_time:.3f} seconds")
-        
+
         return results
-        
+
+    except (ValueError, RuntimeError):
+        raise  # Bad filter or missing NumPy: the caller's error to report
     except Exception as e:
         print(f"Error in search: {str(e)}")
         return []
 
+def load_and_search(lat, lon, radius_km=1.0, limit=None, tags=None):
+    """Perform spatial search using pre-loaded data; limit keeps the nearest nodes only"""
+    return _timed_query('search_nearby', lat, lon, radius_km, limit=limit, tags=tags)
+
+def load_and_find_nearest(lat, lon, k=10, tags=None, max_radius_km=None):
+    """k-nearest search using pre-loaded data"""
+    return _timed_query('nearest', lat, lon, k, tags=tags, max_radius_km=max_radius_km)
+
+def load_and_search_bbox(south, west, north, east, limit=None, tags=None):
+    """Bounding-box search using pre-loaded data"""
+    return _timed_query('within_bbox', south, west, north, east, limit=limit, tags=tags)
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'build':
+        parser = argparse.ArgumentParser(description='Build the binary spatial index from an OSM JSON dump')
+        parser.add_argument('--input', default=SPATIAL_OSM_DATA_PATH)
+        parser.add_argument('--output', default=SPATIAL_INDEX_PATH)
+        parser.add_argument('--grid-size', type=float, default=SPATIAL_GRID_SIZE)
+        args = parser.parse_args(sys.argv[2:])
+        start_build = time.time()
+        count = build_binary_index(args.input, args.output, args.grid_size)
+        print(f"Wrote {count} nodes to {args.output} in {time.time() - start_build:.1f} seconds")
+        sys.exit(0)
+
     # Example usage
     TEST_LAT = 35.6895
     TEST_LON = 139.6917
     TEST_RADIUS = 0.1 # Search radius in kilometers
-    
+
     results = load_and_search(TEST_LAT, TEST_LON, TEST_RADIUS)
-    
+
     print(f"\nFound {len(results)} nodes within {TEST_RADIUS}km of ({TEST_LAT}, {TEST_LON}):")
     for item in results:  # Show first 5 results
         node = item['node']
@@ -139,4 +745,4 @@ if __name__ == "__main__":
         print(f"Distance: {item['distance']:.2f}km")
         print(f"Location: ({node['lat']}, {node['lon']})")
         if 'tags' in node:
-            print("Tags:", node['tags'])
\ No newline at end of file
+            print("Tags:", node['tags'])
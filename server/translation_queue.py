@@ -1,93 +1,217 @@
-from asyncio import Queue, Lock, new_event_loop, set_event_loop
-import asyncio
+"""
+Translation Scheduler
+Token-bucket rate limiting for model calls with priority classes and fair
+sharing across chatrooms
+"""
+import os
+import threading
 import time
-from collections import deque
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+
+from config.constants import (
+    TRANSLATION_REQUESTS_PER_MINUTE,
+    TRANSLATION_TOKENS_PER_MINUTE,
+    TRANSLATION_SCHEDULER_CONCURRENCY,
+    TRANSLATION_PROMPT_OVERHEAD_TOKENS
+)
+
+# Priority classes, most urgent first
+PRIORITY_LIVE = 0       # New chat messages
+PRIORITY_BACKFILL = 1   # History translations
+PRIORITY_PREVIEW = 2    # Preview-before-send
+PRIORITIES = (PRIORITY_LIVE, PRIORITY_BACKFILL, PRIORITY_PREVIEW)
+
+
+def estimate_tokens(original_text, token_encoding_name="cl100k_base"):
+    """
+    Estimate the tokens a translation request will consume against the
+    tokens-per-minute budget: system prompt + source text + a completion
+    about as long as the source
+    """
+    text = original_text or ''
+    request_json = {
+        "messages": [{"role": "user", "content": text}],
+        "max_tokens": max(len(text), 1),  # Upper bound: one token per character
+    }
+    try:
+        from gpt_api_parrallel_processor import num_tokens_consumed_from_request
+        tokens = num_tokens_consumed_from_request(request_json, "chat/completions", token_encoding_name)
+    except Exception:
+        tokens = 2 * len(text) + 6  # Tokenizer unavailable; same bound without encoding
+    return tokens + TRANSLATION_PROMPT_OVERHEAD_TOKENS
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most one minute of budget"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be consumed (requests larger than capacity wait for a full bucket)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount):
+        self.available -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self.available = min(self.capacity, self.available + min(amount, self.capacity))
+
 
 @dataclass
-class RateLimitWindow:
-    requests: int = 0
-    window_start: datetime = datetime.now()
-    
-class TranslationQueueManager:
-    def __init__(self, requests_per_minute=500):  # OpenAI tier 1 limit
-        # Initialize event loop if not exists
-        try:
-            self.loop = asyncio.get_event_loop()
-        except RuntimeError:
-            self.loop = new_event_loop()
-            set_event_loop(self.loop)
-            
-        self.queue = Queue()
-        self.processing = False
-        self.rate_limit_lock = Lock()
-        self.requests_per_minute = requests_per_minute
-        self.current_window = RateLimitWindow()
-        
-    async def add_translation_request(self, func, *args, **kwargs):
-        # Add request to queue
-        task_id = id(args[1])  # Use original_text's id as task_id
-        future = self.loop.create_future()
-        await self.queue.put((task_id, func, args, kwargs, future))
-        
-        # Start processing if not already running
-        if not self.processing:
-            self.processing = True
-            self.loop.create_task(self._process_queue())
-            
-        return await future
-    
-    async def _check_rate_limit(self):
-        async with self.rate_limit_lock:
-            now = datetime.now()
-            # Reset window if more than a minute has passed
-            if now - self.current_window.window_start > timedelta(minutes=1):
-                self.current_window = RateLimitWindow(window_start=now)
-            
-            if self.current_window.requests >= self.requests_per_minute:
-                wait_time = 60 - (now - self.current_window.window_start).seconds
-                await asyncio.sleep(wait_time)
-                self.current_window = RateLimitWindow(window_start=now)
-                
-            self.current_window.requests += 1
-    
-    async def _process_queue(self):
+class ScheduledTask:
+    func: Callable
+    args: tuple
+    kwargs: dict
+    tokens: int
+    future: Future = field(default_factory=Future)
+
+
+class TranslationScheduler:
+    """
+    Runs model calls on a bounded set of worker threads (green threads under
+    eventlet) while staying under requests-per-minute and tokens-per-minute
+    budgets. Higher priority classes are always served first; inside a class,
+    chatrooms take turns so one busy room cannot starve the others.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, max_concurrency=16):
+        self.max_concurrency = max_concurrency
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        # priority -> OrderedDict(room -> deque of tasks); room order is the round-robin turn
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._condition = threading.Condition()
+        self._workers = []
+        self._pid = None
+        self._in_flight = 0
+        self._completed = 0
+        self._refunded = 0
+
+    def submit(self, func, *args, priority=PRIORITY_LIVE, room=None, tokens=0, **kwargs):
+        """
+        Queue func(*args, **kwargs)
+
+        Args:
+            priority (int): One of PRIORITY_LIVE, PRIORITY_BACKFILL, PRIORITY_PREVIEW
+            room: Fair-share key, normally the chatroom id
+            tokens (int): Estimated tokens the call consumes (see estimate_tokens)
+
+        Returns:
+            concurrent.futures.Future: resolves to func's return value
+        """
+        task = ScheduledTask(func, args, kwargs, tokens)
+        with self._condition:
+            self._ensure_workers()
+            self._queues[priority].setdefault(room, deque()).append(task)
+            self._condition.notify()
+        return task.future
+
+    def refund(self, tokens):
+        """Return the budget of a task that made no upstream call (a late cache hit)"""
+        with self._condition:
+            self._requests.refund(1)
+            self._tokens.refund(tokens)
+            self._refunded += 1
+            self._condition.notify()
+
+    def _ensure_workers(self):
+        # Workers are started lazily and restarted after a fork (gunicorn preload_app)
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._workers = []
+        for index in range(self.max_concurrency):
+            worker = threading.Thread(target=self._work, name=f'translation-scheduler-{index}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _peek(self):
+        """Return (priority, room, task) of the next task to run, or None"""
+        for priority in PRIORITIES:
+            rooms = self._queues[priority]
+            if rooms:
+                room, tasks = next(iter(rooms.items()))
+                return priority, room, tasks[0]
+        return None
+
+    def _pop(self, priority, room):
+        rooms = self._queues[priority]
+        tasks = rooms[room]
+        task = tasks.popleft()
+        if tasks:
+            rooms.move_to_end(room)  # Next turn goes to another room
+        else:
+            del rooms[room]
+        return task
+
+    def _take(self):
+        """Block until a task is queued and the rate budgets allow it"""
+        with self._condition:
+            while True:
+                head = self._peek()
+                if head is None:
+                    self._condition.wait()
+                    continue
+                priority, room, task = head
+                now = time.monotonic()
+                delay = max(self._requests.wait_time(1, now), self._tokens.wait_time(task.tokens, now))
+                if delay > 0:
+                    # Re-evaluate after the wait: a more urgent task may have arrived
+                    self._condition.wait(delay)
+                    continue
+                self._requests.consume(1)
+                self._tokens.consume(task.tokens)
+                self._in_flight += 1
+                return self._pop(priority, room)
+
+    def _work(self):
         while True:
-            try:
-                if self.queue.empty():
-                    self.processing = False
-                    break
-                    
-                task_id, func, args, kwargs, future = await self.queue.get()
-                
-                # Check rate limit before processing
-                await self._check_rate_limit()
-                
-                # Process translation
+            task = self._take()
+            if task.future.set_running_or_notify_cancel():
                 try:
-                    result = await self._execute_translation(func, *args, **kwargs)
-                    future.set_result(result)
-                except Exception as e:
-                    future.set_exception(e)
-                finally:
-                    self.queue.task_done()
-                    
-            except Exception as e:
-                print(f"Error processing queue: {str(e)}")
-                continue
-    
-    async def _execute_translation(self, func, *args, **kwargs):
-        # Convert synchronous function to async
-        return await self.loop.run_in_executor(None, func, *args, **kwargs)
-
-# Create global queue manager instance with proper event loop initialization
-def create_translation_queue():
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = new_event_loop()
-        set_event_loop(loop)
-    return TranslationQueueManager()
+                    task.future.set_result(task.func(*task.args, **task.kwargs))
+                except BaseException as e:
+                    task.future.set_exception(e)
+            with self._condition:
+                self._in_flight -= 1
+                self._completed += 1
+
+    def stats(self):
+        with self._condition:
+            now = time.monotonic()
+            self._requests._refill(now)
+            self._tokens._refill(now)
+            return {
+                'queued': {
+                    priority: sum(len(tasks) for tasks in self._queues[priority].values())
+                    for priority in PRIORITIES
+                },
+                'rooms_waiting': sum(len(self._queues[priority]) for priority in PRIORITIES),
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'refunded': self._refunded,
+                'requests_available': round(self._requests.available, 2),
+                'tokens_available': round(self._tokens.available, 2),
+            }
+
 
-translation_queue = create_translation_queue()
\ No newline at end of file
+translation_scheduler = TranslationScheduler(
+    requests_per_minute=TRANSLATION_REQUESTS_PER_MINUTE,
+    tokens_per_minute=TRANSLATION_TOKENS_PER_MINUTE,
+    max_concurrency=TRANSLATION_SCHEDULER_CONCURRENCY
+)
@@ -61,6 +61,7 @@ def get_db(app, db):
     while retry_count < max_retries:
         try:
             db.create_all()
+            create_missing_indexes(db)
             print(f"[DATABASE] Successfully initialized after {retry_count + 1} attempts")
             return
         except Exception as e:
@@ -70,6 +71,22 @@ def get_db(app, db):
     raise Exception("Could not connect to database after multiple attempts")
 
 
+def create_missing_indexes(db):
+    """
+    Create indexes declared on models that existing tables do not have yet
+    (db.create_all only creates indexes together with new tables)
+
+    Args:
+        db: Database instance
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                print(f"[DATABASE] Could not create index {index.name}: {str(e)}")
+
+
 def reset_message_sequence(app, db):
     """
     Reset the message ID sequence to start from 1
@@ -31,6 +31,7 @@ let socket =  io(process.env.REACT_APP_API_URL || window.location.origin, {
 const CryptoJS = require('crypto-js');
 const local_url =process.env.REACT_APP_BACKEND_URL;
 const local_frontend_url = process.env.REACT_APP_FRONTEND_URL;
+const HISTORY_PAGE_SIZE = 50; // Messages loaded on open and per scroll-up page
 
 
 let time_remaining = 60;
@@ -66,6 +67,9 @@ function Chat() {
   const [userId, setUserId] = useState(null); // State to store the UID
   const [username, setUsername] = useState(''); // State to store the username
   const [messages, setMessages] = useState([]); // State to store translations
+  const [hasOlderMessages, setHasOlderMessages] = useState(false); // More history above the loaded page(s)
+  const loadingOlderMessagesRef = useRef(false);
+  const historyChatroomIdRef = useRef(null); // Chatroom the loaded history belongs to
   const [selectedLanguageMe, setSelectedLanguageMe] = useState(getGlobalState('selectedLanguageMe')); // for the selected language in the box
   const [selectedLanguageMePreview, setSelectedLanguageMePreview] = useState(getGlobalState('selectedLanguageMePreview'));
   const [visibleMessages, setVisibleMessages] = useState({});
@@ -481,7 +485,8 @@ const handleSendMessage = () => {
       replyToMessageId: replyToMessage ? replyToMessage.id : -1,
       lowCostMode: getGlobalState('lowCostMode'),
       isGuestMode: getGlobalState('isGuestMode'),
-      currHostUserId: getGlobalState('currHostUserId')
+      currHostUserId: getGlobalState('currHostUserId'),
+      stream: true
     };
     
     console.log('[SEND MESSAGE] Emitting upload_text event with payload:', payload);
@@ -830,6 +835,53 @@ socket.on('already_leave_chatroom', (data) => {
     );
   });
 
+  // Incremental translation tokens, followed by the final new_message
+  socket.on('translation_delta', (data) => {
+    if (data.chatroom_id !== getGlobalState('currChatroomId')) {
+      return;
+    }
+    if (data.userId === getGlobalState('currUserId')) {
+      if (isSplit && data.language === getGlobalState('selectedLanguageMeSecond')) {
+        setStreamingTranslationSecond(prev => prev + data.delta);
+      } else if (isSplit) {
+        setStreamingTranslationFirst(prev => prev + data.delta);
+      } else {
+        setStreamingTranslation(prev => prev + data.delta);
+      }
+      return;
+    }
+    setOtherUsersLoadingMessages(prev => prev[data.userId] ? prev : ({
+      ...prev,
+      [data.userId]: {
+        userId: data.userId,
+        content_type: 'loading',
+        timestamp: new Date().toISOString()
+      }
+    }));
+    setOtherUsersTranslations(prev => {
+      const current = prev[data.userId];
+      const sameStream = current && current.streamId === data.streamId;
+      // Split-mode senders stream two languages at once; keep each one's text apart
+      const streamedByLanguage = { ...(sameStream ? current.streamedByLanguage : {}) };
+      streamedByLanguage[data.language] = (streamedByLanguage[data.language] || '') + data.delta;
+      // Show the viewer's own language when the sender streams it, else the sender's first one
+      const viewerLanguage = [
+        getGlobalState('selectedLanguageMe'),
+        getGlobalState('selectedLanguageMeFirst'),
+        getGlobalState('selectedLanguageMeSecond')
+      ].find(language => language && streamedByLanguage[language] !== undefined);
+      return {
+        ...prev,
+        [data.userId]: {
+          ...current,
+          streamId: data.streamId,
+          streamedByLanguage,
+          translatedText: streamedByLanguage[viewerLanguage || Object.keys(streamedByLanguage)[0]]
+        }
+      };
+    });
+  });
+
   socket.on('user_speaking_to_client_start', (data) => {
     // console.log('Received speaking start:', data); // Debug log
     if (data.userId !== getGlobalState('currUserId')) {
@@ -992,6 +1044,13 @@ const fetchMessagesOnDemand = (chatroomId, language, languageFirst, languageSeco
 
 
 
+  const normalizeHistoryMessage = (msg) => ({
+    ...msg,
+    is_recalled: msg.is_recalled || '0',
+    recall_username: msg.recall_username || msg.username,
+    reply_to_message_id: msg.reply_to_message_id || -1,
+  });
+
   const fetchMessages = (chatroomId, language, languageFirst, languageSecond, splitMode) => {
     // console.log("fetchMessages", { chatroomId, language, languageFirst, languageSecond, splitMode });
     
@@ -1003,23 +1062,32 @@ const fetchMessagesOnDemand = (chatroomId, language, languageFirst, languageSeco
     language = lang_raw;
     const firstLang = splitMode ? languageFirst : language;
     const secondLang = splitMode ? languageSecond : language;
+    // Only the newest page is loaded; older pages are fetched on scroll (fetchOlderMessages)
     axios.get(`${local_url}/api/all-messages/${chatroomId}/${language}/${firstLang}/${secondLang}/${splitMode}`, {
       params: {
         userId: getGlobalState('currUserId'),
         lowCostMode: getGlobalState('lowCostMode'),
         isGuestMode: getGlobalState('isGuestMode'),
-        currHostUserId: getGlobalState('currHostUserId')
+        currHostUserId: getGlobalState('currHostUserId'),
+        limit: HISTORY_PAGE_SIZE
       }
     })
       .then(response => {
         // Make sure each message has the correct recall status
-        const messages = response.data.messages.map(msg => ({
-          ...msg,
-          is_recalled: msg.is_recalled || '0',
-          recall_username: msg.recall_username || msg.username,
-          reply_to_message_id: msg.reply_to_message_id || -1,
-        }));
-        setMessages(messages);
+        const page = response.data.messages.map(normalizeHistoryMessage);
+        const sameChatroom = historyChatroomIdRef.current === chatroomId;
+        historyChatroomIdRef.current = chatroomId;
+        setMessages(prevMessages => {
+          if (!sameChatroom || page.length === 0) {
+            return page;
+          }
+          // Refreshing the newest page keeps the older pages already scrolled into view
+          const older = prevMessages.filter(msg => msg.id < page[0].id);
+          return [...older, ...page];
+        });
+        if (!sameChatroom) {
+          setHasOlderMessages(response.data.has_more);
+        }
         // console.log("Fetched messages for chatroom:", chatroomId);
       })
       .catch(error => {
@@ -1027,6 +1095,54 @@ const fetchMessagesOnDemand = (chatroomId, language, languageFirst, languageSeco
       });
   };
 
+  // Fetch the page before the oldest loaded message and show it under "Load Previous Messages"
+  const fetchOlderMessages = () => {
+    if (loadingOlderMessagesRef.current || !hasOlderMessages || messages.length === 0) {
+      return;
+    }
+    loadingOlderMessagesRef.current = true;
+    setIsLoadingMoreMessages(true);
+    const chatroomId = getGlobalState('currChatroomId');
+    const language = 'original_text_raw';
+    const firstLang = isSplit ? getGlobalState('selectedLanguageMeFirst') : language;
+    const secondLang = isSplit ? getGlobalState('selectedLanguageMeSecond') : language;
+
+    axios.get(`${local_url}/api/all-messages/${chatroomId}/${language}/${firstLang}/${secondLang}/${isSplit}`, {
+      params: {
+        userId: getGlobalState('currUserId'),
+        lowCostMode: getGlobalState('lowCostMode'),
+        isGuestMode: getGlobalState('isGuestMode'),
+        currHostUserId: getGlobalState('currHostUserId'),
+        before: messages[0].id,
+        limit: HISTORY_PAGE_SIZE
+      }
+    })
+      .then(response => {
+        const loadedIds = new Set(messages.map(msg => msg.id));
+        const page = response.data.messages.map(normalizeHistoryMessage).filter(msg => !loadedIds.has(msg.id));
+        const merged = [...page, ...messages];
+        const newCount = Math.min(displayedMessageCount + MESSAGE_LOAD_INCREMENT, merged.length);
+        setMessages(merged);
+        setHasOlderMessages(response.data.has_more);
+        setDisplayedMessageCount(newCount);
+        fetchMessagesOnDemand(
+          chatroomId,
+          getGlobalState('selectedLanguageMe'),
+          getGlobalState('selectedLanguageMeFirst'),
+          getGlobalState('selectedLanguageMeSecond'),
+          isSplit,
+          merged.slice(-newCount).map(message => message.id).join(',')
+        );
+      })
+      .catch(error => {
+        console.error(t('Error fetching older messages:'), error);
+      })
+      .finally(() => {
+        loadingOlderMessagesRef.current = false;
+        setIsLoadingMoreMessages(false);
+      });
+  };
+
 
 
   const handlePrivateChatroom = () => {
@@ -1411,44 +1527,77 @@ const startRecording = () => {
   };
  
   
+  // Recordings above this go through the chunked HTTP upload instead of one socket packet
+  const SOCKET_AUDIO_MAX_BYTES = 4 * 1024 * 1024;
+
+  // Upload a blob in chunks to /api/uploads; resolves to the uploadId to pass to upload_audio
+  const uploadInChunks = async (blob, userId) => {
+    const { data: upload } = await axios.post(`${local_url}/api/uploads`, {
+      userId,
+      size: blob.size,
+      contentType: blob.type
+    });
+    let offset = upload.received;
+    while (offset < blob.size) {
+      const chunk = blob.slice(offset, offset + upload.chunkSize);
+      const { data: status } = await axios.put(`${local_url}/api/uploads/${upload.uploadId}`, chunk, {
+        headers: { 'Content-Type': 'application/octet-stream', 'X-Upload-Offset': String(offset) }
+      });
+      offset = status.received;
+    }
+    return upload.uploadId;
+  };
+
   const sendAudioToServer = (audioBlob, retryCount = 0) => {
-    const reader = new FileReader();
     const audioElement = new Audio(URL.createObjectURL(audioBlob));
     
-    audioElement.onloadedmetadata = () => {
+    audioElement.onloadedmetadata = async () => {
         const durationInMinutes = audioElement.duration / 60; // Convert seconds to minutes
-        
-        reader.onloadend = () => {
-            const base64Audio = reader.result.split(',')[1];
-            console.log('Audio duration in minutes:', durationInMinutes);
-
-            socket.emit('upload_audio', {
-                userId: getGlobalState('currUserId'),
-                chatroomId: getGlobalState('currChatroomId'),
-                audio: base64Audio,
-                username: username,
-                toLanguageMe: selectedLanguageMe,
-                toLanguageMeFirst: selectedLanguageMeFirst,
-                toLanguageMeSecond: selectedLanguageMeSecond,
-                isSplit: isSplit,
-                replyToMessageId: replyToMessage ? replyToMessage.id : -1,
-                lowCostMode: getGlobalState('lowCostMode'),
-                durationInMinutes: durationInMinutes || 0.1, // Provide default value
-                isGuestMode: getGlobalState('isGuestMode'),
-                currHostUserId: getGlobalState('currHostUserId')
-            }, (ack) => {
-                if (!ack && retryCount < MAX_RETRIES) {
-                    console.log(`Retry attempt ${retryCount + 1} for audio upload`);
-                    setTimeout(() => sendAudioToServer(audioBlob, retryCount + 1), RETRY_DELAY);
-                } else if (!ack) {
-                    console.error('Failed to upload audio after maximum retries');
-                }
-            });
-        };
-        reader.readAsDataURL(audioBlob);
-        
+        console.log('Audio duration in minutes:', durationInMinutes);
+
         // Clean up
         URL.revokeObjectURL(audioElement.src);
+
+        // The blob goes as a binary attachment (no base64), or by uploadId when it is large
+        const payload = {};
+        try {
+            if (audioBlob.size > SOCKET_AUDIO_MAX_BYTES) {
+                payload.uploadId = await uploadInChunks(audioBlob, getGlobalState('currUserId'));
+            } else {
+                payload.audio = audioBlob;
+            }
+        } catch (error) {
+            if (retryCount < MAX_RETRIES) {
+                console.log(`Retry attempt ${retryCount + 1} for audio upload`);
+                setTimeout(() => sendAudioToServer(audioBlob, retryCount + 1), RETRY_DELAY);
+            } else {
+                console.error('Failed to upload audio after maximum retries', error);
+            }
+            return;
+        }
+
+        socket.emit('upload_audio', {
+            userId: getGlobalState('currUserId'),
+            chatroomId: getGlobalState('currChatroomId'),
+            ...payload,
+            username: username,
+            toLanguageMe: selectedLanguageMe,
+            toLanguageMeFirst: selectedLanguageMeFirst,
+            toLanguageMeSecond: selectedLanguageMeSecond,
+            isSplit: isSplit,
+            replyToMessageId: replyToMessage ? replyToMessage.id : -1,
+            lowCostMode: getGlobalState('lowCostMode'),
+            durationInMinutes: durationInMinutes || 0.1, // Provide default value
+            isGuestMode: getGlobalState('isGuestMode'),
+            currHostUserId: getGlobalState('currHostUserId')
+        }, (ack) => {
+            if (!ack && retryCount < MAX_RETRIES) {
+                console.log(`Retry attempt ${retryCount + 1} for audio upload`);
+                setTimeout(() => sendAudioToServer(audioBlob, retryCount + 1), RETRY_DELAY);
+            } else if (!ack) {
+                console.error('Failed to upload audio after maximum retries');
+            }
+        });
     };
     setReplyToMessage(null); // Clear the reply preview after sending
   };
@@ -2653,10 +2802,15 @@ const handleToggleLowCostMode = () => {
             {/* Chat bubbles */}
             <div className="chat-container">
             <div className="empty-space-top"></div>
-            {messages && messages.length > displayedMessageCount && (
+            {messages && (messages.length > displayedMessageCount || hasOlderMessages) && (
                 <button 
                   className="load-more-btn"
                   onClick={() => {
+                    // Everything loaded is on screen: fetch the previous page from the server
+                    if (messages.length <= displayedMessageCount) {
+                      fetchOlderMessages();
+                      return;
+                    }
                     setIsLoadingMoreMessages(true);
                     
                     // First update the display count
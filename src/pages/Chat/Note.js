@@ -110,14 +110,28 @@ function Note() {
     
     if (socketa) {
       console.log('Sending to server:', { selectedText, promptText }); // Debug log
-      socketa.emit('ask_ai', { selectedText, promptText }, (response) => {
-        if (response && response.error) {
+      // The answer arrives as an ai_response event once the server's job pool has run it
+      const requestId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      const onAIResponse = (response) => {
+        if (!response || response.requestId !== requestId) return;
+        socketa.off('ai_response', onAIResponse);
+        if (response.error) {
           console.error('Error from AI:', response.error);
-        } else if (response && response.aiResponse) {
+        } else if (response.aiResponse) {
           insertAIResponse(response.aiResponse);
         } else {
           console.error('Unexpected response from server');
         }
+      };
+      socketa.on('ai_response', onAIResponse);
+      socketa.emit('ask_ai', { selectedText, promptText, requestId }, (ack) => {
+        if (ack && ack.error) {
+          socketa.off('ai_response', onAIResponse);
+          console.error('Error from AI:', ack.error);
+        } else if (ack && ack.aiResponse) {
+          socketa.off('ai_response', onAIResponse);
+          insertAIResponse(ack.aiResponse);
+        }
       });
     } else {
       console.error('Socket connection not available');
@@ -36,6 +36,8 @@ const Walkietalkie = () => {
 
   const [singleChunkTranslation, setSingleChunkTranslation] = useState('');
   const [threeChunkTranslation, setThreeChunkTranslation] = useState('');
+  const [streamedTranscript, setStreamedTranscript] = useState('');
+  const [streamedTranslation, setStreamedTranslation] = useState('');
 
   const [isReferenceRecording, setIsReferenceRecording] = useState(false);
   const [referenceRecordingTime, setReferenceRecordingTime] = useState(0);
@@ -175,6 +177,19 @@ const Walkietalkie = () => {
       setThreeChunkTranscript((prev) => prev + ' ' + data.transcription);
       setThreeChunkTranslation((prev) => prev + ' ' + data.translation);
     });
+
+    // audio_chunk without a chatroom: the server sends the growing transcript to this socket
+    socket.on('user_speaking_to_client_content_transcript', (data) => {
+      if (data.source !== 'server') return;
+      setStreamedTranscript(data.streamingTranscript || '');
+      // This page streams a single target language
+      const translations = Object.values(data.streamingTranslations || {});
+      setStreamedTranslation(translations[0] || '');
+      const segmentTranslation = Object.values(data.segmentTranslations || {})[0];
+      if (isTTSEnabled && segmentTranslation) {
+        speakText(segmentTranslation);
+      }
+    });
     // Initialize SpeechRecognition
     if ('SpeechRecognition' in window || 'webkitSpeechRecognition' in window) {
       const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
@@ -344,6 +359,8 @@ const Walkietalkie = () => {
 
   const startRecording = () => {
     console.log("startRecording function called");
+    setStreamedTranscript('');
+    setStreamedTranslation('');
     navigator.mediaDevices.getUserMedia({ audio: true })
       .then((stream) => {
         console.log("Got user media stream");
@@ -354,6 +371,7 @@ const Walkietalkie = () => {
           checkForInactiveTracks: true,
           timeSlice: timeSlice,
           audioBitsPerSecond: 16000,
+          desiredSampRate: 16000, // 16 kHz WAV slices: small chunks, and the rate the server's VAD expects
           ondataavailable: (blob) => {
             console.log("ondataavailable triggered", blob);
             if (blob && socket) {
@@ -468,7 +486,9 @@ const Walkietalkie = () => {
     singleChunkTranslation: true,
     threeChunk: true,
     translatedThreeChunk: true,
-    threeChunkTranslation: true
+    threeChunkTranslation: true,
+    streamed: true,
+    streamedTranslation: true
   });
 
   const toggleContainer = (containerId) => {
@@ -675,6 +695,7 @@ const Walkietalkie = () => {
           {renderTranscriptContainer(`${t('Browser Transcript')} (${selectedLanguage}) ${t('Google(Free)')}`, browserTranscript, 'browser')}
           {renderTranscriptContainer(t('Single Chunk Transcript OpenAI'), singleChunkTranscript, 'singleChunk')}
           {renderTranscriptContainer(t('Three Chunk Transcript OpenAI'), threeChunkTranscript, 'threeChunk')}
+          {renderTranscriptContainer(t('Streamed Transcript OpenAI'), streamedTranscript, 'streamed')}
         </div>
         <div className="transcript-category">
           <h4>{t('Translations')}</h4>
@@ -687,6 +708,7 @@ const Walkietalkie = () => {
           )}
           {renderTranscriptContainer(t('Translated Three Chunk Google(Free)'), translatedThreeChunkTranscript, 'translatedThreeChunk')}
           {renderTranscriptContainer(t('Three Chunk Translation OpenAI'), threeChunkTranslation, 'threeChunkTranslation')}
+          {renderTranscriptContainer(t('Streamed Translation OpenAI'), streamedTranslation, 'streamedTranslation')}
         </div>
       </div>
 